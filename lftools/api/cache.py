@@ -0,0 +1,221 @@
+# SPDX-License-Identifier: EPL-1.0
+##############################################################################
+# Copyright (c) 2026 The Linux Foundation and others.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+##############################################################################
+"""On-disk cache of REST API responses.
+
+Each cached response is a JSON file named after a hash of the request
+method, URL and authentication identity, so users sharing a cache directory
+never see each other's responses. The name starts with a hash of the URL path
+so that a write can invalidate the cached responses of the resource and of
+the collections listing it. A response younger than its TTL is used
+without any request, an older one is revalidated with its ETag or
+Last-Modified date, and the least recently used responses are evicted once
+the cache exceeds its size, down to EVICT_TARGET of it.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from xdg import XDG_CACHE_HOME
+
+log: logging.Logger = logging.getLogger(__name__)
+
+CACHE_DIRECTORY: str = os.path.join(XDG_CACHE_HOME, "lftools", "http")
+CACHE_MAX_SIZE: int = 100 * 1024 * 1024
+CACHED_HEADERS: tuple = ("Content-Type", "ETag", "Last-Modified")
+# Fraction of max_size the cache is shrunk to when it gets too big, so that
+# a full cache is not scanned again on every store.
+EVICT_TARGET: float = 0.9
+
+
+class ResponseCache(object):
+    """A size bounded, least recently used, on-disk cache of GET responses.
+
+    The size of the cache is kept as a running total, the directory is only
+    scanned on the first store and when the total exceeds max_size. The
+    cache can be bypassed for a whole run by setting
+    ResponseCache.disabled, which the --no-cache option does.
+    """
+
+    disabled: bool = False
+
+    def __init__(self, directory: str = CACHE_DIRECTORY, max_size: int = CACHE_MAX_SIZE) -> None:
+        """Initialize the cache, creating its directory if needed."""
+        self.directory: str = directory
+        self.max_size: int = max_size
+        self._size: Optional[int] = None
+        self._size_lock: threading.Lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def _path_prefix(path: str) -> str:
+        return hashlib.sha256(path.encode("utf-8")).hexdigest()[:16] + "-"
+
+    @staticmethod
+    def _paths(url: str) -> List[str]:
+        """Return the path of url without its query, then the paths of its parents."""
+        parts = urlsplit(url)
+        path: str = "{}://{}{}".format(parts.scheme, parts.netloc, parts.path.rstrip("/"))
+        root: str = "{}://{}".format(parts.scheme, parts.netloc)
+        paths: List[str] = [path]
+        while path != root:
+            path = path.rsplit("/", 1)[0]
+            paths.append(path)
+        return paths
+
+    @classmethod
+    def key(cls, method: str, url: str, identity: str) -> str:
+        """Return the cache key of a request."""
+        digest: str = hashlib.sha256("\0".join([method, url, identity]).encode("utf-8")).hexdigest()
+        return cls._path_prefix(cls._paths(url)[0]) + digest
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cache entry of a key, None if there is none."""
+        path: str = self._path(key)
+        try:
+            with open(path) as f:
+                entry: Dict[str, Any] = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # The modification time orders the entries for eviction.
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry
+
+    def store(self, key: str, resp: requests.Response) -> None:
+        """Store a response, then evict old entries if the cache is too big."""
+        entry: Dict[str, Any] = {
+            "url": resp.url,
+            "stored": time.time(),
+            "headers": {name: resp.headers[name] for name in CACHED_HEADERS if name in resp.headers},
+            "text": resp.text,
+        }
+        path: str = self._path(key)
+        try:
+            replaced: int = os.path.getsize(path)
+        except OSError:
+            replaced = 0
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(entry, f)
+            os.replace(tmp, path)
+            stored: int = os.path.getsize(path)
+        except OSError as e:
+            log.debug("Could not cache {}: {}".format(resp.url, e))
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return
+        with self._size_lock:
+            if self._size is not None:
+                self._size += stored - replaced
+            full: bool = self._size is None or self._size > self.max_size
+        if full:
+            self.evict()
+
+    def refresh(self, key: str, entry: Dict[str, Any]) -> None:
+        """Restart the TTL of an entry the server confirmed is still valid."""
+        entry["stored"] = time.time()
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(entry, f)
+            os.replace(tmp, self._path(key))
+        except OSError as e:
+            log.debug("Could not refresh {}: {}".format(entry["url"], e))
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def delete(self, key: str) -> None:
+        """Remove the entry of a key, if any."""
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def invalidate(self, url: str) -> None:
+        """Remove the entries of url and of its parent collections, whatever their query and user.
+
+        A write to projects/foo/versions/1.0 thus drops the cached
+        projects/foo/versions/?active=True listing as well.
+        """
+        prefixes = tuple(self._path_prefix(path) for path in self._paths(url))
+        try:
+            names: List[str] = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            if name.startswith(prefixes):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def evict(self) -> None:
+        """Remove the least recently used entries if the cache exceeds max_size.
+
+        The cache is then shrunk to EVICT_TARGET of max_size.
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        size: int = sum(entry[1] for entry in entries)
+        if size > self.max_size:
+            for _, entry_size, name in sorted(entries):
+                if size <= self.max_size * EVICT_TARGET:
+                    break
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+                size -= entry_size
+        with self._size_lock:
+            self._size = size
+
+    @staticmethod
+    def to_response(entry: Dict[str, Any]) -> requests.Response:
+        """Rebuild the response of a cache entry."""
+        resp: requests.Response = requests.Response()
+        resp.status_code = 200
+        resp.url = entry["url"]
+        resp.headers = CaseInsensitiveDict(entry["headers"])
+        resp.encoding = "utf-8"
+        resp._content = entry["text"].encode("utf-8")
+        return resp
+
+    @staticmethod
+    def validators(entry: Dict[str, Any]) -> Dict[str, str]:
+        """Return the conditional request headers revalidating an entry."""
+        headers: Dict[str, str] = {}
+        if "ETag" in entry["headers"]:
+            headers["If-None-Match"] = entry["headers"]["ETag"]
+        if "Last-Modified" in entry["headers"]:
+            headers["If-Modified-Since"] = entry["headers"]["Last-Modified"]
+        return headers
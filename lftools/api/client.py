@@ -10,14 +10,101 @@
 """REST API interface using Requests."""
 from __future__ import annotations
 
+import concurrent.futures
+import fnmatch
+import hashlib
+import itertools
 import json
-from typing import Any, Dict, Optional, Tuple
+import random
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlencode
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from lftools import config
+from lftools.api.cache import CACHE_DIRECTORY, CACHE_MAX_SIZE, ResponseCache
+
+DEFAULT_TIMEOUT: float = 30
+DEFAULT_RETRIES: int = 3
+DEFAULT_BACKOFF_FACTOR: float = 0.5
+DEFAULT_POOL_SIZE: int = 10
+DEFAULT_CACHE_TTL: float = 60
+RETRY_METHODS: frozenset = frozenset(["DELETE", "GET", "HEAD", "OPTIONS", "PUT"])
+RETRY_STATUSES: Tuple[int, ...] = (429, 500, 502, 503, 504)
+# Gerrit prefixes its JSON responses with this to prevent XSSI attacks.
+XSSI_PREFIX: bytes = b")]}'"
+
+
+def decode_json(content: bytes) -> Any:
+    """Decode a JSON document, removing the XSSI prefix it may start with.
+
+    The bytes are parsed as is, without decoding them to a string first, by
+    orjson if it is installed (pip install lftools[speedups]), otherwise by
+    the json module. Raise ValueError if the document is not valid JSON.
+    """
+    if content.startswith(XSSI_PREFIX):
+        content = content[len(XSSI_PREFIX) :]
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+class JitteredRetry(Retry):
+    """A urllib3 Retry adding a random delay of up to jitter seconds to each backoff.
+
+    Spreads the retries of concurrent clients hitting the same overloaded
+    server. A Retry-After header sent by the server takes precedence over the
+    backoff.
+    """
+
+    def __init__(self, *args: Any, jitter: float = 0, **kwargs: Any) -> None:
+        """Initialize the retry policy."""
+        super().__init__(*args, **kwargs)
+        self.jitter: float = jitter
+
+    def new(self, **kwargs: Any) -> "JitteredRetry":
+        """Return a copy of the policy, keeping the jitter."""
+        kwargs.setdefault("jitter", self.jitter)
+        return super().new(**kwargs)
+
+    def get_backoff_time(self) -> float:
+        """Return the backoff time of the next retry, with jitter."""
+        backoff: float = super().get_backoff_time()
+        if backoff and self.jitter:
+            backoff = min(self.DEFAULT_BACKOFF_MAX, backoff + random.uniform(0, self.jitter))
+        return backoff
 
 
 class RestApi(object):
-    """A generic REST API interface."""
+    """A generic REST API interface.
+
+    Besides creds, the transport policy can be tuned with these keyword
+    arguments, which endpoint classes pass through:
+
+    :arg timeout: Default timeout in seconds of a request, or a (connect,
+        read) tuple. Can be overridden per request.
+    :arg retries: Number of retries of idempotent requests (GET, PUT, DELETE,
+        HEAD, OPTIONS) failing to connect or answered with 429 or 5xx. 0
+        disables retries.
+    :arg backoff_factor: Exponential backoff between retries, in seconds.
+    :arg pool_size: Number of connections kept open per host.
+    :arg cache: True to cache GET responses on disk, or a ResponseCache.
+        Defaults to the "enabled" option of the [cache] section of
+        lftools.ini, which also accepts "directory" and "max_size" in MiB.
+    :arg cache_ttl: Seconds a cached response is used without revalidating
+        it, for URLs which CACHE_TTLS does not match.
+    """
+
+    # (URL pattern, TTL in seconds) of cached responses, the first match wins.
+    CACHE_TTLS: Tuple[Tuple[str, float], ...] = ()
 
     def __init__(self, **kwargs: Dict[str, str]) -> None:
         """Initialize the REST API class."""
@@ -26,8 +113,11 @@ class RestApi(object):
         if kwargs["creds"]:
             self.creds: Dict[str, str] = kwargs["creds"]
 
-        if "timeout" not in self.params:
-            self.timeout: Optional[int] = None
+        self.timeout: Any = self.params.get("timeout", DEFAULT_TIMEOUT)
+        self.retry: Retry = self.make_retry(
+            int(self.params.get("retries", DEFAULT_RETRIES)),
+            float(self.params.get("backoff_factor", DEFAULT_BACKOFF_FACTOR)),
+        )
 
         self.endpoint: str = self.creds["endpoint"]
 
@@ -44,25 +134,118 @@ class RestApi(object):
             self.r.headers.update({"Authorization": f"Token {self.token}"})
             self.r.headers.update({"Content-Type": "application/json"})
 
+        self.set_pool_size(int(self.params.get("pool_size", DEFAULT_POOL_SIZE)))
+        self.cache: Optional[ResponseCache] = self._make_cache(self.params.get("cache"))
+
+    @staticmethod
+    def _make_cache(cache: Any) -> Optional[ResponseCache]:
+        """Return the response cache to use, None to not cache."""
+        if isinstance(cache, ResponseCache):
+            return cache
+        settings = config.get_config()
+        if cache is None:
+            cache = settings.getboolean("cache", "enabled", fallback=False)
+        if not cache:
+            return None
+        return ResponseCache(
+            settings.get("cache", "directory", fallback=CACHE_DIRECTORY),
+            int(settings.getfloat("cache", "max_size", fallback=CACHE_MAX_SIZE / 1024 / 1024) * 1024 * 1024),
+        )
+
+    def cache_ttl(self, url: str) -> float:
+        """Return the number of seconds a cached response of url is fresh."""
+        for pattern, ttl in self.CACHE_TTLS:
+            if fnmatch.fnmatch(url, pattern):
+                return ttl
+        return float(self.params.get("cache_ttl", DEFAULT_CACHE_TTL))
+
+    def _identity(self) -> str:
+        """Return who the requests are sent as, so users never share cached responses."""
+        if self.r.auth:
+            return "basic:{}".format(self.r.auth[0])
+        authorization: str = self.r.headers.get("Authorization", "")
+        return "header:" + hashlib.sha256(authorization.encode("utf-8")).hexdigest()
+
+    def _send(self, method: str, url: str, data: Optional[Any], timeout: Optional[Any]) -> requests.Response:
+        """Send a request, through the response cache when there is one.
+
+        A fresh cached GET response is returned without any request, a stale
+        one is revalidated with a conditional request. Other methods
+        invalidate the cached responses of their URL and of the collections
+        above it, so a listing never outlives a write to one of its items.
+        """
+        if self.cache is None or ResponseCache.disabled:
+            return self.r.request(method, self.endpoint + url, data=data, timeout=timeout)
+
+        if method != "GET":
+            resp: requests.Response = self.r.request(method, self.endpoint + url, data=data, timeout=timeout)
+            self.cache.invalidate(self.endpoint + url)
+            return resp
+
+        key: str = ResponseCache.key("GET", self.endpoint + url, self._identity())
+
+        entry: Optional[Dict[str, Any]] = self.cache.get(key)
+        if entry is not None and time.time() - entry["stored"] < self.cache_ttl(url):
+            return ResponseCache.to_response(entry)
+        headers: Dict[str, str] = ResponseCache.validators(entry) if entry is not None else {}
+        resp = self.r.request(method, self.endpoint + url, data=data, timeout=timeout, headers=headers)
+        if resp.status_code == 304 and entry is not None:
+            self.cache.refresh(key, entry)
+            return ResponseCache.to_response(entry)
+        if resp.status_code == 200:
+            self.cache.store(key, resp)
+        return resp
+
+    @staticmethod
+    def make_retry(retries: int, backoff_factor: float) -> Retry:
+        """Return the retry policy of idempotent requests.
+
+        Non idempotent requests (POST, PATCH) are only retried when the
+        connection could not be established, as they never reached the server.
+        """
+        return JitteredRetry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            jitter=backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=RETRY_METHODS,
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+
+    def set_pool_size(self, pool_size: int) -> None:
+        """Keep up to pool_size connections open, for as many concurrent requests.
+
+        The pool only grows, a smaller pool_size than the current one keeps
+        the current adapter and its open connections.
+        """
+        if pool_size <= getattr(self, "pool_size", 0):
+            return
+        self.pool_size: int = pool_size
+        adapter: HTTPAdapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=self.retry)
+        self.r.mount("https://", adapter)
+        self.r.mount("http://", adapter)
+
     def _request(
-        self, url: str, method: str, data: Optional[Any] = None, timeout: int = 30
+        self, url: str, method: str, data: Optional[Any] = None, timeout: Optional[Any] = None
     ) -> requests.Response | Tuple[requests.Response, Optional[Dict[str, Any] | str]]:
         """Execute the request."""
+        if timeout is None:
+            timeout = self.timeout
         # Encode string data as UTF-8 to handle Unicode characters
         if isinstance(data, str):
             data = data.encode("utf-8")
 
-        resp: requests.Response = self.r.request(method, self.endpoint + url, data=data, timeout=timeout)
+        resp: requests.Response = self._send(method, url, data, timeout)
 
         # Some massaging to make our gerrit python code work
         if resp.status_code == 409:
             return resp
 
-        if resp.text:
+        if resp.content:
             try:
-                if "application/json" in resp.headers["Content-Type"]:
-                    remove_xssi_magic: str = resp.text.replace(")]}'", "")
-                    body: Optional[Dict[str, Any] | str] = json.loads(remove_xssi_magic)
+                if "application/json" in resp.headers.get("Content-Type", ""):
+                    body: Optional[Dict[str, Any] | str] = decode_json(resp.content)
                 else:
                     body = resp.text
             except ValueError:
@@ -77,6 +260,137 @@ class RestApi(object):
         """HTTP GET request."""
         return self._request(url, "GET", **kwargs)
 
+    def get_json(self, url: str, params: Optional[Dict[str, Any]] = None) -> Any:
+        """HTTP GET request returning the decoded JSON body.
+
+        Raise requests.HTTPError if the request fails or does not return JSON.
+        """
+        if params:
+            url = "{}{}{}".format(url, "&" if "?" in url else "?", urlencode(params))
+        result = self.get(url)
+        response: requests.Response = result[0] if isinstance(result, tuple) else result
+        if not response.ok or not isinstance(result, tuple) or not isinstance(result[1], (dict, list)):
+            raise requests.HTTPError("{} returned {}".format(response.url, response.status_code), response=response)
+        return result[1]
+
+    def paginate_offset(
+        self,
+        url: str,
+        page_size: int,
+        items: Callable[[Any], List[Any]] = lambda page: page,
+        more: Optional[Callable[[Any], bool]] = None,
+        total: Optional[Callable[[Any], int]] = None,
+        offset_param: str = "offset",
+        limit_param: str = "limit",
+        workers: int = 4,
+    ) -> Iterator[Any]:
+        """Yield the items of a listing paged with an offset and a limit.
+
+        :arg url: The listing URL, may already have query parameters.
+        :arg page_size: Number of items requested per page.
+        :arg items: Function returning the items of a page, defaults to the
+            page itself.
+        :arg more: Function telling if a page is followed by another. Defaults
+            to a page being full.
+        :arg total: Function returning the total number of items, from the
+            first page. When the total is known, the following pages are
+            fetched workers at a time, and yielded in order.
+        :arg offset_param: Query parameter of the offset, eg S for Gerrit.
+        :arg limit_param: Query parameter of the page size, eg n for Gerrit.
+        """
+
+        def get_page(offset: int) -> Any:
+            return self.get_json(url, {limit_param: page_size, offset_param: offset})
+
+        page: Any = get_page(0)
+        yield from items(page)
+
+        if total is not None:
+            offsets: Iterator[int] = iter(range(page_size, total(page), page_size))
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                # Keep a few pages ahead of the caller, not the whole listing.
+                pending: List[concurrent.futures.Future] = [
+                    executor.submit(get_page, offset) for offset in itertools.islice(offsets, 2 * workers)
+                ]
+                while pending:
+                    page = pending.pop(0).result()
+                    for offset in itertools.islice(offsets, 1):
+                        pending.append(executor.submit(get_page, offset))
+                    yield from items(page)
+            return
+
+        offset: int = 0
+        while True:
+            page_items: List[Any] = items(page)
+            if not page_items or not (more(page) if more is not None else len(page_items) == page_size):
+                return
+            offset += len(page_items)
+            page = get_page(offset)
+            yield from items(page)
+
+    def paginate_next(
+        self,
+        url: str,
+        items: Callable[[Any], List[Any]] = lambda page: page["results"],
+        next_url: Callable[[Any], Optional[str]] = lambda page: page.get("next"),
+    ) -> Iterator[Any]:
+        """Yield the items of a listing whose pages link to the next one.
+
+        :arg url: The URL of the first page.
+        :arg items: Function returning the items of a page, defaults to its
+            "results".
+        :arg next_url: Function returning the absolute URL of the next page,
+            None on the last one, defaults to its "next".
+        """
+        while url is not None:
+            page: Any = self.get_json(url)
+            yield from items(page)
+            url = next_url(page)
+            if url is not None:
+                if not url.startswith(self.endpoint):
+                    raise ValueError("Next page {} is outside of {}".format(url, self.endpoint))
+                url = url[len(self.endpoint) :]
+
+    def paginate_token(
+        self,
+        url: str,
+        params: Optional[Dict[str, Any]] = None,
+        items_key: str = "items",
+        token_key: str = "continuationToken",
+        token_param: str = "continuationToken",
+        prefetch: bool = True,
+    ) -> Iterator[Any]:
+        """Yield the items of a listing whose pages return a token for the next one.
+
+        :arg url: The listing URL.
+        :arg params: Query parameters of every page.
+        :arg items_key: Key of the items in a page.
+        :arg token_key: Key of the token in a page, null on the last page.
+        :arg token_param: Query parameter passing the token back.
+        :arg prefetch: Download the next page while the caller processes the
+            current one.
+        """
+        params = params or {}
+
+        def get_page(token: Optional[str]) -> Tuple[List[Any], Optional[str]]:
+            page: Dict[str, Any] = self.get_json(url, dict(params, **{token_param: token}) if token else params)
+            return page[items_key], page.get(token_key)
+
+        if not prefetch:
+            page_items, token = get_page(None)
+            yield from page_items
+            while token:
+                page_items, token = get_page(token)
+                yield from page_items
+            return
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            next_page: Optional[concurrent.futures.Future] = executor.submit(get_page, None)
+            while next_page is not None:
+                page_items, token = next_page.result()
+                next_page = executor.submit(get_page, token) if token else None
+                yield from page_items
+
     def patch(self, url: str, **kwargs) -> requests.Response | Tuple[requests.Response, Optional[Dict[str, Any] | str]]:
         """HTTP PATCH request."""
         return self._request(url, "PATCH", **kwargs)
@@ -10,17 +10,32 @@
 
 """Gerrit REST API interface."""
 
+import concurrent.futures
+import itertools
 import json
 import logging
 import os
 import time
 import urllib
 
+import requests
+
 import lftools.api.client as client
 from lftools import config
 
 log = logging.getLogger(__name__)
 
+QUERY_PAGE_SIZE = 500
+CHANGE_ACTIONS = {
+    "abandon": "changes/{}/abandon",
+    "submit": "changes/{}/submit",
+    "vote": "changes/{}/revisions/current/review",
+}
+PAST_TENSE = {"abandon": "Abandoned", "submit": "Submitted", "vote": "Voted on"}
+# Number of projects whose access rights are fetched in one request.
+ACCESS_BATCH_SIZE = 25
+ACCESS_COLUMNS = ["project", "inherited_from", "ref", "permission", "group", "action", "min", "max", "force"]
+
 
 class Gerrit(client.RestApi):
     """API endpoint wrapper for Gerrit.
@@ -29,6 +44,8 @@ class Gerrit(client.RestApi):
     new methods.
     """
 
+    CACHE_TTLS = (("access/*", 600), ("projects/*/access", 600))
+
     def __init__(self, **params):
         """Initialize the class."""
         self.params = params
@@ -43,6 +60,7 @@ class Gerrit(client.RestApi):
             params["creds"] = creds
 
         super(Gerrit, self).__init__(**params)
+        self._access = {}
 
     def add_file(self, fqdn, gerrit_project, filename, issue_id, file_location, **kwargs):
         """Add a file for review to a Project.
@@ -207,21 +225,92 @@ class Gerrit(client.RestApi):
         return result
 
     def abandon_changes(self, fqdn, gerrit_project, **kwargs):
-        """."""
-        gerrit_project_encoded = urllib.parse.quote(gerrit_project, safe="", encoding=None, errors=None)
-        access_str = "changes/?q=project:{}".format(gerrit_project_encoded)
-        log.info(access_str)
-        headers = {"Content-Type": "application/json; charset=UTF-8"}
-        self.r.headers.update(headers)
-        result = self.get(access_str)[1]
-        payload = {"message": "Abandoned by automation"}
-        for id in result:
-            if (id["status"]) == "NEW":
-                id = id["id"]
-                access_str = "changes/{}/abandon".format(id)
-                log.info(access_str)
-                result = self.post(access_str, data=payload)[1]
-                return result
+        """Abandon all the open changes of a project, and return the results."""
+        query = 'project:"{}" status:open'.format(gerrit_project)
+        return self.bulk_change_action("abandon", self.query_changes(query), {"message": "Abandoned by automation"})
+
+    def query_changes(self, query, options=(), limit=None):
+        """Yield the changes matching a query, following all the result pages.
+
+        GET /changes/?q={query}&o={option}&n={page size}&S={offset}
+
+        :param query: a Gerrit search query, eg "project:foo status:open".
+        :param options: o= options adding fields to every change in the same
+            request, eg CURRENT_REVISION or LABELS.
+        :param limit: stop after this number of changes.
+        """
+        url = "changes/?" + urllib.parse.urlencode([("q", query)] + [("o", option) for option in options])
+        changes = self.paginate_offset(
+            url,
+            QUERY_PAGE_SIZE if limit is None else min(limit, QUERY_PAGE_SIZE),
+            more=lambda page: bool(page) and page[-1].get("_more_changes", False),
+            offset_param="S",
+            limit_param="n",
+        )
+        return itertools.islice(changes, limit)
+
+    def change_action(self, action, change_id, payload=None):
+        """Abandon, submit or vote on a change, raise requests.HTTPError on failure.
+
+        POST /changes/{change-id}/abandon
+        POST /changes/{change-id}/submit
+        POST /changes/{change-id}/revisions/current/review
+
+        :param action: one of CHANGE_ACTIONS.
+        :param payload: the request body, eg {"labels": {"Code-Review": 2}} to vote.
+        """
+        result = self.post(CHANGE_ACTIONS[action].format(change_id), data=json.dumps(payload or {}))
+        return self._checked(result)
+
+    @staticmethod
+    def _checked(result, allowed=()):
+        """Return the body of a result, raise requests.HTTPError if it failed.
+
+        :param allowed: the error status codes which are not failures.
+        """
+        response = result[0] if isinstance(result, tuple) else result
+        if not response.ok and response.status_code not in allowed:
+            raise requests.HTTPError(
+                "{} {}: {}".format(response.status_code, response.reason, response.text.strip()), response=response
+            )
+        return result[1] if isinstance(result, tuple) else None
+
+    def bulk_change_action(self, action, changes, payload=None, workers=8):
+        """Run the same action on many changes concurrently.
+
+        :param action: one of CHANGE_ACTIONS.
+        :param changes: the changes, as returned by query_changes().
+        :param payload: the request body of every action.
+        :param workers: number of changes updated in parallel.
+        :return: a list of dicts with the change number, project, subject, ok
+            and message of every change, in the order of the changes.
+        """
+        changes = list(changes)
+        results = [
+            {
+                "change": change["_number"],
+                "project": change["project"],
+                "subject": change["subject"],
+                "ok": True,
+                "message": "",
+            }
+            for change in changes
+        ]
+        self.set_pool_size(workers)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(self.change_action, action, change["id"], payload): index
+                for index, change in enumerate(changes)
+            }
+            for future in concurrent.futures.as_completed(futures):
+                result = results[futures[future]]
+                try:
+                    future.result()
+                    log.info("{} change {} ({})".format(PAST_TENSE[action], result["change"], result["project"]))
+                except requests.RequestException as e:
+                    result.update(ok=False, message=str(e))
+                    log.error("Could not {} change {}: {}".format(action, result["change"], e))
+        return results
 
     def create_change(self, filename, gerrit_project, issue_id, signed_off_by, **kwargs):
         """Method to create a gerrit change."""
@@ -321,7 +410,10 @@ class Gerrit(client.RestApi):
             log.info(result)
 
     def create_saml_group(self, fqdn, ldap_group, **kwargs):
-        """Create saml group from ldap group."""
+        """Create saml group from ldap group.
+
+        An existing group is kept. Raise requests.HTTPError on failure.
+        """
         ###############################################################
         payload = json.dumps({"visible_to_all": "false"})
         saml_group = "saml/{}".format(ldap_group)
@@ -329,10 +421,15 @@ class Gerrit(client.RestApi):
         access_str = "groups/{}".format(saml_group_encoded)
         log.info("Encoded SAML group name: {}".format(saml_group_encoded))
         result = self.put(access_str, data=payload)
+        self._checked(result, allowed=(409,))
         return result
 
     def add_github_rights(self, fqdn, gerrit_project, **kwargs):
-        """Grant github read to a project."""
+        """Grant github read to a project.
+
+        Raise LookupError if there is no GitHub Replication group, and
+        requests.HTTPError on failure.
+        """
         ###############################################################
         # Github Rights
 
@@ -340,30 +437,27 @@ class Gerrit(client.RestApi):
         # GET /groups/?m=test%2F HTTP/1.0
         access_str = "groups/?m=GitHub%20Replication"
         log.info(access_str)
-        result = self.get(access_str)[1]
+        result = self._checked(self.get(access_str))
         time.sleep(5)
-        githubid = result["GitHub Replication"]["id"]
+        githubid = (result or {}).get("GitHub Replication", {}).get("id")
+        if not githubid:
+            raise LookupError("No GitHub Replication group found")
         log.info(githubid)
 
         # POST /projects/MyProject/access HTTP/1.0
-        if githubid:
-            payload = json.dumps(
-                {
-                    "add": {
-                        "refs/*": {
-                            "permissions": {
-                                "read": {"rules": {"{}".format(githubid): {"action": "{}".format("ALLOW")}}}
-                            }
-                        }
+        payload = json.dumps(
+            {
+                "add": {
+                    "refs/*": {
+                        "permissions": {"read": {"rules": {"{}".format(githubid): {"action": "{}".format("ALLOW")}}}}
                     }
                 }
-            )
-            access_str = "projects/{}/access".format(gerrit_project_encoded)
-            result = self.post(access_str, data=payload)[1]
-            pretty = json.dumps(result, indent=4, sort_keys=True)
-            log.info(pretty)
-        else:
-            log.info("Error no githubid found")
+            }
+        )
+        access_str = "projects/{}/access".format(gerrit_project_encoded)
+        result = self._checked(self.post(access_str, data=payload))
+        pretty = json.dumps(result, indent=4, sort_keys=True)
+        log.info(pretty)
 
     def create_project(self, fqdn, gerrit_project, ldap_group, description, check):
         """Create a project via the gerrit API.
@@ -378,7 +472,11 @@ class Gerrit(client.RestApi):
         ldap_group oran-gerrit-test-test1-committers
         --description="This is a demo project"
 
+        With check, only check that the project does not exist yet, and
+        return None. Raise ValueError if the project already exists, and
+        requests.HTTPError on failure.
         """
+        name = gerrit_project
         gerrit_project = urllib.parse.quote(gerrit_project, safe="", encoding=None, errors=None)
 
         access_str = "projects/?query=name:{}".format(gerrit_project)
@@ -388,16 +486,18 @@ class Gerrit(client.RestApi):
         try:
             resultsDict = json.loads(jsonText)
         except json.decoder.JSONDecodeError:
-            log.info(result)
-            log.info("A problem was encountered while querying the Gerrit API.")
             log.debug(result.text)
-            exit(result.status_code)
+            raise requests.HTTPError(
+                "{} {}: A problem was encountered while querying the Gerrit API.".format(
+                    result.status_code, result.reason
+                ),
+                response=result,
+            )
 
         if resultsDict:
-            log.info("Project already exists")
-            exit(1)
+            raise ValueError("Project {} already exists".format(name))
         if check:
-            exit(0)
+            return None
 
         saml_group = "saml/{}".format(ldap_group)
         log.info("SAML group name: {}".format(saml_group))
@@ -414,6 +514,7 @@ class Gerrit(client.RestApi):
 
         log.info(payload)
         result = self.put(access_str, data=payload)
+        self._checked(result)
         return result
 
     def list_project_permissions(self, project):
@@ -425,6 +526,132 @@ class Gerrit(client.RestApi):
                 group_list.append(kk.replace("ldap:cn=", "").replace(",ou=Groups,dc=freestandards,dc=org", ""))
         return group_list
 
+    def list_projects(self, prefix=None):
+        """Return the sorted names of all the projects, or of those starting with prefix.
+
+        GET /projects/?type=ALL&p={prefix}
+        """
+        params = {"type": "ALL"}
+        if prefix:
+            params["p"] = prefix
+        return sorted(self.get_json("projects/", params))
+
+    def _fetch_access(self, projects):
+        """Fetch the access rights of a batch of projects in one request."""
+        return self.get_json("access/?" + urllib.parse.urlencode([("project", project) for project in projects]))
+
+    def _fetch_access_batch(self, projects):
+        """Fetch the access rights of a batch of projects, skipping the unknown ones.
+
+        Gerrit answers 404 to the whole batch when one of its projects does
+        not exist, or is not visible, so the projects are then fetched one by
+        one.
+        """
+        try:
+            return self._fetch_access(projects)
+        except requests.HTTPError as e:
+            if e.response is None or e.response.status_code != 404:
+                raise
+            if len(projects) == 1:
+                log.warning("Project {} not found".format(projects[0]))
+                return {}
+        access = {}
+        for project in projects:
+            access.update(self._fetch_access_batch([project]))
+        return access
+
+    def get_access(self, projects, workers=8):
+        """Return the access rights of projects, by project name.
+
+        GET /access/?project={project}&project=...
+
+        Projects are fetched ACCESS_BATCH_SIZE at a time, workers batches in
+        parallel, and kept in a cache, so a project is only fetched once per
+        Gerrit object. Unknown projects are left out of the result.
+        """
+        missing = [project for project in dict.fromkeys(projects) if project not in self._access]
+        batches = [missing[i : i + ACCESS_BATCH_SIZE] for i in range(0, len(missing), ACCESS_BATCH_SIZE)]
+        if batches:
+            self.set_pool_size(workers)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                for access in executor.map(self._fetch_access_batch, batches):
+                    self._access.update(access)
+        return {project: self._access[project] for project in projects if project in self._access}
+
+    @staticmethod
+    def _parent(access):
+        """Return the name of the project access rights are inherited from, None for the root."""
+        inherits_from = access.get("inherits_from")
+        if not inherits_from:
+            return None
+        return inherits_from.get("name") or urllib.parse.unquote(inherits_from["id"])
+
+    def inheritance_chain(self, project):
+        """Return the project and its ancestors, from the project up to the root.
+
+        The access rights of the project and its ancestors must be cached
+        already, see audit_access(). Raise LookupError if the project is not.
+        """
+        if project not in self._access:
+            raise LookupError("Unknown project: {}".format(project))
+        chain = [project]
+        parent = self._parent(self._access[project])
+        while parent is not None and parent not in chain:
+            chain.append(parent)
+            parent = self._parent(self._access.get(parent, {}))
+        return chain
+
+    def audit_access(self, projects, workers=8):
+        """Return the effective access rules of projects, as a flat list.
+
+        The access rights of all the projects are fetched concurrently, then
+        their ancestors, a generation at a time, each ancestor only once.
+        Every rule a project gets, locally or inherited, is a dict with the
+        ACCESS_COLUMNS keys. Inherited rules are dropped when a closer
+        project marks the permission exclusive on the same ref, unless they
+        are BLOCK rules, which cannot be overridden. Unknown projects are
+        skipped.
+        """
+        pending = list(projects)
+        while pending:
+            access = self.get_access(pending, workers)
+            pending = [
+                parent
+                for parent in {self._parent(info) for info in access.values()}
+                if parent is not None and parent not in self._access
+            ]
+
+        rows = []
+        for project in projects:
+            if project not in self._access:
+                continue
+            exclusive = set()
+            for source in self.inheritance_chain(project):
+                access = self._access.get(source, {})
+                groups = access.get("groups", {})
+                for ref, section in sorted(access.get("local", {}).items()):
+                    for permission, rules in sorted(section.get("permissions", {}).items()):
+                        overridden = (ref, permission) in exclusive
+                        for group, rule in sorted(rules.get("rules", {}).items()):
+                            if overridden and rule.get("action") != "BLOCK":
+                                continue
+                            rows.append(
+                                {
+                                    "project": project,
+                                    "inherited_from": "" if source == project else source,
+                                    "ref": ref,
+                                    "permission": permission,
+                                    "group": groups.get(group, {}).get("name", group),
+                                    "action": rule.get("action", "ALLOW"),
+                                    "min": rule.get("min", ""),
+                                    "max": rule.get("max", ""),
+                                    "force": rule.get("force", False),
+                                }
+                            )
+                        if rules.get("exclusive"):
+                            exclusive.add((ref, permission))
+        return rows
+
     def list_project_inherits_from(self, gerrit_project):
         """List who a project inherits from."""
         gerrit_project = urllib.parse.quote(gerrit_project, safe="", encoding=None, errors=None)
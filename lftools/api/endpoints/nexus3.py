@@ -12,18 +12,93 @@
 
 __author__ = "DW Talton"
 
+import collections
+import concurrent.futures
+import datetime
 import json
 import logging
+import posixpath
+
+import requests
 
 import lftools.api.client as client
 from lftools import config, helpers
+from lftools.nexus import retention
 
 log = logging.getLogger(__name__)
 
+# Age buckets of the repository usage report, as (max age in days, label).
+USAGE_AGE_BUCKETS = [
+    (7, "< 7 days"),
+    (30, "7 to 30 days"),
+    (90, "30 to 90 days"),
+    (365, "90 days to 1 year"),
+    (None, "> 1 year"),
+]
+
+
+# Bulk import of each kind of object: listing, creation and update endpoints,
+# the field naming an object, and the defaults of new objects.
+IMPORT_KINDS = {
+    "role": {
+        "list": "beta/security/roles",
+        "create": "beta/security/roles",
+        "update": "beta/security/roles/{}",
+        "key": "id",
+        "defaults": {"description": "", "privileges": [], "roles": []},
+    },
+    "tag": {
+        "list": "v1/tags",
+        "create": "v1/tags",
+        "update": "v1/tags/{}",
+        "key": "name",
+        "defaults": {"attributes": {}},
+        "paginated": True,
+    },
+    "user": {
+        "list": "beta/security/users",
+        "create": "beta/security/users",
+        "update": "beta/security/users/{}",
+        "key": "userId",
+        "defaults": {"status": "active", "roles": []},
+    },
+}
+
+
+def _differs(current, desired):
+    """Return True if a field of the desired object differs from the current one.
+
+    Only the fields of the desired object are compared, lists regardless of
+    their order, and passwords never.
+    """
+    for field, value in desired.items():
+        if field == "password":
+            continue
+        current_value = current.get(field)
+        if isinstance(value, list) and isinstance(current_value, list):
+            if sorted(map(str, value)) != sorted(map(str, current_value)):
+                return True
+        elif value != current_value:
+            return True
+    return False
+
+
+def _age_bucket(last_modified, now):
+    """Return the label of the USAGE_AGE_BUCKETS an asset lastModified date falls in."""
+    last_modified = retention.parse_last_modified(last_modified)
+    if last_modified is None:
+        return "unknown"
+    age = now - last_modified
+    for days, label in USAGE_AGE_BUCKETS:
+        if days is None or age < datetime.timedelta(days=days):
+            return label
+
 
 class Nexus3(client.RestApi):
     """API endpoint wrapper for Nexus3."""
 
+    CACHE_TTLS = (("v1/repositories", 3600), ("beta/security/roles", 600))
+
     def __init__(self, **params):
         """Initialize the class."""
         self.params = params
@@ -39,6 +114,118 @@ class Nexus3(client.RestApi):
 
         super(Nexus3, self).__init__(**params)
 
+    def _paginate(self, url, prefetch=True, **params):
+        """Yield the items of every page of a listing endpoint.
+
+        Nexus3 listings return their items a page at a time, with a
+        continuationToken to pass back for the next page. With prefetch, the
+        next page is downloaded while the caller processes the current one.
+
+        :param url: the listing endpoint, eg v1/assets
+        :param prefetch: download the next page in the background
+        :param params: query parameters, eg repository="maven.releases"
+        """
+        return self.paginate_token(url, params, prefetch=prefetch)
+
+    def _save_object(self, kind, action, obj):
+        """Create or update an object, raise requests.HTTPError on failure."""
+        spec = IMPORT_KINDS[kind]
+        if action == "create":
+            result = self.post(spec["create"], data=json.dumps(obj))
+        else:
+            result = self.put(spec["update"].format(obj[spec["key"]]), data=json.dumps(obj))
+        response = result[0] if isinstance(result, tuple) else result
+        if not response.ok:
+            raise requests.HTTPError(
+                "{} {}".format(response.status_code, response.text or response.reason), response=response
+            )
+
+    def import_objects(self, kind, objects, workers=8):
+        """Create or update users, roles or tags in bulk.
+
+        The existing objects of that kind are downloaded once, and only the
+        objects which are missing or have a field which differs are created or
+        updated, by up to workers concurrent requests. New users without a
+        password get a generated one. A role including another role of the
+        import is created after it.
+
+        :param kind: user, role or tag, see IMPORT_KINDS
+        :param objects: list of dicts, with the fields of the Nexus3 API
+        :param workers: number of concurrent requests
+        :return: the result of each object, in order: dicts with its name,
+            the action taken (create, update or none), ok and a message. An
+            object which is malformed or fails does not stop the others.
+        """
+        spec = IMPORT_KINDS[kind]
+        if spec.get("paginated"):
+            existing = list(self._paginate(spec["list"]))
+        else:
+            existing = self.get(spec["list"])[1]
+        existing = {obj[spec["key"]]: obj for obj in existing}
+
+        results = [None] * len(objects)
+        changes = []
+        for index, obj in enumerate(objects):
+            name = obj.get(spec["key"]) if isinstance(obj, dict) else None
+            if not name:
+                results[index] = {"name": "", "action": "none", "ok": False, "message": "No {}".format(spec["key"])}
+                continue
+            try:
+                for field, default in spec["defaults"].items():
+                    if isinstance(default, list) and not isinstance(obj.get(field, []), list):
+                        raise ValueError("{} must be a list".format(field))
+                current = existing.get(name)
+                if current is None:
+                    obj = dict(spec["defaults"], **obj)
+                    if kind == "role":
+                        obj.setdefault("name", name)
+                    message = "Created"
+                    if kind == "user" and not obj.get("password"):
+                        obj["password"] = helpers.generate_password()
+                        message = "Created with password {}".format(obj["password"])
+                    changes.append((index, "create", obj, message))
+                elif _differs(current, obj):
+                    changes.append(
+                        (index, "update", dict(current, **{k: v for k, v in obj.items() if k != "password"}), "Updated")
+                    )
+                else:
+                    results[index] = {"name": name, "action": "none", "ok": True, "message": "Up to date"}
+            except (KeyError, TypeError, ValueError) as e:
+                results[index] = {
+                    "name": name,
+                    "action": "none",
+                    "ok": False,
+                    "message": "{}: {}".format(type(e).__name__, e),
+                }
+
+        self.set_pool_size(workers)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            while changes:
+                creating = {obj[spec["key"]] for _, action, obj, _ in changes if action == "create"}
+                batch = [
+                    change
+                    for change in changes
+                    if kind != "role" or not set(change[2].get("roles", [])) & (creating - {change[2]["id"]})
+                ] or changes
+                changes = [change for change in changes if change not in batch]
+
+                futures = {
+                    executor.submit(self._save_object, kind, action, obj): (index, action, obj, message)
+                    for index, action, obj, message in batch
+                }
+                for future in concurrent.futures.as_completed(futures):
+                    index, action, obj, message = futures[future]
+                    result = {"name": obj[spec["key"]], "action": action, "ok": True, "message": message}
+                    try:
+                        future.result()
+                    except requests.RequestException as e:
+                        result.update(ok=False, message=str(e))
+                    except (KeyError, TypeError, ValueError) as e:
+                        result.update(ok=False, message="{}: {}".format(type(e).__name__, e))
+                    results[index] = result
+
+        return results
+
     def create_role(self, name, description, privileges, roles):
         """Create a new role.
 
@@ -174,18 +361,22 @@ class Nexus3(client.RestApi):
         else:
             return "Failed to delete user {} with error: {}".format(username, result[1])
 
+    def iter_assets(self, repository):
+        """Yield the assets of a given repo, as the pages arrive.
+
+        :param repository: repo name
+        """
+        return self._paginate("v1/assets", repository=repository)
+
     def list_assets(self, repository, **kwargs):
         """List the assets of a given repo.
 
         :param repository: repo name
         """
-        result = self.get("v1/assets?repository={}".format(repository))[1]["items"]
-        if not result:
+        item_list = [item["path"] for item in self.iter_assets(repository)]
+        if not item_list:
             return "This repository has no assets"
         else:
-            item_list = []
-            for item in result:
-                item_list.append(item["path"])
             return item_list
 
     def list_blobstores(self, **kwargs):
@@ -196,12 +387,19 @@ class Nexus3(client.RestApi):
             list_of_blobstores.append(blob["name"])
         return list_of_blobstores
 
+    def iter_components(self, repository):
+        """Yield the components of a repo, as the pages arrive.
+
+        :param repository: the repo name
+        """
+        return self._paginate("v1/components", repository=repository)
+
     def list_components(self, repository, **kwargs):
         """List components from a repo.
 
         :param repository: the repo name
         """
-        result = self.get("v1/components?repository={}".format(repository))[1]["items"]
+        result = list(self.iter_components(repository))
         if not result:
             return "This repository has no components"
         else:
@@ -230,6 +428,58 @@ class Nexus3(client.RestApi):
             list_of_repositories.append(repository["name"])
         return list_of_repositories
 
+    def repository_usage(self, repository, top=10, now=None):
+        """Scan the assets of a repo, and return its storage usage.
+
+        Assets are grouped into components by their directory, eg the
+        group/artifact/version directory of maven artifacts.
+
+        :param repository: the repo name
+        :param top: number of largest components to return
+        :param now: reference time of the age buckets, defaults to now
+        :return: dict with the repository name, its number of assets, their
+            total size in bytes, the top largest components as (path, bytes)
+            tuples, and the [count, bytes] of assets by age bucket
+        """
+        if now is None:
+            now = datetime.datetime.now(datetime.timezone.utc)
+        components = collections.Counter()
+        ages = {label: [0, 0] for _, label in USAGE_AGE_BUCKETS}
+        ages["unknown"] = [0, 0]
+        count = size = 0
+        for asset in self.iter_assets(repository):
+            asset_size = asset.get("fileSize") or 0
+            count += 1
+            size += asset_size
+            components[posixpath.dirname(asset["path"].lstrip("/"))] += asset_size
+            age = ages[_age_bucket(asset.get("lastModified"), now)]
+            age[0] += 1
+            age[1] += asset_size
+        return {
+            "repository": repository,
+            "assets": count,
+            "bytes": size,
+            "largest": components.most_common(top),
+            "ages": ages,
+        }
+
+    def repositories_usage(self, repositories=None, top=10, workers=8):
+        """Return the storage usage of several repos, see repository_usage().
+
+        Each worker scans a repo at a time. Group repositories are skipped,
+        their assets belong to their members.
+
+        :param repositories: repo names, all hosted and proxy repos by default
+        :param top: number of largest components to return for each repo
+        :param workers: number of repos scanned in parallel
+        """
+        if not repositories:
+            repositories = [repo["name"] for repo in self.get("v1/repositories")[1] if repo.get("type") != "group"]
+        # Each scan downloads its next page in the background.
+        self.set_pool_size(2 * workers)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(lambda repo: self.repository_usage(repo, top), repositories))
+
     def list_roles(self, **kwargs):
         """List server roles."""
         result = self.get("beta/security/roles")[1]
@@ -257,18 +507,7 @@ class Nexus3(client.RestApi):
 
     def list_tags(self):
         """List all tag."""
-        result = self.get("v1/tags")[1]
-        list_of_tags = []
-        token = result["continuationToken"]
-        if token is not None:
-            while token is not None:
-                for tag in result["items"]:
-                    list_of_tags.append(tag["name"])
-                result = self.get("v1/tags?continuationToken={}".format(result["continuationToken"]))[1]
-                token = result["continuationToken"]
-        else:
-            for tag in result["items"]:
-                list_of_tags.append(tag["name"])
+        list_of_tags = [tag["name"] for tag in self._paginate("v1/tags")]
 
         if list_of_tags:
             return list_of_tags
@@ -369,26 +608,12 @@ class Nexus3(client.RestApi):
         :param repository: the repo to search in
         :param details: returns a fully-detailed json dump
         """
-        data = {
-            "q": query,
-            "repository": repository,
-        }
-        json_data = json.dumps(data)
-        result = self.get(
-            "v1/search/assets?q={}&repository={}".format(query, repository),
-            data=json_data,
-        )[
-            1
-        ]["items"]
-        list_of_assets = []
+        result = self._paginate("v1/search/assets", q=query, repository=repository)
 
         if details:
-            return json.dumps(result, indent=4)
-
-        for item in result:
-            list_of_assets.append(item["path"])
+            return json.dumps(list(result), indent=4)
 
-        return list_of_assets
+        return [item["path"] for item in result]
 
     def update_script(self, name, content):
         """Update an existing script on the server.
@@ -12,11 +12,22 @@
 
 __author__ = "DW Talton"
 
+import concurrent.futures
+import fnmatch
 import json
+import logging
+
+import requests
 
 import lftools.api.client as client
 from lftools import config
 
+log = logging.getLogger(__name__)
+
+PAGE_SIZE = 100
+VERSION_COLUMNS = ("project", "version", "active", "built", "ok", "message")
+FLEET_COLUMNS = ("project", "version", "action", "ok", "message")
+
 
 class ReadTheDocs(client.RestApi):
     """API endpoint wrapper for readthedocs.org.
@@ -25,6 +36,8 @@ class ReadTheDocs(client.RestApi):
     new methods.
     """
 
+    CACHE_TTLS = (("projects/*/builds/*", 0), ("projects/*/versions/*", 0), ("projects/*", 600))
+
     def __init__(self, **params):
         """Initialize the class."""
         self.params = params
@@ -38,6 +51,19 @@ class ReadTheDocs(client.RestApi):
 
         super(ReadTheDocs, self).__init__(**params)
 
+    def _paginate(self, url):
+        """Yield the results of every page of a listing.
+
+        The listings return their total count with the first page, so the
+        following pages are fetched concurrently.
+        """
+        return self.paginate_offset(
+            url,
+            PAGE_SIZE,
+            items=lambda page: page["results"],
+            total=lambda page: page.get("count", len(page["results"])),
+        )
+
     def project_list(self):
         """Return a list of projects.
 
@@ -48,11 +74,8 @@ class ReadTheDocs(client.RestApi):
         :param kwargs:
         :return: [projects]
         """
-        result = self.get("projects/?limit=999")[1]  # NOQA
-        data = result["results"]
         project_list = []
-
-        for project in data:
+        for project in self._paginate("projects/"):
             if "slug" in project:
                 project_list.append(project["slug"])
         return project_list
@@ -73,30 +96,7 @@ class ReadTheDocs(client.RestApi):
         :param project: The project's slug
         :return: {result}
         """
-        result = self.get("projects/{}/versions/?active=True".format(project))[1]
-        more_results = None
-        versions = []
-
-        # I feel like there must be a better way...but, this works. -DWTalton
-        initial_versions = result["results"]
-        for version in initial_versions:
-            versions.append(version["slug"])
-
-        if result["next"]:
-            more_results = result["next"].rsplit("/", 1)[-1]
-
-        if more_results:
-            while more_results is not None:
-                get_more_results = self.get("projects/{}/versions/".format(project) + more_results)[1]
-                more_results = get_more_results["next"]
-
-                for version in get_more_results["results"]:
-                    versions.append(version["slug"])
-
-                if more_results is not None:
-                    more_results = more_results.rsplit("/", 1)[-1]
-
-        return versions
+        return [version["slug"] for version in self.paginate_next("projects/{}/versions/?active=True".format(project))]
 
     def project_version_details(self, project, version):
         """Retrieve details of a single version.
@@ -214,14 +214,9 @@ class ReadTheDocs(client.RestApi):
         :param kwargs:
         :return: [subprojects]
         """
-        result = self.get("projects/{}/subprojects/?limit=999".format(project))[1]  # NOQA
-        data = result["results"]
-        subproject_list = []
-
-        for subproject in data:
-            subproject_list.append(subproject["child"]["slug"])
-
-        return subproject_list
+        return [
+            subproject["child"]["slug"] for subproject in self._paginate("projects/{}/subprojects/".format(project))
+        ]
 
     def subproject_details(self, project, subproject):
         """Retrieve the details of a specific subproject.
@@ -267,3 +262,133 @@ class ReadTheDocs(client.RestApi):
                 return False, result.status_code
         else:
             return False
+
+    def fleet_projects(self, project=None):
+        """Return the slugs of all the projects, or of a project and its subprojects.
+
+        :param project: The top-level project's slug, None for all the projects.
+        :return: [projects]
+        """
+        if project is None:
+            return self.project_list()
+        return [project] + self.subproject_list(project)
+
+    def _fleet(self, task, rows, workers):
+        """Run task on every row concurrently, recording the failures in the rows."""
+        self.set_pool_size(workers)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(task, row): row for row in rows}
+            for future in concurrent.futures.as_completed(futures):
+                row = futures[future]
+                try:
+                    future.result()
+                except (requests.RequestException, ValueError) as e:
+                    row.update(ok=False, message=str(e))
+                    log.error("{} {}: {}".format(row["project"], row.get("version", ""), e))
+        return rows
+
+    @staticmethod
+    def _checked(result):
+        """Return the body of a result, raise requests.HTTPError if it failed."""
+        response = result[0] if isinstance(result, tuple) else result
+        response.raise_for_status()
+        return result[1] if isinstance(result, tuple) else None
+
+    def fleet_versions(self, projects, workers=8):
+        """Retrieve the versions of many projects concurrently.
+
+        :param projects: The projects' slugs
+        :param workers: Number of projects fetched in parallel
+        :return: a list of dicts with the VERSION_COLUMNS of every version. A
+            project whose versions could not be fetched has a single row, with
+            ok False and the error as message.
+        """
+        rows = [{"project": project, "versions": [], "ok": True, "message": ""} for project in projects]
+
+        def fetch(row):
+            url = "projects/{}/versions/?limit={}".format(row["project"], PAGE_SIZE)
+            row["versions"] = list(self.paginate_next(url))
+
+        self._fleet(fetch, rows, workers)
+        versions = []
+        for row in rows:
+            if not row["ok"]:
+                versions.append(
+                    dict(dict.fromkeys(VERSION_COLUMNS, ""), project=row["project"], ok=False, message=row["message"])
+                )
+            for version in row["versions"]:
+                versions.append(
+                    {
+                        "project": row["project"],
+                        "version": version["slug"],
+                        "active": version.get("active"),
+                        "built": version.get("built"),
+                        "ok": True,
+                        "message": "",
+                    }
+                )
+        return versions
+
+    def fleet_version_update(self, projects, pattern, active, workers=8, dry_run=False):
+        """Activate or deactivate the versions matching a pattern in many projects.
+
+        Only the versions which are not in the requested state already are
+        updated, concurrently.
+
+        :param projects: The projects' slugs
+        :param pattern: Shell-style pattern of the version slugs, eg "v1.*"
+        :param active: True to activate the versions, False to deactivate them
+        :param workers: Number of requests sent in parallel
+        :param dry_run: Only report the versions which would be updated
+        :return: a list of dicts with the FLEET_COLUMNS of every matching
+            version, and of every project whose versions could not be fetched.
+        """
+        rows, updates = [], []
+        for version in self.fleet_versions(projects, workers):
+            row = {
+                "project": version["project"],
+                "version": version["version"],
+                "action": "",
+                "ok": True,
+                "message": "",
+            }
+            if not version["ok"]:
+                row.update(ok=False, message=version["message"])
+            elif not fnmatch.fnmatch(version["version"], pattern):
+                continue
+            elif version["active"] == active:
+                row.update(action="none", message="Already {}".format("active" if active else "inactive"))
+            else:
+                row["action"] = "activate" if active else "deactivate"
+                if dry_run:
+                    row["message"] = "Dry run"
+                else:
+                    updates.append(row)
+            rows.append(row)
+
+        def update(row):
+            self._checked(self.project_version_update(row["project"], row["version"], active))
+
+        self._fleet(update, updates, workers)
+        return rows
+
+    def fleet_build_trigger(self, projects, version="latest", workers=4):
+        """Trigger the build of a version of many projects.
+
+        :param projects: The projects' slugs
+        :param version: The version to build, must be active in every project
+        :param workers: Maximum number of builds triggered at the same time
+        :return: a list of dicts with the FLEET_COLUMNS of every project, the
+            message being the id of the triggered build.
+        """
+        rows = [
+            {"project": project, "version": version, "action": "build", "ok": True, "message": ""}
+            for project in projects
+        ]
+
+        def trigger(row):
+            body = self._checked(self.post("projects/{}/versions/{}/builds/".format(row["project"], row["version"])))
+            if isinstance(body, dict) and "build" in body:
+                row["message"] = "Build {}".format(body["build"].get("id"))
+
+        return self._fleet(trigger, rows, workers)
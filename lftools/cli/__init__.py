@@ -17,6 +17,7 @@ import logging
 import click
 
 from lftools import config as conf
+from lftools.api.cache import ResponseCache
 from lftools.cli.config import config_sys
 from lftools.cli.dco import dco
 from lftools.cli.deploy import deploy
@@ -43,13 +44,18 @@ log = logging.getLogger(__name__)
 @click.option("--password", envvar="LFTOOLS_PASSWORD", default=None)
 @click.option("--username", envvar="LFTOOLS_USERNAME", default=None)
 @click.option("-i", "--interactive", is_flag=True, default=False)
+@click.option(
+    "--no-cache", envvar="LFTOOLS_NO_CACHE", is_flag=True, default=False, help="Do not use the API response cache."
+)
 @click.pass_context
 @click.version_option()
-def cli(ctx, debug, interactive, password, username):
+def cli(ctx, debug, interactive, password, username, no_cache):
     """CLI entry point for lftools."""
     if debug:
         logging.getLogger("").setLevel(logging.DEBUG)
 
+    ResponseCache.disabled = no_cache
+
     ctx.obj["DEBUG"] = debug
     log.debug("DEBUG mode enabled.")
 
@@ -12,12 +12,17 @@
 
 from __future__ import print_function
 
+import csv
 import logging
+import sys
 from pprint import pformat
 
 import click
+import requests
+from tabulate import tabulate
 
 from lftools.api.endpoints import gerrit
+from lftools.git import onboard as gerrit_onboard
 from lftools.git.gerrit import Gerrit as git_gerrit
 
 log = logging.getLogger(__name__)
@@ -104,8 +109,11 @@ def addgithubrights(ctx, gerrit_fqdn, gerrit_project):
     gerrit_project test/test1
     """
     g = gerrit.Gerrit(fqdn=gerrit_fqdn)
-    data = g.add_github_rights(gerrit_fqdn, gerrit_project)
-    log.info(pformat(data))
+    try:
+        g.add_github_rights(gerrit_fqdn, gerrit_project)
+    except (requests.HTTPError, LookupError) as e:
+        log.error(e)
+        sys.exit(1)
 
 
 @click.command(name="abandonchanges")
@@ -123,6 +131,87 @@ def abandonchanges(ctx, gerrit_fqdn, gerrit_project):
     log.info(pformat(data))
 
 
+@click.command(name="query")
+@click.argument("gerrit_fqdn")
+@click.argument("query")
+@click.option("-o", "--option", "options", multiple=True, help="Gerrit query option, eg LABELS. Can be repeated.")
+@click.option("-l", "--limit", type=int, help="Maximum number of changes to list.")
+@click.pass_context
+def query_changes(ctx, gerrit_fqdn, query, options, limit):
+    """List the changes matching a Gerrit QUERY.
+
+    All the result pages are fetched, eg:
+
+    lftools gerrit query gerrit.example.org "owner:self status:open"
+    """
+    g = gerrit.Gerrit(fqdn=gerrit_fqdn)
+    changes = g.query_changes(query, options, limit)
+    log.info(
+        tabulate(
+            [[c["_number"], c["project"], c["branch"], c["status"], c["subject"]] for c in changes],
+            headers=["Change", "Project", "Branch", "Status", "Subject"],
+        )
+    )
+
+
+@click.command(name="bulk")
+@click.argument("gerrit_fqdn")
+@click.argument("action", type=click.Choice(["abandon", "vote", "submit"]))
+@click.argument("query")
+@click.option(
+    "-l",
+    "--label",
+    "labels",
+    multiple=True,
+    help="Vote, as LABEL=VALUE, eg Code-Review=+2. Can be repeated. Required to vote.",
+)
+@click.option("-m", "--message", type=str, help="Message posted on the changes.")
+@click.option("-w", "--workers", type=int, default=8, show_default=True, help="Number of changes updated in parallel.")
+@click.option("-n", "--dry-run", is_flag=True, help="Only list the changes the action would apply to.")
+@click.option("-y", "--yes", is_flag=True, help="Answer yes to all prompts")
+@click.pass_context
+def bulk(ctx, gerrit_fqdn, action, query, labels, message, workers, dry_run, yes):
+    """Abandon, vote on or submit all the changes matching a Gerrit QUERY.
+
+    The actions run concurrently, and a failure on a change does not stop the
+    others, eg:
+
+    lftools gerrit bulk gerrit.example.org abandon "owner:automation status:open age:1y"
+    """
+    payload = {}
+    if message:
+        payload["message"] = message
+    if action == "vote":
+        if not labels:
+            raise click.UsageError("--label is required to vote.")
+        try:
+            payload["labels"] = {name: int(value) for name, value in (label.split("=", 1) for label in labels)}
+        except ValueError:
+            raise click.BadParameter("Labels must be LABEL=VALUE, eg Code-Review=+2.", param_hint="--label")
+        payload["tag"] = "automation"
+
+    g = gerrit.Gerrit(fqdn=gerrit_fqdn)
+    changes = list(g.query_changes(query))
+    for change in changes:
+        log.info("{} {} {}".format(change["_number"], change["project"], change["subject"]))
+    if dry_run or not changes:
+        log.info("{} changes match the query.".format(len(changes)))
+        return
+    if not (yes or click.confirm("Would you like to {} {} changes?".format(action, len(changes)))):
+        return
+
+    results = g.bulk_change_action(action, changes, payload, workers)
+    failed = [result for result in results if not result["ok"]]
+    log.info("{} changes done, {} failed.".format(len(results) - len(failed), len(failed)))
+    if failed:
+        log.error(
+            tabulate(
+                [[f["change"], f["project"], f["message"]] for f in failed], headers=["Change", "Project", "Error"]
+            )
+        )
+        sys.exit(1)
+
+
 # Creates a gerrit project if project does not exist and adds ldap group as owner.
 # Limits: does not support inherited permissions from other than All-Projects.
 @click.command(name="createproject")
@@ -146,8 +235,16 @@ def createproject(ctx, gerrit_fqdn, gerrit_project, ldap_group, description, che
 
     """
     g = gerrit.Gerrit(fqdn=gerrit_fqdn)
-    data = g.create_project(gerrit_fqdn, gerrit_project, ldap_group, description, check)
-    log.info(pformat(data))
+    try:
+        data = g.create_project(gerrit_fqdn, gerrit_project, ldap_group, description, check)
+    except requests.HTTPError as e:
+        log.error(e)
+        sys.exit(e.response.status_code)
+    except ValueError as e:
+        log.error(e)
+        sys.exit(1)
+    if not check:
+        log.info(pformat(data))
 
 
 @click.command(name="create-saml-group")
@@ -157,7 +254,11 @@ def createproject(ctx, gerrit_fqdn, gerrit_project, ldap_group, description, che
 def create_saml_group(ctx, gerrit_fqdn, ldap_group):
     """Create saml group based on ldap group."""
     g = gerrit.Gerrit(fqdn=gerrit_fqdn)
-    data = g.create_saml_group(gerrit_fqdn, ldap_group)
+    try:
+        data = g.create_saml_group(gerrit_fqdn, ldap_group)
+    except requests.HTTPError as e:
+        log.error(e)
+        sys.exit(1)
     log.info(pformat(data))
 
 
@@ -184,6 +285,70 @@ def list_project_inherits_from(ctx, gerrit_fqdn, gerrit_project):
     log.info(data)
 
 
+@click.command(name="audit-access")
+@click.argument("gerrit_fqdn")
+@click.option("-p", "--prefix", type=str, help="Only audit the projects whose name starts with PREFIX.")
+@click.option("--project", "projects", multiple=True, help="Only audit this project. Can be repeated.")
+@click.option("-w", "--workers", type=int, default=8, show_default=True, help="Number of parallel requests.")
+@click.option(
+    "--csv", "csv_path", type=click.Path(dir_okay=False, writable=True), help="Write the table to a csv file instead."
+)
+@click.pass_context
+def audit_access(ctx, gerrit_fqdn, prefix, projects, workers, csv_path):
+    """List the effective access rules of all the projects.
+
+    Every rule a project gets, set locally or inherited from its parents, is
+    one row of the table. The projects are listed once, their access rights
+    fetched in parallel, and each parent project is only fetched once.
+    """
+    g = gerrit.Gerrit(fqdn=gerrit_fqdn)
+    if projects:
+        unknown = sorted(set(projects) - set(g.get_access(projects, workers)))
+        if unknown:
+            raise click.UsageError("Unknown projects: {}".format(", ".join(unknown)))
+    else:
+        projects = g.list_projects(prefix)
+    rows = g.audit_access(projects, workers)
+    if csv_path:
+        with open(csv_path, "w", newline="") as out_file:
+            writer = csv.DictWriter(out_file, fieldnames=gerrit.ACCESS_COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
+        log.info("Wrote {} rules of {} projects to {}".format(len(rows), len(projects), csv_path))
+    else:
+        log.info(
+            tabulate([[row[column] for column in gerrit.ACCESS_COLUMNS] for row in rows], headers=gerrit.ACCESS_COLUMNS)
+        )
+
+
+@click.command(name="onboard")
+@click.argument("gerrit_fqdn")
+@click.argument("manifest", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "-w", "--workers", type=int, default=4, show_default=True, help="Number of projects provisioned in parallel."
+)
+@click.option("-n", "--dry-run", is_flag=True, help="Only report which projects exist already.")
+@click.pass_context
+def onboard(ctx, gerrit_fqdn, manifest, workers, dry_run):
+    """Onboard all the projects listed in a MANIFEST file.
+
+    Missing projects are created with their SAML owner group, granted GitHub
+    rights if asked, and get a .gitreview. The INFO jobs, and maven settings
+    if asked, of all the projects are then pushed to the ci-management repo
+    in a single change. See the documentation for the manifest format.
+    """
+    results = gerrit_onboard.onboard(gerrit_fqdn, manifest, workers, dry_run)
+    if results:
+        log.info(
+            tabulate(
+                [[r["project"], r["step"], "ok" if r["ok"] else "FAILED", r["message"]] for r in results],
+                headers=["Project", "Step", "Status", "Message"],
+            )
+        )
+    if any(not result["ok"] for result in results):
+        sys.exit(1)
+
+
 @click.command(name="addmavenconfig")
 @click.argument("gerrit_fqdn")
 @click.argument("gerrit_project")
@@ -227,7 +392,11 @@ gerrit_cli.add_command(addgitreview)
 gerrit_cli.add_command(addgithubrights)
 gerrit_cli.add_command(createproject)
 gerrit_cli.add_command(abandonchanges)
+gerrit_cli.add_command(bulk)
+gerrit_cli.add_command(query_changes)
 gerrit_cli.add_command(create_saml_group)
 gerrit_cli.add_command(list_project_permissions)
 gerrit_cli.add_command(list_project_inherits_from)
 gerrit_cli.add_command(addmavenconfig)
+gerrit_cli.add_command(audit_access)
+gerrit_cli.add_command(onboard)
@@ -71,10 +71,23 @@ def create(ctx):
         "This will override any URL set in settings.yaml."
     ).format(NEXUS_URL_ENV),
 )
+@click.option(
+    "-w",
+    "--workers",
+    type=int,
+    default=4,
+    show_default=True,
+    help="Number of Nexus changes to apply in parallel.",
+)
+@click.option("--plan", "show_plan", is_flag=True, help="Print the changes as JSON instead of applying them.")
 @click.pass_context
-def repo(ctx, configfile, url, settings=False):
-    """Create a Nexus repository as defined by a repo-config.yaml file."""
-    nexuscmd.create_repos(configfile, settings, url)
+def repo(ctx, configfile, url, workers, show_plan, settings=False):
+    """Create a Nexus repository as defined by a repo-config.yaml file.
+
+    Only the targets, privileges, roles and users which are missing or differ
+    from the config file are created or updated.
+    """
+    nexuscmd.create_repos(configfile, settings, url, workers, show_plan)
 
 
 @create.command()
@@ -82,10 +95,15 @@ def repo(ctx, configfile, url, settings=False):
     "-c", "--config", type=str, required=True, help="Role config file for how the Nexus role should be created."
 )
 @click.option("-s", "--settings", type=str, required=True, help="Config file containing administrative settings.")
+@click.option("--plan", "show_plan", is_flag=True, help="Print the changes as JSON instead of applying them.")
 @click.pass_context
-def role(ctx, config, settings):
-    """Create a Nexus role as defined by a role-config.yaml file."""
-    nexuscmd.create_roles(config, settings)
+def role(ctx, config, settings, show_plan):
+    """Create a Nexus role as defined by a role-config.yaml file.
+
+    Only the roles which are missing or differ from the config file are
+    created or updated.
+    """
+    nexuscmd.create_roles(config, settings, show_plan)
 
 
 @nexus.group()
@@ -119,25 +137,43 @@ def docker_params(command):
 @click.option(
     "--csv", type=click.Path(dir_okay=False, writable=True), help="Write a csv file of the search results to PATH."
 )
+@click.option(
+    "--jsonl",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Write the search results to PATH, one JSON object per line.",
+)
+@click.option(
+    "--columns",
+    type=str,
+    help="Comma separated component fields to write. Defaults to name,version,id.",
+)
 @click.pass_context
-def list_images(ctx, settings, server, repo, pattern, csv):
+def list_images(ctx, settings, server, repo, pattern, csv, jsonl, columns):
     """List images matching the PATTERN.
 
     Use '*' for wildcard, or begin with '!' to search for images NOT matching
-    the string.
+    the string. Files written with --csv or --jsonl are gzip compressed if
+    their name ends with .gz.
     """
     if not server and NEXUS_URL_ENV in environ:
         server = environ[NEXUS_URL_ENV]
-    images = nexuscmd.search(settings, server, repo, pattern)
-    if images:
-        nexuscmd.output_images(images, csv)
+    if columns:
+        columns = [column.strip() for column in columns.split(",")]
+    images = nexuscmd.iter_search(settings, server, repo, pattern, columns)
+    nexuscmd.output_images(images, csv, jsonl, columns)
 
 
 @docker.command(name="delete")
 @docker_params
 @click.option("-y", "--yes", is_flag=True, help="Answer yes to all prompts")
+@click.option("-w", "--workers", type=int, default=8, show_default=True, help="Number of images to delete in parallel.")
+@click.option(
+    "--checkpoint",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Record deleted images in this file, and skip the images it lists. Allows resuming an interrupted run.",
+)
 @click.pass_context
-def delete_images(ctx, settings, server, repo, pattern, yes):
+def delete_images(ctx, settings, server, repo, pattern, yes, workers, checkpoint):
     """Delete all images matching the PATTERN.
 
     By default, prints to console only. Use '*' for wildcard, or begin with '!'
@@ -145,7 +181,46 @@ def delete_images(ctx, settings, server, repo, pattern, yes):
     """
     images = nexuscmd.search(settings, server, repo, pattern)
     if yes or click.confirm("Would you like to delete all {} images?".format(str(len(images)))):
-        nexuscmd.delete_images(settings, server, images)
+        nexuscmd.delete_images(settings, server, images, workers, checkpoint)
+
+
+@docker.command(name="prune")
+@docker_params
+@click.option("-k", "--keep", type=int, help="Number of newest versions of each image to keep.")
+@click.option("-d", "--keep-days", type=int, help="Keep the versions of each image younger than this number of days.")
+@click.option(
+    "--scheme",
+    type=click.Choice(["semver", "date", "natural"]),
+    default="semver",
+    show_default=True,
+    help="How versions are ordered. Versions not following the scheme are always kept.",
+)
+@click.option("-n", "--dry-run", is_flag=True, help="Only report the images which would be deleted.")
+@click.option("-y", "--yes", is_flag=True, help="Answer yes to all prompts")
+@click.option("-w", "--workers", type=int, default=8, show_default=True, help="Number of images to delete in parallel.")
+@click.option(
+    "--checkpoint",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Record deleted images in this file, and skip the images it lists. Allows resuming an interrupted run.",
+)
+@click.pass_context
+def prune_images(ctx, settings, server, repo, pattern, keep, keep_days, scheme, dry_run, yes, workers, checkpoint):
+    """Delete the image versions matching PATTERN which a retention policy expires.
+
+    The newest --keep versions of each image are kept, as well as the
+    versions younger than --keep-days days. At least one of them is needed.
+    """
+    if keep is None and keep_days is None:
+        raise click.UsageError("--keep, --keep-days or both are needed.")
+    if not server and NEXUS_URL_ENV in environ:
+        server = environ[NEXUS_URL_ENV]
+
+    def confirm(count):
+        return yes or click.confirm("Would you like to delete {} images?".format(count))
+
+    nexuscmd.prune_images(
+        settings, server, repo, pattern, keep, keep_days, scheme, dry_run, workers, checkpoint, confirm
+    )
 
 
 @nexus.command()
@@ -169,7 +244,14 @@ def release(ctx, repos, verify, server):
 
 
 @docker.command(name="releasedockerhub")
-@click.option("-o", "--org", type=str, required=True, help="Specify repository organization.")
+@click.option(
+    "-o",
+    "--org",
+    type=str,
+    required=True,
+    multiple=True,
+    help="Specify repository organization. Repeat to sync several organizations in parallel.",
+)
 @click.option(
     "-r",
     "--repo",
@@ -223,14 +305,61 @@ def release(ctx, repos, verify, server):
     default="",
     required=False,
     help="Specify a file which contains a regexp expression to validate version number."
+    " The file may contain several regexps, one per row.            "
     " File sample:                                                  "
     r" ^\d+.\d+.\d+$                                                 ",
 )
+@click.option(
+    "-t",
+    "--estimate",
+    is_flag=True,
+    required=False,
+    default=False,
+    help="Estimate the bytes, disk space and time needed to copy the missing tags, before any copy.",
+)
+@click.option(
+    "--throughput",
+    type=float,
+    default=0,
+    required=False,
+    help="Transfer rate in MiB/s used by --estimate. Default is to measure it against Nexus3.",
+)
 @click.pass_context
-def copy_from_nexus3_to_dockerhub(ctx, org, repo, exact, summary, verbose, copy, progbar, repofile, version_regexp):
+def copy_from_nexus3_to_dockerhub(
+    ctx, org, repo, exact, summary, verbose, copy, progbar, repofile, version_regexp, estimate, throughput
+):
     """Find missing repos in Docker Hub, Copy from Nexus3.
 
     Will by default list all missing repos in Docker Hub, compared to Nexus3.
     If -c (--copy) is provided, it will copy the repos from Nexus3 to Docker Hub.
+    If -t (--estimate) is provided, the size and duration of the copy is estimated first.
     """
-    rdh.start_point(org, repo, exact, summary, verbose, copy, progbar, repofile, version_regexp)
+    throughput = throughput * 1024 * 1024
+    if len(org) == 1:
+        rdh.start_point(
+            org[0],
+            repo,
+            exact,
+            summary,
+            verbose,
+            copy,
+            progbar,
+            repofile,
+            version_regexp,
+            estimate=estimate,
+            throughput=throughput,
+        )
+    else:
+        rdh.start_points(
+            org,
+            repo,
+            exact,
+            summary,
+            verbose,
+            copy,
+            progbar,
+            repofile,
+            version_regexp,
+            estimate=estimate,
+            throughput=throughput,
+        )
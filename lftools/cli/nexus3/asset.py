@@ -33,9 +33,12 @@ def asset(ctx):
 def asset_list(ctx, repository):
     """List assets."""
     r = ctx.obj["nexus3"]
-    data = r.list_assets(repository)
-    for item in data:
-        log.info(pformat(item))
+    count = 0
+    for item in r.iter_assets(repository):
+        log.info(pformat(item["path"]))
+        count += 1
+    if not count:
+        log.info("This repository has no assets")
 
 
 @asset.command(name="search")
@@ -0,0 +1,68 @@
+# SPDX-License-Identifier: EPL-1.0
+##############################################################################
+# Copyright (c) 2026 The Linux Foundation and others.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+##############################################################################
+
+"""Nexus3 bulk import shared by the user, role and tag interfaces."""
+
+import json
+import logging
+import sys
+
+import click
+import yaml
+from tabulate import tabulate
+
+from lftools.api.endpoints.nexus3 import IMPORT_KINDS
+
+log = logging.getLogger(__name__)
+
+
+def import_params(command):
+    """Common arguments and options for the import subcommands."""
+    command = click.option(
+        "--report",
+        type=click.Path(dir_okay=False, writable=True),
+        help="Write the result of each object to this JSON file.",
+    )(command)
+    command = click.option(
+        "-w", "--workers", type=int, default=8, show_default=True, help="Number of concurrent requests."
+    )(command)
+    command = click.argument("import_file", type=click.Path(exists=True, dir_okay=False))(command)
+    return command
+
+
+def import_file(ctx, kind, path, workers, report):
+    """Create or update the objects of a YAML file, and report the results.
+
+    The file holds a list of objects, or a mapping of names to objects, with
+    the fields of the Nexus3 API.
+    """
+    with open(path, "r") as f:
+        objects = yaml.safe_load(f) or []
+    if isinstance(objects, dict):
+        key = IMPORT_KINDS[kind]["key"]
+        objects = [dict({key: name}, **(obj or {})) for name, obj in objects.items()]
+
+    r = ctx.obj["nexus3"]
+    results = r.import_objects(kind, objects, workers)
+
+    log.info(
+        tabulate(
+            [[res["name"], res["action"], "ok" if res["ok"] else "FAILED", res["message"]] for res in results],
+            headers=[kind.capitalize(), "Action", "Result", "Message"],
+        )
+    )
+    if report:
+        with open(report, "w") as f:
+            json.dump(results, f, indent=2)
+
+    failed = [res for res in results if not res["ok"]]
+    if failed:
+        log.error("{} of {} {}s failed".format(len(failed), len(results), kind))
+        sys.exit(1)
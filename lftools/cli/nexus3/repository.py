@@ -16,6 +16,9 @@ import logging
 from pprint import pformat
 
 import click
+from tabulate import tabulate
+
+from lftools.nexus.util import format_bytes
 
 log = logging.getLogger(__name__)
 
@@ -34,3 +37,55 @@ def list_repositories(ctx):
     r = ctx.obj["nexus3"]
     data = r.list_repositories()
     log.info(pformat(data))
+
+
+@repository.command(name="usage")
+@click.argument("repositories", nargs=-1)
+@click.option("--top", type=int, default=10, show_default=True, help="Number of largest components to show.")
+@click.option(
+    "-w", "--workers", type=int, default=8, show_default=True, help="Number of repositories to scan in parallel."
+)
+@click.pass_context
+def repository_usage(ctx, repositories, top, workers):
+    """Report the storage used by REPOSITORIES, all of them by default.
+
+    Lists every asset of the repositories, and reports their count and size,
+    the largest components, and the assets by last modification age.
+    """
+    r = ctx.obj["nexus3"]
+    usages = sorted(r.repositories_usage(repositories, top, workers), key=lambda u: u["bytes"], reverse=True)
+
+    log.info(
+        tabulate(
+            [[u["repository"], u["assets"], format_bytes(u["bytes"])] for u in usages]
+            + [["Total", sum(u["assets"] for u in usages), format_bytes(sum(u["bytes"] for u in usages))]],
+            headers=["Repository", "Assets", "Size"],
+        )
+    )
+
+    largest = sorted(
+        ((u["repository"], path, size) for u in usages for path, size in u["largest"]),
+        key=lambda c: c[2],
+        reverse=True,
+    )[:top]
+    log.info("")
+    log.info(
+        tabulate(
+            [[repo, path, format_bytes(size)] for repo, path, size in largest],
+            headers=["Repository", "Component", "Size"],
+        )
+    )
+
+    ages = {}
+    for u in usages:
+        for label, (count, size) in u["ages"].items():
+            ages.setdefault(label, [0, 0])
+            ages[label][0] += count
+            ages[label][1] += size
+    log.info("")
+    log.info(
+        tabulate(
+            [[label, count, format_bytes(size)] for label, (count, size) in ages.items() if count],
+            headers=["Last modified", "Assets", "Size"],
+        )
+    )
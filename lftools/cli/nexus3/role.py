@@ -18,6 +18,8 @@ from pprint import pformat
 import click
 from tabulate import tabulate
 
+from lftools.cli.nexus3 import bulk
+
 log = logging.getLogger(__name__)
 
 
@@ -48,3 +50,15 @@ def create_role(ctx, name, description, privileges, roles):
     r = ctx.obj["nexus3"]
     data = r.create_role(name, description, privileges, roles)
     log.info(pformat(data))
+
+
+@role.command(name="import")
+@bulk.import_params
+@click.pass_context
+def import_roles(ctx, import_file, workers, report):
+    """Create or update the roles of a YAML file.
+
+    Only the roles which are missing, or whose fields differ from the file,
+    are created or updated.
+    """
+    bulk.import_file(ctx, "role", import_file, workers, report)
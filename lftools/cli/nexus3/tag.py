@@ -17,6 +17,8 @@ from pprint import pformat
 
 import click
 
+from lftools.cli.nexus3 import bulk
+
 log = logging.getLogger(__name__)
 
 
@@ -65,3 +67,15 @@ def show_tag(ctx, name):
     r = ctx.obj["nexus3"]
     data = r.show_tag(name)
     log.info(pformat(data))
+
+
+@tag.command(name="import")
+@bulk.import_params
+@click.pass_context
+def import_tags(ctx, import_file, workers, report):
+    """Create or update the tags of a YAML file.
+
+    Only the tags which are missing, or whose fields differ from the file,
+    are created or updated.
+    """
+    bulk.import_file(ctx, "tag", import_file, workers, report)
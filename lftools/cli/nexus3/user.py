@@ -17,6 +17,8 @@ import logging
 import click
 from tabulate import tabulate
 
+from lftools.cli.nexus3 import bulk
+
 log = logging.getLogger(__name__)
 
 
@@ -72,3 +74,15 @@ def user_delete(ctx, username):
     r = ctx.obj["nexus3"]
     data = r.delete_user(username)
     log.info(data)
+
+
+@user.command(name="import")
+@bulk.import_params
+@click.pass_context
+def import_users(ctx, import_file, workers, report):
+    """Create or update the users of a YAML file.
+
+    Only the users which are missing, or whose fields differ from the file,
+    are created or updated.
+    """
+    bulk.import_file(ctx, "user", import_file, workers, report)
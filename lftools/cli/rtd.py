@@ -14,9 +14,11 @@ __author__ = "DW Talton"
 
 
 import logging
+import sys
 from pprint import pformat
 
 import click
+from tabulate import tabulate
 
 from lftools.api.endpoints import readthedocs
 
@@ -207,6 +209,75 @@ def subproject_delete(ctx, project_slug, subproject_slug):
         log.error("Request failed. Is there a subproject relationship?")
 
 
+def fleet_params(command):
+    """Common options of the fleet commands."""
+    command = click.option(
+        "-p",
+        "--project",
+        type=str,
+        help="Only work on this project and its subprojects. Defaults to all the projects.",
+    )(command)
+    return command
+
+
+def log_fleet_table(rows, columns):
+    """Log the status table of a fleet command, exit with an error if a row failed."""
+    log.info(tabulate([[row[column] for column in columns] for row in rows], headers=columns))
+    failed = [row for row in rows if not row["ok"]]
+    log.info("{} done, {} failed.".format(len(rows) - len(failed), len(failed)))
+    if failed:
+        sys.exit(1)
+
+
+@click.command(name="fleet-versions")
+@fleet_params
+@click.option("-w", "--workers", type=int, default=8, show_default=True, help="Number of projects fetched in parallel.")
+@click.pass_context
+def fleet_versions(ctx, project, workers):
+    """List the versions of all the projects.
+
+    The versions of the projects are fetched concurrently, and shown as one
+    table.
+    """
+    r = readthedocs.ReadTheDocs()
+    rows = r.fleet_versions(r.fleet_projects(project), workers)
+    log_fleet_table(rows, readthedocs.VERSION_COLUMNS)
+
+
+@click.command(name="fleet-version-update")
+@fleet_params
+@click.argument("pattern")
+@click.argument("active", type=click.BOOL)
+@click.option("-w", "--workers", type=int, default=8, show_default=True, help="Number of parallel requests.")
+@click.option("-n", "--dry-run", is_flag=True, help="Only list the versions which would be updated.")
+@click.pass_context
+def fleet_version_update(ctx, project, pattern, active, workers, dry_run):
+    """Activate or deactivate the versions matching PATTERN in all the projects.
+
+    PATTERN is a shell-style wildcard matched against the version slugs, and
+    active must be one of true or false, eg:
+
+    lftools rtd fleet-version-update --project myproject "v1.*" false
+    """
+    r = readthedocs.ReadTheDocs()
+    rows = r.fleet_version_update(r.fleet_projects(project), pattern, active, workers, dry_run)
+    log_fleet_table(rows, readthedocs.FLEET_COLUMNS)
+
+
+@click.command(name="fleet-build-trigger")
+@fleet_params
+@click.option("-v", "--version", "version_slug", default="latest", show_default=True, help="Version to build.")
+@click.option(
+    "-w", "--workers", type=int, default=4, show_default=True, help="Maximum number of builds triggered at once."
+)
+@click.pass_context
+def fleet_build_trigger(ctx, project, version_slug, workers):
+    """Trigger a build of all the projects."""
+    r = readthedocs.ReadTheDocs()
+    rows = r.fleet_build_trigger(r.fleet_projects(project), version_slug, workers)
+    log_fleet_table(rows, readthedocs.FLEET_COLUMNS)
+
+
 rtd.add_command(project_list)
 rtd.add_command(project_details)
 rtd.add_command(project_version_list)
@@ -221,3 +292,6 @@ rtd.add_command(subproject_list)
 rtd.add_command(subproject_details)
 rtd.add_command(subproject_create)
 rtd.add_command(subproject_delete)
+rtd.add_command(fleet_versions)
+rtd.add_command(fleet_version_update)
+rtd.add_command(fleet_build_trigger)
@@ -11,23 +11,59 @@
 """Gerrit git interface."""
 
 import configparser
+import contextlib
 import json
 import logging
 import os
+import shutil
 import tempfile
+import threading
+import time
 import urllib
 
 import requests
-from git import Repo
+from git import GitCommandError, Repo
 from jinja2 import Environment, PackageLoader, select_autoescape
+from xdg import XDG_CACHE_HOME
 
 from lftools import config
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 log = logging.getLogger(__name__)
 
+GIT_CACHE_DIRECTORY = os.path.join(XDG_CACHE_HOME, "lftools", "git")
+COMMIT_HOOK_TTL = 24 * 60 * 60
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def _cache_lock(path):
+    """Lock a cache entry against other threads and processes."""
+    with _locks_lock:
+        lock = _locks.setdefault(path, threading.Lock())
+    with lock:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".lock", "w") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
 
 class Gerrit:
-    """Wrapper for Gerrit-specific git methods."""
+    """Wrapper for Gerrit-specific git methods.
+
+    The repo is cloned from a bare mirror cached in GIT_CACHE_DIRECTORY,
+    which is created on first use, then only fetches the new commits. The
+    working copy has the latest depth commits of the mirror, 1 by default,
+    enough to add files and push a change. Pass cache=False to clone the
+    repo from Gerrit directly, with its full history unless depth is given.
+    """
 
     def __init__(self, **params):
         """Initialize the class."""
@@ -46,14 +82,25 @@ class Gerrit:
 
         working_dir = tempfile.mkdtemp()
         log.debug("Temporary working directory for git repo: {}".format(working_dir))
-        os.chdir(working_dir)
 
         short_endpoint = self.params["creds"]["endpoint"].split("://")[-1]
         project_endpoint = urllib.parse.urljoin(short_endpoint, self.project)
         remote = "https://{}:{}@{}".format(
             self.params["creds"]["username"], self.params["creds"]["password"], project_endpoint
         )
-        Repo.clone_from(remote, working_dir)
+        mirror = None
+        if self.params.get("cache", True):
+            try:
+                mirror = self._update_mirror(remote, "https://{}".format(project_endpoint))
+            except (GitCommandError, OSError, ValueError) as e:
+                log.warning("Could not use the cached mirror of {}, cloning it: {}".format(self.project, e))
+        if mirror:
+            Repo.clone_from("file://{}".format(mirror), working_dir, depth=self.params.get("depth", 1))
+            Repo(working_dir).remote(name="origin").set_url(remote)
+        elif self.params.get("depth"):
+            Repo.clone_from(remote, working_dir, depth=self.params["depth"])
+        else:
+            Repo.clone_from(remote, working_dir)
         self.repo = Repo.init(working_dir)
         self.get_commit_hook(self.params["creds"]["endpoint"], working_dir)
 
@@ -66,8 +113,42 @@ class Gerrit:
         default_ref = self.repo.git.rev_parse("origin/HEAD", abbrev_ref=True)
         self.default_branch = default_ref.split("/")[-1]
 
+    def _update_mirror(self, remote, public_url):
+        """Create or update the bare mirror of the project, and return its path.
+
+        The mirror only has the branches and tags of the project, not the
+        Gerrit changes, and does not store the credentials of remote. Raise
+        ValueError if the project has no HEAD to clone, an empty project for
+        instance.
+        """
+        path = os.path.join(GIT_CACHE_DIRECTORY, self.fqdn, "{}.git".format(self.project))
+        with _cache_lock(path):
+            if not os.path.isdir(path):
+                log.info("Caching {} in {}".format(self.project, path))
+                partial = "{}.partial".format(path)
+                shutil.rmtree(partial, ignore_errors=True)
+                mirror = Repo.clone_from(remote, partial, bare=True)
+                mirror.remote(name="origin").set_url(public_url)
+                os.rename(partial, path)
+                return path
+
+            mirror = Repo(path)
+            log.debug("Updating the cached mirror {}".format(path))
+            mirror.git.fetch(remote, "+refs/heads/*:refs/heads/*", "+refs/tags/*:refs/tags/*", "--prune")
+            # Follow changes of the default branch.
+            heads = mirror.git.ls_remote("--symref", remote, "HEAD").splitlines()
+            if not heads:
+                raise ValueError("{} has no HEAD".format(public_url))
+            head = heads[0]
+            if head.startswith("ref: "):
+                mirror.git.symbolic_ref("HEAD", head[len("ref: ") :].split("\t")[0])
+        return path
+
     def get_commit_hook(self, endpoint, working_dir):
-        """Pulls in the Gerrit server's commit hook to add a changeId."""
+        """Pulls in the Gerrit server's commit hook to add a changeId.
+
+        The hook is cached per server for COMMIT_HOOK_TTL seconds.
+        """
         hook_url = urllib.parse.urljoin(endpoint, "tools/hooks/commit-msg")
         # The hook url does not include the /a that is typically part of a
         # gerrit url for cloning.
@@ -79,14 +160,33 @@ class Gerrit:
             os.mkdir(local_hooks_path)
         except FileExistsError:
             log.debug("Directory {} already exists".format(local_hooks_path))
+
+        parsed_url = urllib.parse.urlparse(hook_url)
+        cached_hook = os.path.join(GIT_CACHE_DIRECTORY, parsed_url.netloc, parsed_url.path.lstrip("/"))
+        try:
+            with _cache_lock(cached_hook):
+                if not os.path.isfile(cached_hook) or time.time() - os.path.getmtime(cached_hook) > COMMIT_HOOK_TTL:
+                    self._download_commit_hook(hook_url, cached_hook)
+                shutil.copyfile(cached_hook, commit_msg_hook_path)
+        except OSError as e:
+            log.debug("Could not cache the commit hook: {}".format(e))
+            self._download_commit_hook(hook_url, commit_msg_hook_path)
+        os.chmod(commit_msg_hook_path, 0o755)
+
+    @staticmethod
+    def _download_commit_hook(hook_url, path):
+        """Download the commit hook to path."""
         with requests.get(hook_url) as hook:
             hook.raise_for_status()
-            with open(commit_msg_hook_path, "w") as file:
+            with open(path, "w") as file:
                 file.write(hook.text)
-            os.chmod(commit_msg_hook_path, 0o755)
 
     def add_file(self, filepath, content):
-        """Add a file to the current git repo."""
+        """Add a file to the current git repo.
+
+        Relative paths are relative to the root of the repo.
+        """
+        filepath = os.path.join(self.repo.working_tree_dir, filepath)
         if filepath.find("/") >= 0:
             try:
                 log.debug("Making directories for {}".format(filepath[0]))
@@ -100,6 +200,7 @@ class Gerrit:
 
     def add_symlink(self, filepath, target):
         """Add a symlink to the current git repo."""
+        filepath = os.path.join(self.repo.working_tree_dir, filepath)
         try:
             os.symlink(target, filepath)
         except FileExistsError:
@@ -140,9 +241,12 @@ class Gerrit:
         if push:
             self.repo.git.push(self.origin, "HEAD:refs/for/{}".format(self.default_branch))
 
-    def add_info_job(self, fqdn, gerrit_project, issue_id, agent):
+    def add_info_job(self, fqdn, gerrit_project, issue_id, agent, commit=True):
         """Add info-verify jenkins job for the new project.
 
+        With commit=False, the job is only staged, to commit it along other
+        changes.
+
         Example:
 
         fqdn gerrit.o-ran-sc.org
@@ -159,6 +263,8 @@ class Gerrit:
                 buildnode = "centos8-builder-2c-1g"
             else:
                 buildnode = "centos7-builder-2c-1g"
+        else:
+            buildnode = agent
 
         jinja_env = Environment(
             loader=PackageLoader("lftools.git"), autoescape=select_autoescape(), keep_trailing_newline=True
@@ -174,8 +280,9 @@ class Gerrit:
 
         filepath = "jjb/{0}/{0}.yaml".format(gerrit_project_dashed)
         self.add_file(filepath, content)
-        commit_msg = "Chore: Automation adds {}".format(filename)
-        self.commit(commit_msg, issue_id, push=True)
+        if commit:
+            commit_msg = "Chore: Automation adds {}".format(filename)
+            self.commit(commit_msg, issue_id, push=True)
 
     def add_git_review(self, fqdn, gerrit_project, issue_id):
         """Add and push a .gitreview for a project.
@@ -199,8 +306,12 @@ class Gerrit:
         commit_msg = "Chore: Automation adds {}".format(filename)
         self.commit(commit_msg, issue_id, push=True)
 
-    def add_maven_config(self, fqdn, gerrit_project, issue_id, nexus3_url="", nexus3_ports=""):
-        """Add the four required JCasC files to create settings for a new project."""
+    def add_maven_config(self, fqdn, gerrit_project, issue_id, nexus3_url="", nexus3_ports="", commit=True):
+        """Add the four required JCasC files to create settings for a new project.
+
+        With commit=False, the files are only staged, to commit them along
+        other changes.
+        """
         project_dashed = gerrit_project.replace("/", "-")
         params_path = "config-params.yaml"
         creds_path = "serverCredentialMappings.yaml"
@@ -262,7 +373,7 @@ class Gerrit:
 
         config_path = "jenkins-config/managed-config-files/mavenSettings/{}-settings".format(project_dashed)
         try:
-            os.makedirs(config_path)
+            os.makedirs(os.path.join(self.repo.working_tree_dir, config_path))
         except FileExistsError:
             pass
 
@@ -276,5 +387,6 @@ class Gerrit:
         self.add_file(os.path.join(config_path, params_path), config_params_content)
         self.add_file(os.path.join(config_path, creds_path), server_creds_content)
 
-        commit_msg = "Chore: Automation adds {} config files".format(gerrit_project)
-        self.commit(commit_msg, issue_id, push=True)
+        if commit:
+            commit_msg = "Chore: Automation adds {} config files".format(gerrit_project)
+            self.commit(commit_msg, issue_id, push=True)
@@ -0,0 +1,173 @@
+# SPDX-License-Identifier: EPL-1.0
+##############################################################################
+# Copyright (c) 2026 The Linux Foundation and others.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+##############################################################################
+"""Onboard a batch of Gerrit projects described by a manifest.
+
+A manifest is a YAML file listing the projects to onboard:
+
+.. code-block:: yaml
+
+    jjbrepo: ci-management
+    issue_id: CIMAN-33
+    defaults:
+      github: true
+      maven: false
+    projects:
+      - name: foo/bar
+        ldap_group: foo-bar-committers
+        description: The foo bar project
+        agent: centos8-builder-2c-1g
+
+Missing projects are created with their SAML owner group, and optionally
+granted GitHub replication rights, concurrently. Each new project then gets
+a .gitreview, and the ci-management repo gets the INFO jobs, and maven
+settings if asked, of all the projects in a single change.
+"""
+
+import concurrent.futures
+import logging
+import threading
+
+import requests
+import yaml
+
+from lftools.api.endpoints import gerrit as gerrit_api
+from lftools.git.gerrit import Gerrit
+
+log = logging.getLogger(__name__)
+
+PROJECT_DEFAULTS = {"description": "", "github": False, "maven": False, "agent": None}
+
+
+def load_manifest(path):
+    """Return the settings and the projects of a manifest file.
+
+    The defaults of the manifest are applied to every project. Raise
+    ValueError if a project has no name or no ldap_group.
+    """
+    with open(path) as manifest_file:
+        manifest = yaml.safe_load(manifest_file) or {}
+    defaults = dict(PROJECT_DEFAULTS, **manifest.get("defaults", {}))
+    projects = []
+    for project in manifest.get("projects", []):
+        project = dict(defaults, **project)
+        for key in ("name", "ldap_group"):
+            if not project.get(key):
+                raise ValueError("Every project of {} needs a {}".format(path, key))
+        projects.append(project)
+    settings = {"jjbrepo": manifest.get("jjbrepo", "ci-management"), "issue_id": manifest.get("issue_id")}
+    return settings, projects
+
+
+def _result(project, step, ok=True, message=""):
+    return {"project": project, "step": step, "ok": ok, "message": message}
+
+
+def create_projects(fqdn, projects, existing, workers=4, creds=None):
+    """Create the missing projects concurrently, and return the step results.
+
+    Existing projects are left as they are, GitHub rights included.
+    Each worker has its own API session, as the endpoint methods change the
+    session headers.
+    """
+    local = threading.local()
+
+    def create(project):
+        if not hasattr(local, "api"):
+            local.api = gerrit_api.Gerrit(fqdn=fqdn, creds=creds) if creds else gerrit_api.Gerrit(fqdn=fqdn)
+        if project["name"] in existing:
+            return [_result(project["name"], "createproject", message="Already exists")]
+        results = []
+        steps = [
+            ("create-saml-group", local.api.create_saml_group, (fqdn, project["ldap_group"])),
+            (
+                "createproject",
+                local.api.create_project,
+                (fqdn, project["name"], project["ldap_group"], project["description"], False),
+            ),
+        ]
+        if project["github"]:
+            steps.append(("addgithubrights", local.api.add_github_rights, (fqdn, project["name"])))
+        for step, method, args in steps:
+            try:
+                method(*args)
+            except (requests.RequestException, LookupError, ValueError) as e:
+                results.append(_result(project["name"], step, False, "{}: {}".format(type(e).__name__, e)))
+                break
+            results.append(_result(project["name"], step))
+        return results
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        return [result for results in executor.map(create, projects) for result in results]
+
+
+def add_git_reviews(fqdn, projects, issue_id, workers=4):
+    """Push a .gitreview to every project concurrently, and return the step results."""
+
+    def add_git_review(project):
+        try:
+            git = Gerrit(fqdn=fqdn, project=project["name"], depth=1)
+            git.add_git_review(fqdn, project["name"], issue_id)
+        except Exception as e:
+            return _result(project["name"], "addgitreview", False, "{}: {}".format(type(e).__name__, e))
+        return _result(project["name"], "addgitreview")
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(add_git_review, projects))
+
+
+def add_ci_jobs(fqdn, jjbrepo, projects, issue_id):
+    """Add the jobs of all the projects to the ci-management repo in one change.
+
+    The repo is cloned once, shallow, and the change pushed once.
+    """
+    if not projects:
+        return []
+    names = [project["name"] for project in projects]
+    try:
+        git = Gerrit(fqdn=fqdn, project=jjbrepo, depth=1)
+        for project in projects:
+            git.add_info_job(fqdn, project["name"], issue_id, project["agent"], commit=False)
+            if project["maven"]:
+                git.add_maven_config(fqdn, project["name"], issue_id, commit=False)
+        if not git.repo.index.diff("HEAD"):
+            return [_result(name, jjbrepo, message="Already up to date") for name in names]
+        if len(names) == 1:
+            commit_msg = "Chore: Automation onboards {}".format(names[0])
+        else:
+            commit_msg = "Chore: Automation onboards {} projects\n\n{}".format(
+                len(names), "\n".join("- {}".format(name) for name in names)
+            )
+        git.commit(commit_msg, issue_id, push=True)
+    except Exception as e:
+        return [_result(name, jjbrepo, False, "{}: {}".format(type(e).__name__, e)) for name in names]
+    return [_result(name, jjbrepo) for name in names]
+
+
+def onboard(fqdn, manifest_path, workers=4, dry_run=False):
+    """Onboard the projects of a manifest, and return the result of every step.
+
+    A project whose creation fails is not onboarded further.
+    """
+    settings, projects = load_manifest(manifest_path)
+    existing = set(gerrit_api.Gerrit(fqdn=fqdn).list_projects())
+    if dry_run:
+        for project in projects:
+            state = "exists" if project["name"] in existing else "would be created"
+            log.info("{} {}".format(project["name"], state))
+        return []
+
+    results = create_projects(fqdn, projects, existing, workers)
+    failed = {result["project"] for result in results if not result["ok"]}
+    created = [p for p in projects if p["name"] not in failed and p["name"] not in existing]
+    results += add_git_reviews(fqdn, created, settings["issue_id"], workers)
+    results += add_ci_jobs(
+        fqdn, settings["jjbrepo"], [p for p in projects if p["name"] not in failed], settings["issue_id"]
+    )
+    return results
@@ -17,28 +17,90 @@ __author__ = "Andrew Grimberg"
 __license__ = "Apache 2.0"
 __copyright__ = "Copyright 2017 Andrew Grimberg"
 
+import concurrent.futures
 import json
 import logging
 import os
-import sys
+import tempfile
+import threading
+import time
 
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
 
+import lftools.api.client as client
+from lftools import config
+
 log = logging.getLogger(__name__)
 
+# Discovered REST API endpoints, per Nexus server.
+NEXUS_ENDPOINT_CACHE = os.path.join(os.path.dirname(config.LFTOOLS_CONFIG_FILE), "nexus_endpoints.json")
+NEXUS_ENDPOINT_CACHE_TTL = 24 * 60 * 60
+# Probed in order to discover the REST API endpoint, the first one which is
+# not a 404 gives the base URL.
+NEXUS_ENDPOINTS = [
+    "service/local/repo_targets",
+    "service/siesta/rest/beta/read-only",
+    "service/rest/beta/read-only",
+    "service/rest/v1/read-only",
+]
+
+# Same retry policy as the REST API clients.
+NEXUS_RETRY = client.RestApi.make_retry(client.DEFAULT_RETRIES, client.DEFAULT_BACKOFF_FACTOR)
+
+# Servers whose cached endpoint was checked again in this process.
+_checked_servers = set()
+_checked_servers_lock = threading.Lock()
+
+
+def _read_endpoint_cache():
+    """Return the endpoint cache as a dict, server url -> {"baseurl", "timestamp"}."""
+    try:
+        with open(NEXUS_ENDPOINT_CACHE, "r") as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+
+def _write_endpoint_cache(server, baseurl):
+    """Store the endpoint discovered for a server in the endpoint cache."""
+    cache = _read_endpoint_cache()
+    cache[server] = {"baseurl": baseurl, "timestamp": time.time()}
+    tmp_file = None
+    try:
+        os.makedirs(os.path.dirname(NEXUS_ENDPOINT_CACHE), exist_ok=True)
+        fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(NEXUS_ENDPOINT_CACHE), suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(cache, f)
+        os.replace(tmp_file, NEXUS_ENDPOINT_CACHE)
+    except (IOError, OSError) as e:
+        log.debug("Could not write Nexus endpoint cache {}: {}".format(NEXUS_ENDPOINT_CACHE, e))
+        if tmp_file and os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
 
 class Nexus:
-    """Nexus class to handle communicating with Nexus over a rest api."""
+    """Nexus class to handle communicating with Nexus over a rest api.
+
+    The REST API endpoint of the server is discovered on first use, and
+    cached per server in NEXUS_ENDPOINT_CACHE for NEXUS_ENDPOINT_CACHE_TTL
+    seconds. A cached endpoint is discovered again if a request returns 404
+    and the endpoint itself no longer answers.
+
+    Calling prefetch() starts a provisioning session: targets, privileges,
+    roles and users are downloaded once and looked up by name from then on.
+    """
 
     def __init__(self, baseurl=None, username=None, password=None):
         """Initialize Nexus instance."""
-        self.baseurl = baseurl
-        self.set_full_baseurl()
-        if self.baseurl.find("local") < 0:
-            self.version = 3
-        else:
-            self.version = 2
+        self.server = baseurl
+        self._baseurl = None
+        self._baseurl_from_cache = False
+        self._index = {}
+        self._index_lock = threading.Lock()
+        self.session = requests.Session()
+        self.set_pool_size(10)
 
         if username and password:
             self.add_credentials(username, password)
@@ -50,22 +112,122 @@ class Nexus:
             "Content-Type": "application/json",
         }
 
-    def set_full_baseurl(self):
-        """Find the correct REST API endpoint for this version of Nexus."""
-        endpoints = [
-            "service/local/repo_targets",
-            "service/siesta/rest/beta/read-only",
-            "service/rest/beta/read-only",
-            "service/rest/v1/read-only",
-        ]
-        for endpoint in endpoints:
-            url = os.path.join(self.baseurl, endpoint)
+    @property
+    def baseurl(self):
+        """REST API base URL, discovered on first use."""
+        if self._baseurl is None:
+            self.set_full_baseurl()
+        return self._baseurl
+
+    @baseurl.setter
+    def baseurl(self, url):
+        self._baseurl = url
+        self._baseurl_from_cache = False
+
+    @property
+    def version(self):
+        """Nexus major version, 2 or 3."""
+        if self.baseurl.find("local") < 0:
+            return 3
+        return 2
+
+    def set_full_baseurl(self, refresh=False):
+        """Find the correct REST API endpoint for this version of Nexus.
+
+        The endpoint is taken from the endpoint cache unless it is expired, or
+        refresh is set.
+        """
+        if not refresh:
+            cached = _read_endpoint_cache().get(self.server)
+            if cached and time.time() - cached["timestamp"] < NEXUS_ENDPOINT_CACHE_TTL:
+                log.debug("Using cached Nexus endpoint {}".format(cached["baseurl"]))
+                self._baseurl = cached["baseurl"]
+                self._baseurl_from_cache = True
+                return
+
+        for endpoint in NEXUS_ENDPOINTS:
+            url = os.path.join(self.server, endpoint)
             response = requests.get(url)
             if response.status_code != 404:
                 self.baseurl = os.path.dirname(url)
+                _write_endpoint_cache(self.server, self._baseurl)
                 return
         raise LookupError("Could not determine Nexus version")
 
+    def _cached_baseurl_is_stale(self):
+        """Return True if the cached base URL no longer answers.
+
+        A 404 usually means a missing repo or image, so the base URL is only
+        probed the first time, per process and server.
+        """
+        with _checked_servers_lock:
+            if self.server in _checked_servers:
+                return False
+            _checked_servers.add(self.server)
+        for endpoint in NEXUS_ENDPOINTS:
+            url = os.path.join(self.server, endpoint)
+            if os.path.dirname(url) == self._baseurl:
+                return requests.get(url).status_code == 404
+        return True
+
+    def _request(self, method, *path, **kwargs):
+        """Send a request to the REST API path below baseurl, return the response.
+
+        If the base URL came from the endpoint cache, the request returns 404
+        and the base URL itself is gone, the endpoint is discovered again and
+        the request retried once.
+        """
+        kwargs.setdefault("auth", self.auth)
+        kwargs.setdefault("headers", self.headers)
+        response = self.session.request(method, os.path.join(self.baseurl, *path), **kwargs)
+        if response.status_code == 404 and self._baseurl_from_cache and self._cached_baseurl_is_stale():
+            stale_baseurl = self._baseurl
+            self.set_full_baseurl(refresh=True)
+            if self._baseurl != stale_baseurl:
+                log.debug("Nexus endpoint moved from {} to {}".format(stale_baseurl, self._baseurl))
+                response = self.session.request(method, os.path.join(self.baseurl, *path), **kwargs)
+        return response
+
+    def prefetch(self, collections=("repo_targets", "privileges", "roles", "users")):
+        """Download targets, privileges, roles and users once, indexed by name.
+
+        Until the Nexus object is dropped, get_target, get_priv_by_name,
+        get_role and get_user use these indexes instead of downloading the
+        whole collection on every call, and the create_* methods add what
+        they create to them.
+
+        Return the downloaded objects, as a dict collection -> list.
+        """
+        keys = {"repo_targets": "name", "privileges": "name", "roles": "name", "users": "userId"}
+        objects = {}
+        for collection in collections:
+            objects[collection] = self._request("GET", collection).json()["data"]
+            index = {item[keys[collection]]: item.get("id", item[keys[collection]]) for item in objects[collection]}
+            with self._index_lock:
+                self._index[collection] = index
+                if collection == "roles":
+                    self._index["role_ids"] = set(index.values())
+        return objects
+
+    def _lookup(self, collection, name):
+        """Return the indexed ID of the named object, None if it is unknown."""
+        with self._index_lock:
+            return self._index[collection].get(name)
+
+    def _add_to_index(self, collection, name, object_id):
+        """Record an object created during a provisioning session."""
+        with self._index_lock:
+            if collection in self._index:
+                self._index[collection][name] = object_id
+                if collection == "roles":
+                    self._index["role_ids"].add(object_id)
+
+    def set_pool_size(self, pool_size):
+        """Keep up to pool_size connections open, for as many concurrent requests."""
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=NEXUS_RETRY)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
     def add_credentials(self, username, password):
         """Create an authentication object to be used."""
         self.auth = HTTPBasicAuth(username, password)
@@ -76,8 +238,13 @@ class Nexus:
 
     def get_target(self, name):
         """Get the ID of a given target name."""
-        url = os.path.join(self.baseurl, "repo_targets")
-        targets = requests.get(url, auth=self.auth, headers=self.headers).json()
+        if "repo_targets" in self._index:
+            target_id = self._lookup("repo_targets", name)
+            if target_id is None:
+                raise LookupError("No target found named '{}'".format(name))
+            return target_id
+
+        targets = self._request("GET", "repo_targets").json()
 
         for priv in targets["data"]:
             if priv["name"] == name:
@@ -86,8 +253,6 @@ class Nexus:
 
     def create_target(self, name, patterns):
         """Create a target with the given patterns."""
-        url = os.path.join(self.baseurl, "repo_targets")
-
         target = {
             "data": {
                 "contentClass": "any",
@@ -98,23 +263,47 @@ class Nexus:
 
         json_data = json.dumps(target).encode(encoding="utf-8")
 
-        r = requests.post(url, auth=self.auth, headers=self.headers, data=json_data)
+        r = self._request("POST", "repo_targets", data=json_data)
 
         if r.status_code != requests.codes.created:
             raise Exception("Target not created for '{}', code '{}'".format(name, r.status_code))
 
-        return r.json()["data"]["id"]
+        target_id = r.json()["data"]["id"]
+        self._add_to_index("repo_targets", name, target_id)
+        return target_id
+
+    def update_target(self, target_id, name, patterns):
+        """Replace the patterns of an existing target."""
+        target = {
+            "data": {
+                "id": target_id,
+                "contentClass": "any",
+                "patterns": patterns,
+                "name": name,
+            }
+        }
+
+        json_data = json.dumps(target).encode(encoding="utf-8")
+
+        r = self._request("PUT", "repo_targets", target_id, data=json_data)
+
+        if r.status_code != requests.codes.ok:
+            raise Exception("Target not updated for '{}', code '{}'".format(name, r.status_code))
 
     def get_priv(self, name, priv):
         """Get the ID for the privilege with the given name and privlege type."""
         search_name = "{} - ({})".format(name, priv)
-        self.get_priv_by_name(search_name)
+        return self.get_priv_by_name(search_name)
 
     def get_priv_by_name(self, name):
         """Get the ID for the privilege with the given name."""
-        url = os.path.join(self.baseurl, "privileges")
+        if "privileges" in self._index:
+            priv_id = self._lookup("privileges", name)
+            if priv_id is None:
+                raise LookupError("No privilege found named '{}'".format(name))
+            return priv_id
 
-        privileges = requests.get(url, auth=self.auth, headers=self.headers).json()
+        privileges = self._request("GET", "privileges").json()
 
         for priv in privileges["data"]:
             if priv["name"] == name:
@@ -132,8 +321,6 @@ class Nexus:
         delete
         update
         """
-        url = os.path.join(self.baseurl, "privileges_target")
-
         privileges = {
             "data": {
                 "name": name,
@@ -149,18 +336,27 @@ class Nexus:
         }
 
         json_data = json.dumps(privileges).encode(encoding="utf-8")
-        r = requests.post(url, auth=self.auth, headers=self.headers, data=json_data)
+        r = self._request("POST", "privileges_target", data=json_data)
         privileges = r.json()
 
         if r.status_code != requests.codes.created:
             raise Exception("Privilege not created for '{}', code '{}'".format(name, r.status_code))
 
-        return privileges["data"][0]["id"]
+        priv_id = privileges["data"][0]["id"]
+        self._add_to_index("privileges", "{} - ({})".format(name, priv), priv_id)
+        return priv_id
 
     def get_role(self, name):
         """Get the id of a role with a given name."""
-        url = os.path.join(self.baseurl, "roles")
-        roles = requests.get(url, auth=self.auth, headers=self.headers).json()
+        if "roles" in self._index:
+            role_id = self._lookup("roles", name)
+            if role_id is None and name in self._index["role_ids"]:
+                role_id = name
+            if role_id is None:
+                raise LookupError("No role with name '{}'".format(name))
+            return role_id
+
+        roles = self._request("GET", "roles").json()
 
         for role in roles["data"]:
             if role["name"] == name:
@@ -175,8 +371,6 @@ class Nexus:
 
     def create_role(self, name, privs, role_id="", description="", roles=[]):
         """Create a role with the given privileges."""
-        url = os.path.join(self.baseurl, "roles")
-
         role = {
             "data": {
                 "id": role_id if role_id else name,
@@ -191,7 +385,7 @@ class Nexus:
         json_data = json.dumps(role).encode(encoding="utf-8")
         log.debug("Sending role {} to Nexus".format(json_data))
 
-        r = requests.post(url, auth=self.auth, headers=self.headers, data=json_data)
+        r = self._request("POST", "roles", data=json_data)
 
         if r.status_code != requests.codes.created:
             if r.status_code == 400 and "errors" in r.json().keys():
@@ -205,12 +399,39 @@ class Nexus:
             else:
                 raise Exception("Role not created for '{}', code '{}'".format(role_id, r.status_code))
 
-        return r.json()["data"]["id"]
+        new_role_id = r.json()["data"]["id"]
+        self._add_to_index("roles", name, new_role_id)
+        return new_role_id
+
+    def update_role(self, role_id, name, privs, description="", roles=[]):
+        """Replace the privileges, roles and description of an existing role."""
+        role = {
+            "data": {
+                "id": role_id,
+                "name": name,
+                "description": description if description else name,
+                "privileges": privs,
+                "roles": ["repository-any-read"] + [r for r in roles if r != "repository-any-read"],
+                "sessionTimeout": 60,
+            }
+        }
+
+        json_data = json.dumps(role).encode(encoding="utf-8")
+        log.debug("Sending role {} to Nexus".format(json_data))
+
+        r = self._request("PUT", "roles", role_id, data=json_data)
+
+        if r.status_code != requests.codes.ok:
+            raise Exception("Role not updated for '{}', code '{}'".format(role_id, r.status_code))
 
     def get_user(self, user_id):
         """Determine if a user with a given userId exists."""
-        url = os.path.join(self.baseurl, "users")
-        users = requests.get(url, auth=self.auth, headers=self.headers).json()
+        if "users" in self._index:
+            if self._lookup("users", user_id) is None:
+                raise LookupError("No user with id '{}'".format(user_id))
+            return
+
+        users = self._request("GET", "users").json()
 
         for user in users["data"]:
             if user["userId"] == user_id:
@@ -223,8 +444,6 @@ class Nexus:
 
         User is created with the nx-deployment role attached
         """
-        url = os.path.join(self.baseurl, "users")
-
         user = {
             "data": {
                 "userId": name,
@@ -245,16 +464,24 @@ class Nexus:
 
         json_data = json.dumps(user).encode(encoding="utf-8")
 
-        user = requests.post(url, auth=self.auth, headers=self.headers, data=json_data)
+        user = self._request("POST", "users", data=json_data)
 
         if user.status_code != requests.codes.created:
             raise Exception("User not created for '{}', code '{}'".format(name, user.status_code))
+        self._add_to_index("users", name, name)
+
+    def update_user(self, user):
+        """Replace an existing user with the given user data, as returned by Nexus."""
+        json_data = json.dumps({"data": user}).encode(encoding="utf-8")
+
+        r = self._request("PUT", "users", user["userId"], data=json_data)
+
+        if r.status_code != requests.codes.ok:
+            raise Exception("User not updated for '{}', code '{}'".format(user["userId"], r.status_code))
 
     def get_repo_group(self, name):
         """Get the repository ID for a repo group that has a specific name."""
-        url = os.path.join(self.baseurl, "repo_groups")
-
-        repos = requests.get(url, auth=self.auth, headers=self.headers).json()
+        repos = self._request("GET", "repo_groups").json()
 
         for repo in repos["data"]:
             if repo["name"] == name:
@@ -264,69 +491,62 @@ class Nexus:
 
     def get_repo_group_details(self, repoId):
         """Get the current configuration of a given repo group with a specific ID."""
-        url = os.path.join(self.baseurl, "repo_groups", repoId)
-
-        return requests.get(url, auth=self.auth, headers=self.headers).json()["data"]
+        return self._request("GET", "repo_groups", repoId).json()["data"]
 
     def update_repo_group_details(self, repoId, data):
         """Update the given repo group with new configuration."""
-        url = os.path.join(self.baseurl, "repo_groups", repoId)
-
         repo = {"data": data}
 
         json_data = json.dumps(repo).encode(encoding="utf-8")
 
-        requests.put(url, auth=self.auth, headers=self.headers, data=json_data)
+        self._request("PUT", "repo_groups", repoId, data=json_data)
 
-    def get_all_images(self, repo):
-        """Get a list of all images in the given repository."""
-        url = "%s/search?repository=%s" % (self.baseurl, repo)
-        url_attr = requests.get(url)
-        if url_attr:
-            result = url_attr.json()
-            items = result["items"]
-            cont_token = result["continuationToken"]
-        else:
-            log.error("{} returned {}".format(url, str(url_attr)))
-            sys.exit(1)
+    def _search_page(self, params):
+        """Return the items and continuation token of a page of search results.
 
-        # Check if there are multiple pages of data
-        while cont_token:
-            continue_url = "%s&continuationToken=%s" % (url, cont_token)
-            url_attr = requests.get(continue_url)
-            result = url_attr.json()
-            items += result["items"]
-            cont_token = result["continuationToken"]
+        Raise requests.HTTPError if the search fails.
+        """
+        response = self._request("GET", "search", params=params)
+        if not response:
+            raise requests.HTTPError("{} returned {}".format(response.url, str(response)), response=response)
+        result = response.json()
+        return result["items"], result["continuationToken"]
+
+    def iter_images(self, repo, pattern=None):
+        """Yield the images in the given repository, matching the pattern if given.
+
+        Images are yielded as the pages of search results arrive, and the next
+        page is downloaded while the caller processes the current one. Raise
+        requests.HTTPError if a page can not be downloaded.
+        """
+        params = {"repository": repo}
+        if pattern is not None:
+            params["q"] = pattern
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            page = executor.submit(self._search_page, dict(params))
+            while page is not None:
+                items, cont_token = page.result()
+                page = None
+                if cont_token:
+                    page = executor.submit(self._search_page, dict(params, continuationToken=cont_token))
+                for item in items:
+                    yield item
 
-        return items
+    def get_all_images(self, repo):
+        """Get a list of all images in the given repository."""
+        return list(self.iter_images(repo))
 
     def search_images(self, repo, pattern):
         """Find all images in the given repository matching the pattern."""
-        url = "{}/search?q={}&repository={}".format(self.baseurl, pattern, repo)
-        url_attr = requests.get(url)
-        if url_attr:
-            result = url_attr.json()
-            items = result["items"]
-            cont_token = result["continuationToken"]
-        else:
-            log.error("{} returned {}".format(url, str(url_attr)))
-            sys.exit(1)
-
-        # Check if there are multiple pages of data
-        while cont_token:
-            continue_url = "%s&continuationToken=%s" % (url, cont_token)
-            url_attr = requests.get(continue_url)
-            result = url_attr.json()
-            items += result["items"]
-            cont_token = result["continuationToken"]
-
-        return items
+        return list(self.iter_images(repo, pattern))
 
     def delete_image(self, image):
-        """Delete an image from the repo, using the id field."""
-        url = os.path.join(self.baseurl, "components", image["id"])
+        """Delete an image from the repo, using the id field.
+
+        Raise requests.HTTPError if Nexus does not confirm the deletion.
+        """
         log.info("Deleting {}:{}".format(image["name"], image["version"]))
-        url_attr = requests.delete(url, auth=self.auth)
+        url_attr = self._request("DELETE", "components", image["id"], headers=None)
         if url_attr.status_code != 204:
-            log.error("{} returned {}".format(url, str(url_attr)))
-            sys.exit(1)
+            raise requests.HTTPError("{} returned {}".format(url_attr.url, str(url_attr)), response=url_attr)
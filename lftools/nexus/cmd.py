@@ -10,8 +10,13 @@
 ##############################################################################
 """Contains functions for various Nexus tasks."""
 
+import concurrent.futures
 import configparser
+import contextlib
 import csv
+import gzip
+import itertools
+import json
 import logging
 import re
 import sys
@@ -23,7 +28,9 @@ import requests
 import yaml
 
 from lftools import config
-from lftools.nexus import Nexus, util
+from lftools.nexus import Nexus
+from lftools.nexus import plan as nexus_plan
+from lftools.nexus import retention, util
 
 log = logging.getLogger(__name__)
 
@@ -112,15 +119,37 @@ def reorder_staged_repos(settings_file):
     _nexus.update_repo_group_details(repo_id, repo_update)
 
 
-def create_repos(config_file, settings_file, url):
+def _apply_plan(_nexus, plan, show_plan=False, workers=4):
+    """Print the plan as JSON if show_plan is set, apply it otherwise."""
+    if show_plan:
+        print(plan.to_json())
+        return
+
+    if not plan.changes:
+        log.info("Nexus is already up to date.")
+        return
+
+    log.warning("Applying {} Nexus changes. Aborting now could leave tasks undone!".format(len(plan.changes)))
+    failed = nexus_plan.apply_plan(_nexus, plan, workers)
+    if failed:
+        log.error("{} of {} Nexus changes failed.".format(len(failed), len(plan.changes)))
+        sys.exit(1)
+
+
+def create_repos(config_file, settings_file, url, workers=4, show_plan=False):
     """Create repositories as defined by configuration file.
 
+    The targets, privileges, roles and users of the repositories are compared
+    with Nexus, and only the missing or different ones are created or updated.
+
     :arg str config_file: Configuration file containing repository definitions that
         will be used to create the new Nexus repositories.
     :arg str settings: Settings file containing administrative credentials and
         information.
     :arg str url: url in the format https:// user nad password will be taken from lftools
     if url is provided.
+    :arg int workers: Number of Nexus changes applied in parallel.
+    :arg bool show_plan: Print the changes as JSON instead of applying them.
     """
     if not settings_file:
         from lftools import config
@@ -151,97 +180,21 @@ def create_repos(config_file, settings_file, url):
     else:
         _nexus = Nexus(url, username, password)
 
-    def create_nexus_perms(name, targets, email, password, extra_privs=[]):
-        # Create target
-        try:
-            target_id = _nexus.get_target(name)
-        except LookupError:
-            target_id = _nexus.create_target(name, targets)
-
-        # Create privileges
-        privs_set = [
-            "create",
-            "delete",
-            "read",
-            "update",
-        ]
-
-        privs = {}
-        for priv in privs_set:
-            try:
-                privs[priv] = _nexus.get_priv(name, priv)
-                log.info("Creating {} privileges.".format(priv))
-            except LookupError:
-                privs[priv] = _nexus.create_priv(name, target_id, priv)
-
-        # Create Role
-        try:
-            role_id = _nexus.get_role(name)
-            log.info("Role {} already exists.".format(role_id))
-        except LookupError:
-            role_id = _nexus.create_role(name, privs)
+    plan = nexus_plan.make_plan(_nexus, nexus_plan.desired_repos(config))
+    _apply_plan(_nexus, plan, show_plan, workers)
 
-        # Create user
-        try:
-            _nexus.get_user(name)
-            log.info("User {} already exists.".format(name))
-        except LookupError:
-            _nexus.create_user(name, email, role_id, password, extra_privs)
-
-    def build_repo(repo, repoId, config, base_groupId, global_privs, email_domain, strict=True):
-        log.info("-> Building for {}.{} in Nexus".format(base_groupId, repo))
-        groupId = "{}.{}".format(base_groupId, repo)
-        target = util.create_repo_target_regex(groupId, strict)
-
-        if not global_privs and "extra_privs" not in config:
-            extra_privs = []
-        elif global_privs:
-            extra_privs = global_privs
-            if "extra_privs" in config:
-                extra_privs += config["extra_privs"]
-            log.info("Privileges for this repo:" + ", ".join(extra_privs))
-        elif "extra_privs" in config:
-            extra_privs = config["extra_privs"]
-            log.info("Privileges for this repo:" + ", ".join(extra_privs))
-
-        create_nexus_perms(repoId, [target], email_domain, config["password"], extra_privs)
-
-        log.info("-> Finished successfully for {}.{}!!\n".format(base_groupId, repo))
-
-        if "repositories" in config:
-            for sub_repo in config["repositories"]:
-                sub_repo_id = "{}-{}".format(repoId, sub_repo)
-                build_repo(sub_repo, sub_repo_id, config["repositories"][sub_repo], groupId, extra_privs, email_domain)
-
-    log.warning("Nexus repo creation started. Aborting now could leave tasks undone!")
-    if "global_privs" in config:
-        global_privs = config["global_privs"]
-    else:
-        global_privs = []
-    if "strict_url_regex" in config:
-        strict = config["strict_url_regex"]
-    else:
-        strict = True
-
-    for repo in config["repositories"]:
-        build_repo(
-            repo,
-            repo,
-            config["repositories"][repo],
-            config["base_groupId"],
-            global_privs,
-            config["email_domain"],
-            strict,
-        )
 
-
-def create_roles(config_file, settings_file):
+def create_roles(config_file, settings_file, show_plan=False):
     """Create Nexus roles as defined by configuration file.
 
+    Only the missing roles are created, and the roles which differ from the
+    configuration updated.
+
     :arg str config: Configuration file containing role definitions that
         will be used to create the new Nexus roles.
     :arg str settings: Settings file containing administrative credentials and
         information.
+    :arg bool show_plan: Print the changes as JSON instead of applying them.
     """
     with open(config_file, "r") as f:
         config = yaml.safe_load(f)
@@ -266,36 +219,20 @@ def create_roles(config_file, settings_file):
                 )
                 sys.exit(1)
 
-        subrole_ids = []
-        for subrole in config[role]["roles"]:
-            subrole_id = _nexus.get_role(subrole)
-            subrole_ids.append(subrole_id)
-        config[role]["roles"] = subrole_ids
+    plan = nexus_plan.make_plan(_nexus, nexus_plan.desired_roles(config))
+    _apply_plan(_nexus, plan, show_plan)
 
-        if "description" not in config[role]:
-            config[role]["description"] = config[role]["name"]
 
-        if "privileges" in config[role]:
-            priv_ids = []
-            for priv in config[role]["privileges"]:
-                priv_ids.append(_nexus.get_priv_by_name(priv))
-            config[role]["privileges"] = priv_ids
-        else:
-            config[role]["privileges"] = []
+def iter_search(settings_file, url, repo, pattern, keys=None):
+    """Yield the images in the repo matching the pattern, as Nexus returns them.
 
-    for role in config:
-        _nexus.create_role(
-            config[role]["name"], config[role]["privileges"], role, config[role]["description"], config[role]["roles"]
-        )
-
-
-def search(settings_file, url, repo, pattern):
-    """Return of list of images in the repo matching the pattern.
+    Only the name, version and id of the images are kept, or the given keys.
 
     :arg str settings_file: Path to yaml file with Nexus settings.
     :arg str url: Nexus URL. Overrides settings.yaml.
     :arg str repo: The Nexus repository to audit.
     :arg str pattern: The pattern to search for in repo.
+    :arg list keys: Component keys to keep, images lacking one are skipped.
     """
     if not url and settings_file:
         url = get_url(settings_file)
@@ -313,59 +250,215 @@ def search(settings_file, url, repo, pattern):
         pattern = ""
     pattern = pattern.replace("\\", "")
 
-    all_images = _nexus.search_images(repo, pattern)
-
     # Ensure all of our images has a value for each of the keys we will use
-    included_keys = ["name", "version", "id"]
-    images = []
-    for image in all_images:
-        if set(included_keys).issubset(image):
-            # Keep only the keys we're using
-            restricted_image = {}
-            for key in included_keys:
-                restricted_image[key] = image[key]
-            images.append(restricted_image)
-    return images
-
-
-def output_images(images, csv_path=None):
-    """Output a list of images to stdout, or a provided file path.
-
-    This method expects a list of dicts with, at a minimum, "name", "version",
-    and "id" fields defined in each.
-    :arg list images: Images to output.
+    included_keys = keys or ["name", "version", "id"]
+    try:
+        for image in _nexus.iter_images(repo, pattern):
+            if set(included_keys).issubset(image):
+                # Keep only the keys we're using
+                yield {key: image[key] for key in included_keys}
+    except requests.HTTPError as e:
+        log.error(e)
+        sys.exit(1)
+
+
+def search(settings_file, url, repo, pattern):
+    """Return of list of images in the repo matching the pattern.
+
+    :arg str settings_file: Path to yaml file with Nexus settings.
+    :arg str url: Nexus URL. Overrides settings.yaml.
+    :arg str repo: The Nexus repository to audit.
+    :arg str pattern: The pattern to search for in repo.
+    """
+    return list(iter_search(settings_file, url, repo, pattern))
+
+
+def _open_output(path):
+    """Open a text file for writing, gzip compressed if path ends with .gz."""
+    if path.endswith(".gz"):
+        return gzip.open(path, "wt", newline="")
+    return open(path, "w", newline="")
+
+
+def output_images(images, csv_path=None, jsonl_path=None, columns=None):
+    """Output images to stdout, or to CSV and JSON lines files.
+
+    This method expects an iterable of dicts with, at a minimum, "name",
+    "version", and "id" fields defined in each. Images are written as they
+    come, so a generator such as iter_search() is never held in memory, and
+    they are only logged one by one if no file is written.
+    :arg iterable images: Images to output.
     :arg str csv_path: Path to write out csv file of matching images.
+    :arg str jsonl_path: Path to write out a JSON object per line per image.
+    :arg list columns: Keys of the images to write, all of them by default.
+    Files whose path ends with .gz are gzip compressed.
     """
-    if not images:
+    images = iter(images)
+    first_image = next(images, None)
+    if first_image is None:
         log.warning("{}.{} called with empty images list".format(__name__, sys._getframe().f_code.co_name))
         return
-    count = len(images)
-    included_keys = images[0].keys()
-
-    if csv_path:
-        with open(csv_path, "wb") as out_file:
-            dw = csv.DictWriter(out_file, fieldnames=included_keys, quoting=csv.QUOTE_ALL)
+    if not columns:
+        columns = list(first_image.keys())
+
+    with contextlib.ExitStack() as stack:
+        writers = []
+        if csv_path:
+            out_file = stack.enter_context(_open_output(csv_path))
+            dw = csv.DictWriter(out_file, fieldnames=columns, quoting=csv.QUOTE_ALL, extrasaction="ignore")
             dw.writeheader()
-            for image in images:
-                dw.writerow({k: v for k, v in image.items() if k in included_keys})
-
-    for image in images:
-        log.info("Name: {}\nVersion: {}\nID: {}\n\n".format(image["name"], image["version"], image["id"]))
+            writers.append(dw.writerow)
+        if jsonl_path:
+            jsonl_file = stack.enter_context(_open_output(jsonl_path))
+            writers.append(lambda image: jsonl_file.write(json.dumps({k: image.get(k) for k in columns}) + "\n"))
+
+        count = 0
+        for image in itertools.chain([first_image], images):
+            for write in writers:
+                write(image)
+            if not writers:
+                log.info(
+                    "Name: {}\nVersion: {}\nID: {}\n\n".format(image.get("name"), image.get("version"), image.get("id"))
+                )
+            count += 1
     log.info("Found {} images matching the query".format(count))
 
 
-def delete_images(settings_file, url, images):
+def _read_checkpoint(checkpoint):
+    """Return the IDs of the images a previous delete_images() run deleted."""
+    try:
+        with open(checkpoint, "r") as f:
+            return set(line.strip() for line in f if line.strip())
+    except IOError:
+        return set()
+
+
+def delete_images(settings_file, url, images, workers=8, checkpoint=None):
     """Delete all images in a list.
 
+    Images are deleted concurrently, and transient errors retried. A failure
+    does not stop the other deletions, the failures are all reported at the
+    end.
+
     :arg str settings_file: Path to yaml file with Nexus settings.
     :arg list images: List of images to delete.
+    :arg int workers: Number of images deleted in parallel.
+    :arg str checkpoint: Optional file recording the IDs of deleted images.
+        Images it lists are skipped, so an interrupted run can be resumed.
     """
     credentials = get_credentials(settings_file, url)
 
     _nexus = Nexus(credentials["nexus"], credentials["user"], credentials["password"])
+    _nexus.set_pool_size(workers)
 
-    for image in images:
-        _nexus.delete_image(image)
+    done = _read_checkpoint(checkpoint) if checkpoint else set()
+    pending = [image for image in images if image["id"] not in done]
+    if len(pending) < len(images):
+        log.info("Skipping {} images already deleted according to {}".format(len(images) - len(pending), checkpoint))
+
+    def delete_image(image):
+        try:
+            _nexus.delete_image(image)
+        except requests.HTTPError as e:
+            # Already gone, most likely deleted by an interrupted run.
+            if e.response is None or e.response.status_code != 404:
+                raise
+
+    failed = []
+    with contextlib.ExitStack() as stack:
+        checkpoint_file = stack.enter_context(open(checkpoint, "a")) if checkpoint else None
+        executor = stack.enter_context(concurrent.futures.ThreadPoolExecutor(max_workers=workers))
+        futures = {executor.submit(delete_image, image): image for image in pending}
+        for future in concurrent.futures.as_completed(futures):
+            image = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                failed.append((image, e))
+                continue
+            if checkpoint_file:
+                checkpoint_file.write("{}\n".format(image["id"]))
+                checkpoint_file.flush()
+
+    log.info("Deleted {} of {} images".format(len(pending) - len(failed), len(pending)))
+    if failed:
+        log.error("Failed to delete {} images:".format(len(failed)))
+        for image, error in sorted(failed, key=lambda f: (f[0]["name"], f[0]["version"])):
+            log.error("  {}:{} ({}): {}".format(image["name"], image["version"], image["id"], error))
+        sys.exit(1)
+
+
+def prune_images(
+    settings_file,
+    url,
+    repo,
+    pattern,
+    keep_newest=None,
+    keep_days=None,
+    scheme="semver",
+    dry_run=False,
+    workers=8,
+    checkpoint=None,
+    confirm=None,
+):
+    """Delete the images in the repo which the retention policy expires.
+
+    The repo is listed as a stream, the versions of each image are ordered
+    according to the version scheme, and the newest keep_newest versions,
+    as well as the versions younger than keep_days, are kept.
+
+    :arg str settings_file: Path to yaml file with Nexus settings.
+    :arg str url: Nexus URL. Overrides settings.yaml.
+    :arg str repo: The Nexus repository to prune.
+    :arg str pattern: Only consider the images matching this pattern.
+    :arg int keep_newest: Number of newest versions of each image to keep.
+    :arg int keep_days: Keep the versions younger than this number of days.
+    :arg str scheme: Version scheme, one of retention.VERSION_SCHEMES.
+    :arg bool dry_run: Only report what would be deleted.
+    :arg int workers: Number of images deleted in parallel.
+    :arg str checkpoint: See delete_images().
+    :arg callable confirm: Called with the number of expired images, the
+        deletion only happens if it returns True.
+    """
+    credentials = get_credentials(settings_file, url)
+    _nexus = Nexus(credentials["nexus"], credentials["user"], credentials["password"])
+
+    pattern = (pattern or "").replace("\\", "")
+    try:
+        images = retention.apply_retention(
+            _nexus.iter_images(repo, pattern), keep_newest=keep_newest, keep_days=keep_days, scheme=scheme
+        )
+    except requests.HTTPError as e:
+        log.error(e)
+        sys.exit(1)
+
+    expired = []
+    for name, (kept, image_expired) in images.items():
+        log.info(
+            "{}: keeping {}, deleting {} ({})".format(
+                name,
+                len(kept),
+                len(image_expired),
+                util.format_bytes(sum(retention.component_size(c) for c in image_expired)),
+            )
+        )
+        for component in image_expired:
+            log.debug("  {}:{}".format(name, component["version"]))
+        expired.extend(image_expired)
+
+    reclaimed = sum(retention.component_size(c) for c in expired)
+    log.info(
+        "{} {} of {} images, {} of assets".format(
+            "Would delete" if dry_run else "Deleting",
+            len(expired),
+            sum(len(k) + len(e) for k, e in images.values()),
+            util.format_bytes(reclaimed),
+        )
+    )
+    if dry_run or not expired:
+        return
+    if confirm is None or confirm(len(expired)):
+        delete_images(settings_file, url, expired, workers, checkpoint)
 
 
 def get_activity_text(act):
@@ -0,0 +1,262 @@
+# -*- code: utf-8 -*-
+# SPDX-License-Identifier: EPL-1.0
+##############################################################################
+# Copyright (c) 2026 The Linux Foundation and others.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+##############################################################################
+"""Plan and apply Nexus 2 repository and role configurations.
+
+A plan lists the changes needed to bring Nexus in line with a repo or role
+config file. It is computed from a single download of each object collection,
+so an up to date Nexus costs a handful of requests, and only the changes are
+applied.
+"""
+
+import concurrent.futures
+import json
+import logging
+
+from lftools.nexus import util
+
+log = logging.getLogger(__name__)
+
+CHANGE_TYPES = ["target", "privilege", "role", "user"]
+PRIVILEGE_METHODS = ["create", "delete", "read", "update"]
+PAST_TENSE = {"create": "Created", "update": "Updated"}
+
+
+class Plan:
+    """Changes bringing Nexus in line with a desired state.
+
+    Targets and privileges are referenced by name in the changes, their
+    Nexus IDs are kept in target_ids and privilege_ids, and filled in as
+    they are created.
+    """
+
+    def __init__(self):
+        """Initialize an empty plan."""
+        self.changes = []
+        self.target_ids = {}
+        self.privilege_ids = {}
+
+    def to_json(self):
+        """Return the changes as a JSON document, without passwords."""
+        changes = [dict(c, password="********") if "password" in c else c for c in self.changes]
+        return json.dumps({"changes": changes}, indent=2)
+
+
+def _change_key(change):
+    """Return the name used to report a change."""
+    return change.get("id", change.get("name"))
+
+
+def desired_repos(config):
+    """Return the objects a repo config describes.
+
+    The result is a dict type -> {key: object}, see CHANGE_TYPES. Each
+    repository gets a target, its four privileges, a role and a deployment
+    user, and sub-repositories inherit the extra privileges of their parent.
+    """
+    desired = {change_type: {} for change_type in CHANGE_TYPES}
+
+    def add_repo(repo, repo_id, repo_config, base_group_id, global_privs, strict=True):
+        group_id = "{}.{}".format(base_group_id, repo)
+        extra_privs = list(global_privs) + repo_config.get("extra_privs", [])
+
+        desired["target"][repo_id] = {
+            "name": repo_id,
+            "patterns": [util.create_repo_target_regex(group_id, strict)],
+        }
+        privs = []
+        for method in PRIVILEGE_METHODS:
+            priv_name = "{} - ({})".format(repo_id, method)
+            desired["privilege"][priv_name] = {
+                "name": priv_name,
+                "base_name": repo_id,
+                "target": repo_id,
+                "method": method,
+            }
+            privs.append(priv_name)
+        desired["role"][repo_id] = {
+            "id": repo_id,
+            "name": repo_id,
+            "description": repo_id,
+            "privileges": privs,
+            "roles": [],
+        }
+        desired["user"][repo_id] = {
+            "id": repo_id,
+            "email_domain": config["email_domain"],
+            "password": repo_config["password"],
+            "role": repo_id,
+            "extra_roles": extra_privs,
+        }
+
+        for sub_repo, sub_config in repo_config.get("repositories", {}).items():
+            add_repo(sub_repo, "{}-{}".format(repo_id, sub_repo), sub_config, group_id, extra_privs)
+
+    for repo, repo_config in config["repositories"].items():
+        add_repo(
+            repo,
+            repo,
+            repo_config,
+            config["base_groupId"],
+            config.get("global_privs", []),
+            config.get("strict_url_regex", True),
+        )
+    return desired
+
+
+def desired_roles(config):
+    """Return the objects a role config describes, see desired_repos()."""
+    desired = {change_type: {} for change_type in CHANGE_TYPES}
+    for role_id, role in config.items():
+        desired["role"][role_id] = {
+            "id": role_id,
+            "name": role["name"],
+            "description": role.get("description", role["name"]),
+            "privileges": role.get("privileges", []),
+            "roles": role["roles"],
+        }
+    return desired
+
+
+def make_plan(nexus, desired):
+    """Compare the desired objects with Nexus, and return the Plan to apply.
+
+    Only the collections the desired objects need are downloaded. Raise
+    LookupError if a role or privilege is referenced but does not exist,
+    and is not part of the desired objects.
+    """
+    collections = []
+    if desired["target"] or desired["privilege"]:
+        collections.append("repo_targets")
+    if desired["privilege"] or any(role["privileges"] for role in desired["role"].values()):
+        collections.append("privileges")
+    if desired["role"] or desired["user"]:
+        collections.append("roles")
+    if desired["user"]:
+        collections.append("users")
+    current = nexus.prefetch(collections)
+
+    plan = Plan()
+    plan.target_ids = {target["name"]: target["id"] for target in current.get("repo_targets", [])}
+    plan.privilege_ids = {priv["name"]: priv["id"] for priv in current.get("privileges", [])}
+    targets = {target["name"]: target for target in current.get("repo_targets", [])}
+    roles = {role["id"]: role for role in current.get("roles", [])}
+    users = {user["userId"]: user for user in current.get("users", [])}
+    desired_role_names = {role["name"]: role["id"] for role in desired["role"].values()}
+
+    def role_ref(name):
+        """Resolve a role name or ID to a role ID, like Nexus.get_role()."""
+        if name in desired_role_names:
+            return desired_role_names[name]
+        try:
+            return nexus.get_role(name)
+        except LookupError:
+            if name in desired["role"]:
+                return name
+            raise
+
+    for name, target in desired["target"].items():
+        existing = targets.get(name)
+        if existing is None:
+            plan.changes.append(dict(target, action="create", type="target"))
+        elif sorted(existing.get("patterns", [])) != sorted(target["patterns"]):
+            plan.changes.append(dict(target, action="update", type="target", id=existing["id"]))
+
+    for name, priv in desired["privilege"].items():
+        if name not in plan.privilege_ids:
+            plan.changes.append(dict(priv, action="create", type="privilege"))
+
+    for role_id, role in desired["role"].items():
+        for priv in role["privileges"]:
+            if priv not in plan.privilege_ids and priv not in desired["privilege"]:
+                raise LookupError("No privilege found named '{}'".format(priv))
+        role = dict(role, roles=[role_ref(r) for r in role["roles"]])
+        existing = roles.get(role_id)
+        if existing is None:
+            plan.changes.append(dict(role, action="create", type="role"))
+        elif (
+            existing["name"] != role["name"]
+            or existing.get("description", "") != role["description"]
+            or set(existing.get("privileges", [])) != {plan.privilege_ids.get(p) for p in role["privileges"]}
+            or set(existing.get("roles", [])) != set(["repository-any-read"] + role["roles"])
+        ):
+            plan.changes.append(dict(role, action="update", type="role"))
+
+    for user_id, user in desired["user"].items():
+        user = dict(user, extra_roles=[role_ref(r) for r in user["extra_roles"]])
+        existing = users.get(user_id)
+        if existing is None:
+            plan.changes.append(dict(user, action="create", type="user"))
+            continue
+        user_roles = [user["role"], "nx-deployment"] + user["extra_roles"]
+        if set(existing.get("roles", [])) != set(user_roles):
+            plan.changes.append(
+                {"action": "update", "type": "user", "id": user_id, "data": dict(existing, roles=user_roles)}
+            )
+
+    return plan
+
+
+def _apply_change(nexus, plan, change):
+    """Apply a single change of the plan."""
+    if change["type"] == "target":
+        if change["action"] == "create":
+            plan.target_ids[change["name"]] = nexus.create_target(change["name"], change["patterns"])
+        else:
+            nexus.update_target(change["id"], change["name"], change["patterns"])
+    elif change["type"] == "privilege":
+        target_id = plan.target_ids[change["target"]]
+        plan.privilege_ids[change["name"]] = nexus.create_priv(change["base_name"], target_id, change["method"])
+    elif change["type"] == "role":
+        privs = [plan.privilege_ids[p] for p in change["privileges"]]
+        if change["action"] == "create":
+            nexus.create_role(change["name"], privs, change["id"], change["description"], change["roles"])
+        else:
+            nexus.update_role(change["id"], change["name"], privs, change["description"], change["roles"])
+    elif change["type"] == "user":
+        if change["action"] == "create":
+            nexus.create_user(
+                change["id"], change["email_domain"], change["role"], change["password"], change["extra_roles"]
+            )
+        else:
+            nexus.update_user(change["data"])
+    log.info("{} {} {}".format(PAST_TENSE[change["action"]], change["type"], _change_key(change)))
+
+
+def apply_plan(nexus, plan, workers=4):
+    """Apply the changes of a plan, and return the changes which failed.
+
+    Changes are applied by type, targets first and users last, and the
+    changes of one type concurrently. A role including another role created
+    by the same plan is applied after it.
+    """
+    failed = []
+    for change_type in CHANGE_TYPES:
+        pending = [c for c in plan.changes if c["type"] == change_type]
+        while pending:
+            creating = {c["id"] for c in pending if c["type"] == "role" and c["action"] == "create"}
+            batch = [c for c in pending if c["type"] != "role" or not (set(c["roles"]) & (creating - {c["id"]}))]
+            if not batch:
+                # Roles including each other, Nexus will refuse some of them.
+                batch = pending
+            pending = [c for c in pending if c not in batch]
+
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {executor.submit(_apply_change, nexus, plan, change): change for change in batch}
+                for future in concurrent.futures.as_completed(futures):
+                    change = futures[future]
+                    try:
+                        future.result()
+                    except Exception as e:
+                        log.error(
+                            "Could not {} {} {}: {}".format(change["action"], change["type"], _change_key(change), e)
+                        )
+                        failed.append(change)
+    return failed
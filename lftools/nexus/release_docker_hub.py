@@ -40,33 +40,48 @@ lftools nexus docker releasedockerhub
 """
 from __future__ import print_function
 
+import itertools
 import json
 import logging
 import multiprocessing
 import os
 import re
 import socket
+import threading
 import time
 from multiprocessing.dummy import Pool as ThreadPool
+from urllib.parse import urljoin
 
 import docker
 import requests
 import tqdm
 import urllib3
+from requests.adapters import HTTPAdapter
 
-log = logging.getLogger(__name__)
+from lftools.nexus.util import format_bytes
 
-NexusCatalog = []
-projects = []
-TotTagsToBeCopied = 0
+log = logging.getLogger(__name__)
 
-NEXUS3_BASE = ""
-NEXUS3_CATALOG = ""
-NEXUS3_PROJ_NAME_HEADER = ""
-DOCKER_PROJ_NAME_HEADER = ""
-VERSION_REGEXP = ""
+NEXUS3_PROJ_NAME_HEADER = "Nexus3 Project Name"
+DOCKER_PROJ_NAME_HEADER = "Docker HUB Project Name"
 DEFAULT_REGEXP = r"^\d+.\d+.\d+$"
 
+DOCKER_REGISTRY_BASE = "https://registry-1.docker.io"
+DOCKER_AUTH_URL = "https://auth.docker.io/token?service=registry.docker.io&scope=repository:{}:pull"
+MANIFEST_ACCEPT = ", ".join(
+    [
+        "application/vnd.docker.distribution.manifest.v2+json",
+        "application/vnd.docker.distribution.manifest.list.v2+json",
+        "application/vnd.oci.image.manifest.v1+json",
+        "application/vnd.oci.image.index.v1+json",
+    ]
+)
+# Bytes downloaded from Nexus3 to measure the throughput, if not given.
+THROUGHPUT_SAMPLE_BYTES = 8 * 1024 * 1024
+
+# Run context used by the module functions when none is given, see initialize.
+_default_context = None
+
 
 def _remove_http_from_url(url):
     """Remove http[s]:// from url."""
@@ -85,68 +100,243 @@ def _format_image_id(id):
         return id
 
 
-def _request_get(url):
-    """Execute a request get, return the resp."""
+def _request(method, url, session=None, **kwargs):
+    """Execute a request, return the resp.
+
+    The request is done through session if given, to reuse its connections.
+    Any connection issue is raised as a requests.HTTPError.
+    """
     resp = {}
+    requester = requests.request if session is None else session.request
     try:
-        resp = requests.get(url)
+        resp = requester(method, url, **kwargs)
     except requests.exceptions.RequestException as excinfo:
-        log.debug("in _request_get RequestException. {}".format(type(excinfo)))
+        log.debug("in _request RequestException. {}".format(type(excinfo)))
         raise requests.HTTPError("Issues with URL: {} - {}".format(url, type(excinfo)))
     except socket.gaierror as excinfo:
-        log.debug("in _request_get gaierror. {}".format(type(excinfo)))
+        log.debug("in _request gaierror. {}".format(type(excinfo)))
         raise requests.HTTPError("Issues with URL: {} - {}".format(url, type(excinfo)))
     except requests.exceptions.ConnectionError as excinfo:
-        log.debug("in _request_get ConnectionError. {}".format(type(excinfo)))
+        log.debug("in _request ConnectionError. {}".format(type(excinfo)))
         raise requests.HTTPError("Issues with URL: {} - {}".format(url, type(excinfo)))
     except urllib3.exceptions.NewConnectionError as excinfo:
-        log.debug("in _request_get NewConnectionError. {}".format(type(excinfo)))
+        log.debug("in _request NewConnectionError. {}".format(type(excinfo)))
         raise requests.HTTPError("Issues with URL: {} - {}".format(url, type(excinfo)))
     except urllib3.exceptions.MaxRetryError as excinfo:
-        log.debug("in _request_get MaxRetryError. {}".format(type(excinfo)))
+        log.debug("in _request MaxRetryError. {}".format(type(excinfo)))
         raise requests.HTTPError("Issues with URL: {} - {}".format(url, type(excinfo)))
     return resp
 
 
-def which_version_regexp_to_use(input_regexp_or_filename):
-    """Set version regexp as per user request.
+def _request_get(url, session=None, **kwargs):
+    """Execute a request get, return the resp."""
+    return _request("GET", url, session, **kwargs)
+
+
+def _registry_next_url(resp):
+    """Return the absolute URL of the next page of a Registry v2 listing.
+
+    The Docker Registry v2 API paginates _catalog and tags/list through a
+    Link header, for instance
+        Link: </v2/_catalog?last=onap%2Faaf%2Fsms&n=100>; rel="next"
+    Returns None if this is the last page.
+    """
+    next_link = resp.links.get("next")
+    if not next_link:
+        return None
+    return urljoin(resp.url, next_link["url"])
+
+
+def _registry_pages(url, key, retries=1, session=None):
+    """Generator yielding the list stored under key for each page of a listing.
+
+    Follows the Registry v2 Link header pagination, and parses each page as
+    JSON, so pages can be processed as soon as they arrive.
+
+    Each page request is attempted up to retries times when the connection
+    fails. A requests.HTTPError is raised if a page can not be fetched, or if
+    the registry answers with anything but 200.
+
+    Parameters:
+        url     : First page of the listing, for instance
+                  https://nexus3.onap.org:10002/v2/_catalog
+        key     : JSON key holding the page entries ("repositories" or "tags")
+        retries : Number of attempts per page.
+        session : Optional requests.Session to fetch the pages with.
+    """
+    while url:
+        attempt = 1
+        while True:
+            try:
+                r = _request_get(url, session)
+                break
+            except requests.HTTPError as excinfo:
+                log.debug("Fetching {} attempt {}. {}".format(url, attempt, excinfo))
+                if attempt >= retries:
+                    raise
+                attempt = attempt + 1
+
+        log.debug("r.status_code = {}, ok={}".format(r.status_code, r.status_code == requests.codes.ok))
+        if r.status_code != requests.codes.ok:
+            raise requests.HTTPError("Issues with URL: {} - status {}".format(url, r.status_code), response=r)
+        try:
+            entries = r.json().get(key) or []
+        except ValueError as excinfo:
+            raise requests.HTTPError("Issues with URL: {} - {}".format(url, excinfo), response=r)
+        yield entries
+        url = _registry_next_url(r)
+
+
+def _read_version_regexps(input_regexp_or_filename):
+    r"""Return the list of version regexps as per user request.
 
     regexp is either a regexp to be directly used, or its a file name,
-    and the file contains the regexp to use
+    and the file contains the regexp to use.
+
+    The file may contain several regexps, one per row, in which case a tag
+    is valid if it matches any of them. For instance release, STAGING and
+    SNAPSHOT versions
+        ^\d+.\d+.\d+$
+        ^\d+.\d+.\d+-STAGING-(20\d{2})(\d{2})(\d{2})T([01]\d|2[0-3])([0-5]\d)([0-5]\d)Z$
+        ^\d+.\d+.\d+-SNAPSHOT-(20\d{2})(\d{2})(\d{2})T([01]\d|2[0-3])([0-5]\d)([0-5]\d)Z$
     """
-    global VERSION_REGEXP
     if len(input_regexp_or_filename) == 0:
-        VERSION_REGEXP = DEFAULT_REGEXP
-    else:
-        isFile = os.path.isfile(input_regexp_or_filename)
-        if isFile:
-            with open(input_regexp_or_filename, "r") as fp:
-                VERSION_REGEXP = fp.readline().strip()
-        else:
-            VERSION_REGEXP = input_regexp_or_filename
+        return [DEFAULT_REGEXP]
+    if os.path.isfile(input_regexp_or_filename):
+        with open(input_regexp_or_filename, "r") as fp:
+            return [line.strip() for line in fp if len(line.strip()) > 0]
+    return [input_regexp_or_filename]
 
 
-def validate_regexp():
-    global VERSION_REGEXP
-    try:
-        re.compile(VERSION_REGEXP)
-        is_valid = True
-    except re.error:
-        is_valid = False
-    return is_valid
+def validate_regexp(context=None):
+    """Return True if all version regexps of the run context compiled."""
+    return _get_context(context).tag_classifier is not None
 
 
 def initialize(org_name, input_regexp_or_filename=""):
-    """Set constant strings."""
-    global NEXUS3_BASE
-    global NEXUS3_CATALOG
-    global NEXUS3_PROJ_NAME_HEADER
-    global DOCKER_PROJ_NAME_HEADER
-    NEXUS3_BASE = "https://nexus3.{}.org:10002".format(org_name)
-    NEXUS3_CATALOG = NEXUS3_BASE + "/v2/_catalog"
-    NEXUS3_PROJ_NAME_HEADER = "Nexus3 Project Name"
-    DOCKER_PROJ_NAME_HEADER = "Docker HUB Project Name"
-    which_version_regexp_to_use(input_regexp_or_filename)
+    """Set the default run context.
+
+    The module functions use the default run context when they are not
+    given one. Each call starts a new one, with empty catalog and project
+    lists. Returns the default run context.
+    """
+    global _default_context
+    _default_context = ReleaseContextClass(org_name, input_regexp_or_filename)
+    return _default_context
+
+
+def _get_context(context):
+    """Return context, or the default run context if context is None."""
+    if context is None:
+        return _default_context
+    return context
+
+
+def new_session(nbr_runs=1):
+    """Return a requests session with connection pools sized for the worker threads.
+
+    Run contexts given the same session share its connection pools, so the
+    pools are sized for the worker threads of nbr_runs concurrent runs.
+    """
+    # Every worker thread talks to both Nexus3 and Docker Hub.
+    pool_size = 2 * multiprocessing.cpu_count() * nbr_runs
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def sorted_tags(tags):
+    """Return tags sorted in version order, 1.9.0 before 1.10.0."""
+
+    def _tag_key(tag):
+        return [(0, int(part), "") if part.isdigit() else (1, 0, part) for part in re.split(r"(\d+)", tag)]
+
+    return sorted(tags, key=_tag_key)
+
+
+class TagClassifierClass:
+    r"""Compiled version regexps, shared by all tag classes.
+
+    The regexps are compiled once, in initialize, and used to classify the
+    tags of every project, from both Nexus3 and Docker Hub.
+    A tag is valid if it matches any of the regexps.
+
+    Parameter:
+        regexps : List of version regexps. (['^\d+.\d+.\d+$'])
+    """
+
+    def __init__(self, regexps):
+        """Initialize this class. Raises re.error for a faulty regexp."""
+        self.patterns = [re.compile(regexp) for regexp in regexps]
+
+    def is_valid(self, tag):
+        """Return True if the tag matches any of the version regexps."""
+        for pattern in self.patterns:
+            if pattern.match(tag):
+                return True
+        return False
+
+    def classify(self, tags):
+        """Split tags into a set of valid tags and a set of invalid tags."""
+        valid = set()
+        invalid = set()
+        for tag in tags:
+            if self.is_valid(tag):
+                valid.add(tag)
+            else:
+                invalid.add(tag)
+        return valid, invalid
+
+
+class ReleaseContextClass:
+    """State of a releasedockerhub run, for one organization.
+
+    This class owns the Nexus3 URLs, the compiled version regexps, the
+    Nexus3 catalog and the projects of a run, instead of module globals.
+    The catalog and project lists are updated under a lock, as they are
+    filled from worker threads. Each organization gets its own context, so
+    one process can sync several organizations at the same time, and
+    contexts given the same session share its connection pools.
+
+    Parameter:
+        org_name  : The organization to sync. (onap)
+        input_regexp_or_filename : Version regexp, or a file with regexps.
+        session   : Optional requests.Session used for all registry requests.
+        nexus_catalog : Optional list to collect the selected Nexus3 projects in.
+        projects  : Optional list to collect the ProjectClass instances in.
+    """
+
+    def __init__(self, org_name, input_regexp_or_filename="", session=None, nexus_catalog=None, projects=None):
+        """Initialize this class."""
+        self.org_name = org_name
+        self.nexus3_base = "https://nexus3.{}.org:10002".format(org_name)
+        self.nexus3_catalog = self.nexus3_base + "/v2/_catalog"
+        self.version_regexps = _read_version_regexps(input_regexp_or_filename)
+        self.version_regexp = "|".join(self.version_regexps)
+        try:
+            self.tag_classifier = TagClassifierClass(self.version_regexps)
+        except re.error as excinfo:
+            log.debug("Version regexp >>{}<< does not compile. {}".format(self.version_regexp, excinfo))
+            self.tag_classifier = None
+        self.session = session
+        self.nexus_catalog = nexus_catalog if nexus_catalog is not None else []
+        self.projects = projects if projects is not None else []
+        self.project_max_len_chars = 0
+        self._lock = threading.Lock()
+
+    def add_catalog_project(self, project):
+        """Add a selected Nexus3 project ['org', 'repo', 'dockername'] to the catalog."""
+        with self._lock:
+            self.nexus_catalog.append(project)
+            if len(project[1]) > self.project_max_len_chars:
+                self.project_max_len_chars = len(project[1])
+
+    def add_project(self, proj):
+        """Add a ProjectClass instance to the projects."""
+        with self._lock:
+            self.projects.append(proj)
 
 
 class TagClass:
@@ -155,18 +345,22 @@ class TagClass:
     This class contains the actual valid and invalid tags for a repository,
     as well as an indication if the repository exist or not.
 
-    A valid tag has the following format #.#.# (1.2.3, or 1.22.333)
+    A valid tag has the following format #.#.# (1.2.3, or 1.22.333), or
+    matches the version regexps given to initialize.
+    The tags are kept in sets, use sorted_tags to get them in version order.
 
     Parameter:
         org_name  : The organization part of the repository. (onap)
         repo_name : The Nexus3 repository name (aaf/aaf_service)
         repo_from_file : Repository name was taken from input file.
+        context   : Run context, default is the one set by initialize.
     """
 
-    def __init__(self, org_name, repo_name, repo_from_file):
+    def __init__(self, org_name, repo_name, repo_from_file, context=None):
         """Initialize this class."""
-        self.valid = []
-        self.invalid = []
+        self.context = _get_context(context)
+        self.valid = set()
+        self.invalid = set()
         self.repository_exist = True
         self.org = org_name
         self.repo = repo_name
@@ -177,25 +371,25 @@ class TagClass:
 
         Returns true or false, depending if the version pattern is a valid one.
         Valid pattern is #.#.#, or in computer term "^\d+.\d+.\d+$"
-
-        Future pattern : x.y.z-KEYWORD-yyyymmddThhmmssZ
-          where keyword = STAGING or SNAPSHOT
-          '^\d+.\d+.\d+-(STAGING|SNAPSHOT)-(20\d{2})(\d{2})(\d{2})T([01]\d|2[0-3])([0-5]\d)([0-5]\d)Z$'
         """
-        pattern = re.compile(r"{}".format(VERSION_REGEXP))
-        log.debug("validate tag {} in {} --> {}".format(check_tag, self.repo, pattern.match(check_tag)))
-        return pattern.match(check_tag)
+        return self.context.tag_classifier.is_valid(check_tag)
 
     def add_tag(self, new_tag):
-        """Add tag to a list.
+        """Add tag to a set.
 
-        This function will take a tag, and add it to the correct list
+        This function will take a tag, and add it to the correct set
         (valid or invalid), depending on validate_tag result.
         """
         if self._validate_tag(new_tag):
-            self.valid.append(new_tag)
+            self.valid.add(new_tag)
         else:
-            self.invalid.append(new_tag)
+            self.invalid.add(new_tag)
+
+    def add_tags(self, new_tags):
+        """Add several tags at once to the valid and invalid sets."""
+        valid, invalid = self.context.tag_classifier.classify(new_tags)
+        self.valid.update(valid)
+        self.invalid.update(invalid)
 
 
 class NexusTagClass(TagClass):
@@ -212,6 +406,7 @@ class NexusTagClass(TagClass):
 
     When we fetch the tags from the Nexus3 repository url, they are returned like
         {"name":"onap/aaf/aaf_service","tags":["2.1.1","2.1.3","2.1.4","2.1.5"]}
+    possibly split over several pages linked through the Link header.
     Hence, we need to extract all the tags, and add them to our list of valid or
     invalid tags.
     If we fail to collect the tags, we set the repository_exist flag to false.
@@ -220,47 +415,29 @@ class NexusTagClass(TagClass):
         org_name  : The organization part of the repository. (onap)
         repo_name : The Nexus3 repository name (aaf/aaf_service)
         repo_from_file : The reponame came from an input file.
+        context   : Run context, default is the one set by initialize.
 
     Result:
         Will fetch all tags from the Nexus3 repository URL, and store each tag
-        in self.valid or self.invalid as a list.
+        in self.valid or self.invalid as a set.
         If no repository is found, self.repository_exist will be set to False.
     """
 
-    def __init__(self, org_name, repo_name, repo_from_file):
+    def __init__(self, org_name, repo_name, repo_from_file, context=None):
         """Initialize this class."""
-        TagClass.__init__(self, org_name, repo_name, repo_from_file)
-        retries = 0
+        TagClass.__init__(self, org_name, repo_name, repo_from_file, context)
         # Default to <org>/<repo>
         org_repo_name = "{}/{}".format(org_name, repo_name)
         if repo_from_file:
             org_repo_name = "{}".format(repo_name)
         log.debug("Fetching nexus3 tags for {}".format(org_repo_name))
-        while retries < 20:
-            try:
-                r = _request_get(NEXUS3_BASE + "/v2/" + org_repo_name + "/tags/list")
-                break
-            except requests.HTTPError as excinfo:
-                log.debug("Fetching Nexus3 tags. {}".format(excinfo))
-                retries = retries + 1
-                if retries > 19:
-                    self.repository_exist = False
-                    return
-
-        log.debug("r.status_code = {}, ok={}".format(r.status_code, r.status_code == requests.codes.ok))
-        if r.status_code == requests.codes.ok:
-            raw_tags = r.text
-            raw_tags = raw_tags.replace('"', "")
-            raw_tags = raw_tags.replace("}", "")
-            raw_tags = raw_tags.replace("]", "")
-            raw_tags = raw_tags.replace(" ", "")
-            raw_tags = raw_tags.split("[")
-            TmpSplittedTags = raw_tags[1].split(",")
-            if len(TmpSplittedTags) > 0:
-                for tag_2_add in TmpSplittedTags:
-                    self.add_tag(tag_2_add)
-                    log.debug("Nexus {} has tag {}".format(org_repo_name, tag_2_add))
-        else:
+        try:
+            tags_url = self.context.nexus3_base + "/v2/" + org_repo_name + "/tags/list"
+            for page in _registry_pages(tags_url, "tags", retries=20, session=self.context.session):
+                self.add_tags(page)
+                log.debug("Nexus {} has tags {}".format(org_repo_name, page))
+        except requests.HTTPError as excinfo:
+            log.debug("Fetching Nexus3 tags. {}".format(excinfo))
             self.repository_exist = False
 
 
@@ -291,18 +468,19 @@ class DockerTagClass(TagClass):
         org_name  : The organization part of the repository. (onap)
         repo_name : The Docker Hub repository name (aaf-aaf_service)
         repo_from_file : The reponame came from an input file.
+        context   : Run context, default is the one set by initialize.
 
     Result:
         Will fetch all tags from the Docker Repository URL, and store each tag
-        in self.valid or self.invalid as a list.
+        in self.valid or self.invalid as a set.
         If no repository is found, self.repository_exist will be set to False.
     """
 
     _docker_base_start = "https://registry.hub.docker.com/v2/namespaces/"
 
-    def __init__(self, org_name, repo_name, repo_from_file):
+    def __init__(self, org_name, repo_name, repo_from_file, context=None):
         """Initialize this class."""
-        TagClass.__init__(self, org_name, repo_name, repo_from_file)
+        TagClass.__init__(self, org_name, repo_name, repo_from_file, context)
         if repo_from_file:
             combined_repo_name = repo_name
         else:
@@ -317,7 +495,7 @@ class DockerTagClass(TagClass):
             while retries < 20:
                 try:
                     log.debug("URL={}".format(docker_tag_url))
-                    r = _request_get(docker_tag_url)
+                    r = _request_get(docker_tag_url, self.context.session)
                     if r.status_code == 429:
                         # Docker returns 429 if we access it too fast too many times.
                         # If it happends, delay 60 seconds, and try again, up to 19 times.
@@ -343,10 +521,9 @@ class DockerTagClass(TagClass):
                 raw_json = json.loads(r.text)
 
                 try:
-                    for result in raw_json["results"]:
-                        tag_name = result["name"]
-                        self.add_tag(tag_name)
-                        log.debug("Docker {} has tag {}".format(combined_repo_name, tag_name))
+                    tag_names = [result["name"] for result in raw_json["results"]]
+                    self.add_tags(tag_names)
+                    log.debug("Docker {} has tags {}".format(combined_repo_name, tag_names))
 
                     if raw_json["next"]:
                         docker_tag_url = raw_json["next"]
@@ -369,6 +546,8 @@ class ProjectClass:
     Parameters:
         nexus_proj :  list with ['org', 'repo', 'dockername']
             ['onap', 'aaf/aaf_service', 'aaf-aaf_service']
+        docker_client : Optional docker client, default is docker.from_env()
+        context :  Run context, default is the one set by initialize.
 
     Upon class Initialize the following happens.
       * Set Nexus and Docker repository names.
@@ -378,8 +557,9 @@ class ProjectClass:
     Main external function is docker_pull_tag_push
     """
 
-    def __init__(self, nexus_proj, docker_client=None):
+    def __init__(self, nexus_proj, docker_client=None, context=None):
         """Initialize this class."""
+        self.context = _get_context(context)
         self.org_name = nexus_proj[0]
         self.nexus_repo_name = nexus_proj[1]
         repo_from_file = len(nexus_proj[2]) > 0
@@ -387,9 +567,9 @@ class ProjectClass:
             self.docker_repo_name = nexus_proj[2].strip()
         else:
             self._set_docker_repo_name(self.nexus_repo_name)
-        self.nexus_tags = NexusTagClass(self.org_name, self.nexus_repo_name, repo_from_file)
-        self.docker_tags = DockerTagClass(self.org_name, self.docker_repo_name, repo_from_file)
-        self.tags_2_copy = TagClass(self.org_name, self.nexus_repo_name, repo_from_file)
+        self.nexus_tags = NexusTagClass(self.org_name, self.nexus_repo_name, repo_from_file, self.context)
+        self.docker_tags = DockerTagClass(self.org_name, self.docker_repo_name, repo_from_file, self.context)
+        self.tags_2_copy = TagClass(self.org_name, self.nexus_repo_name, repo_from_file, self.context)
         self._populate_tags_to_copy()
         self.docker_client = docker_client if docker_client is not None else docker.from_env()
 
@@ -426,11 +606,9 @@ class ProjectClass:
             )
         )
 
-        if len(self.nexus_tags.valid) > 0:
-            for nexustag in self.nexus_tags.valid:
-                if nexustag not in self.docker_tags.valid:
-                    log.debug("Need to copy tag {} from {}".format(nexustag, self.nexus_repo_name))
-                    self.tags_2_copy.add_tag(nexustag)
+        missing_tags = self.nexus_tags.valid - self.docker_tags.valid
+        log.debug("Need to copy tags {} from {}".format(sorted_tags(missing_tags), self.nexus_repo_name))
+        self.tags_2_copy.valid.update(missing_tags)
 
     def _pull_tag_push_msg(self, info_text, count, retry_text="", progbar=False):
         """Print a formated message using log.info."""
@@ -491,8 +669,8 @@ class ProjectClass:
         if len(self.tags_2_copy.valid) == 0:
             return
 
-        for tag in self.tags_2_copy.valid:
-            org_path = _remove_http_from_url(NEXUS3_BASE)
+        for tag in sorted_tags(self.tags_2_copy.valid):
+            org_path = _remove_http_from_url(self.context.nexus3_base)
             nexus_image_str = "{}/{}/{}:{}".format(org_path, self.org_name, self.nexus_repo_name, tag)
             log.debug("Nexus Image Str = {}".format(nexus_image_str))
             for stage in ["pull", "tag", "push", "cleanup"]:
@@ -529,52 +707,122 @@ class ProjectClass:
                         raise requests.HTTPError(retry_text)
 
 
-def repo_is_in_file(check_repo="", repo_file_name=""):
-    """Function to verify of a repo name exists in a file name.
-
-    The file contains rows of repo names to be included.
-        acumos-portal-fe
-        acumos/acumos-axure-client
+def load_repo_file(repo_file_name=""):
+    """Load the repo file into a dictionary, Nexus3 repo name -> docker name.
 
-    Function will return True if a match is found
+    The file contains rows of repo names to be included, with their Docker
+    Hub name.
+        onap/aaf/aaf_core; onap/aaf-aaf_core
+        onap/clamp; onap/clamp
 
+    The whole file is validated up front. A ValueError is raised listing all
+    rows missing either name. Empty rows are ignored, and for duplicated
+    Nexus3 repo names the first row is used, as earlier rows always won.
     """
+    repo_index = {}
+    bad_rows = []
     with open("{}".format(repo_file_name)) as f:
-        for line in f.readlines():
+        for row_nbr, line in enumerate(f, start=1):
             row = line.rstrip()
-            reponame = row.split(";")[0]
-            log.debug("Comparing {} with {} from file".format(check_repo, reponame))
-            if check_repo == reponame:
-                log.debug("Found a match")
-                return True
-    log.debug("NO match found")
-    return False
+            if len(row.strip()) == 0:
+                continue
+            fields = row.split(";")
+            reponame = fields[0]
+            dockername = fields[1].strip() if len(fields) > 1 else ""
+            if len(reponame.strip()) == 0 or len(dockername) == 0:
+                bad_rows.append("{}: {}".format(row_nbr, row))
+                continue
+            if reponame in repo_index:
+                log.warning(
+                    "Repo {} is listed more than once in {}, row {} ignored".format(reponame, repo_file_name, row_nbr)
+                )
+                continue
+            repo_index[reponame] = dockername
+    if bad_rows:
+        raise ValueError(
+            "Rows in {} not following 'Nexus3 repo; dockername' syntax:\n  {}".format(
+                repo_file_name, "\n  ".join(bad_rows)
+            )
+        )
+    return repo_index
 
 
-def get_docker_name_from_file(check_repo="", repo_file_name=""):
-    """Function to verify of a repo name exists in a file name.
+def _filter_catalog_entry(word, org_name, find_pattern, exact_match, repo_index=None):
+    """Return the project for a Nexus3 catalog entry, or None if not selected.
 
-    The file contains rows of repo names to be included.
-        acumos-portal-fe
-        acumos/acumos-axure-client
+    The project is a list with ['org', 'repo', 'dockername'].
+    If repo_index is given, it is the result of load_repo_file.
+    """
+    if repo_index is not None and word in repo_index:
+        return [org_name, word, repo_index[word]]
+    if word.startswith(org_name):
+        # Remove org_name/ from word, so we only get repository left
+        project = [org_name, word[len(org_name) + 1 :], ""]
+        # If a specific search string has been specified, search for it
+        # Empty string will match all words
+        if word.find(find_pattern) >= 0 and not exact_match:
+            return project
+        if exact_match and project[1] == find_pattern:
+            return project
+    return None
+
+
+def _log_catalog_request(org_name, find_pattern, exact_match, repo_is_filename, context=None):
+    """Log which Nexus3 projects are about to be collected."""
+    _get_context(context).project_max_len_chars = 0
+    containing_str = ""
+    if len(find_pattern) > 0:
+        containing_str = ', and containing "{}"'.format(find_pattern)
+    if exact_match:
+        containing_str = ', and reponame = "{}"'.format(find_pattern)
+    if repo_is_filename:
+        containing_str = ', and repos are found in "{}"'.format(find_pattern)
+    info_str = "Collecting information from Nexus from projects with org = {}".format(org_name)
+    log.info("{}{}.".format(info_str, containing_str))
+
+
+def nexus3_catalog_pages(org_name="", find_pattern="", exact_match=False, repo_is_filename=False, context=None):
+    """Generator yielding the selected Nexus3 projects, one catalog page at a time.
 
-    Function will return True if a match is found
+    Each catalog page is filtered as soon as it arrives, and the selected
+    projects are added to the run context catalog before the page is yielded. This lets
+    the tag fetching start before the whole catalog is downloaded.
 
+    See get_nexus3_catalog for the parameters.
+    A requests.HTTPError is raised if the catalog can not be fetched, and a
+    ValueError if the repo file is malformed.
     """
-    with open("{}".format(repo_file_name)) as f:
-        for line in f.readlines():
-            row = line.rstrip()
-            reponame = row.split(";")[0]
-            dockername = row.split(";")[1]
-            log.debug("Comparing {} with {} from file".format(check_repo, reponame))
-            if check_repo == reponame:
-                log.debug("Found a match")
-                return dockername
-    log.debug("NO match found")
-    return ""
+    context = _get_context(context)
+    repo_index = None
+    if repo_is_filename:
+        repo_index = load_repo_file(find_pattern)
+    nbr_entries = 0
+    nbr_selected = 0
+    found_in_file = set()
+    for page in _registry_pages(context.nexus3_catalog, "repositories", session=context.session):
+        selected = []
+        for word in page:
+            project = _filter_catalog_entry(word, org_name, find_pattern, exact_match, repo_index)
+            if project is None:
+                continue
+            if repo_index is not None and word in repo_index:
+                found_in_file.add(word)
+            context.add_catalog_project(project)
+            selected.append(project)
+            log.debug("Added project {} to my list".format(project[1]))
+        nbr_entries = nbr_entries + len(page)
+        nbr_selected = nbr_selected + len(selected)
+        yield selected
+    if repo_index is not None:
+        for reponame in repo_index:
+            if reponame not in found_in_file:
+                log.warning("Repo {} from {} is not in the Nexus3 catalog".format(reponame, find_pattern))
+    log.debug(
+        "# TmpCatalog {}, NexusCatalog {}, DIFF = {}".format(nbr_entries, nbr_selected, nbr_entries - nbr_selected)
+    )
 
 
-def get_nexus3_catalog(org_name="", find_pattern="", exact_match=False, repo_is_filename=False):
+def get_nexus3_catalog(org_name="", find_pattern="", exact_match=False, repo_is_filename=False, context=None):
     """Main function to collect all Nexus3 repositories.
 
     This function will collect the Nexus catalog for all projects starting with
@@ -589,6 +837,9 @@ def get_nexus3_catalog(org_name="", find_pattern="", exact_match=False, repo_is_
         "onap/aaf/aaf-base-xenial","onap/aaf/aaf_agent","onap/aaf/aaf_cass",
         "onap/aaf/aaf_cm","onap/aaf/aaf_config","onap/aaf/aaf_core"]}
 
+    Large catalogs are split over several pages, linked through the Link
+    header, and all pages are collected.
+
     Nexus3 catalog starts with <org_name>/<repo name>
 
     Parameters:
@@ -602,79 +853,50 @@ def get_nexus3_catalog(org_name="", find_pattern="", exact_match=False, repo_is_
         exact_match     : If specified, find_pattern is a unique repo name
         repo_is_filename: If specified, find_pattern is a filename, which contains a repo name per row
                             org_name is irrelevant in this case
+        context         : Run context, default is the one set by initialize.
 
     """
-    global NexusCatalog
-    global project_max_len_chars
-
-    project_max_len_chars = 0
-    containing_str = ""
-    if len(find_pattern) > 0:
-        containing_str = ', and containing "{}"'.format(find_pattern)
-    if exact_match:
-        containing_str = ', and reponame = "{}"'.format(find_pattern)
-    if repo_is_filename:
-        containing_str = ', and repos are found in "{}"'.format(find_pattern)
-    info_str = "Collecting information from Nexus from projects with org = {}".format(org_name)
-    log.info("{}{}.".format(info_str, containing_str))
-
+    _log_catalog_request(org_name, find_pattern, exact_match, repo_is_filename, context)
     try:
-        r = _request_get(NEXUS3_CATALOG)
+        for _ in nexus3_catalog_pages(org_name, find_pattern, exact_match, repo_is_filename, context):
+            pass
     except requests.HTTPError as excinfo:
         log.info("Fetching Nexus3 catalog. {}".format(excinfo))
         return False
-
-    log.debug("r.status_code = {}, ok={}".format(r.status_code, r.status_code == requests.codes.ok))
-    if r.status_code == requests.codes.ok:
-        raw_catalog = r.text
-        raw_catalog = raw_catalog.replace('"', "")
-        raw_catalog = raw_catalog.replace(" ", "")
-        raw_catalog = raw_catalog.replace("}", "")
-        raw_catalog = raw_catalog.replace("[", "")
-        raw_catalog = raw_catalog.replace("]", "")
-        raw_catalog = raw_catalog.split(":")
-        TmpCatalog = raw_catalog[1].split(",")
-        for word in TmpCatalog:
-            # Remove all projects that do not start with org_name
-            use_this_repo = False
-            if repo_is_filename and repo_is_in_file(word, find_pattern):
-                use_this_repo = True
-                project = [org_name, word, get_docker_name_from_file(word, find_pattern)]
-            else:
-                if word.startswith(org_name):
-                    # Remove org_name/ from word, so we only get repository left
-                    project = [org_name, word[len(org_name) + 1 :], ""]
-                    # If a specific search string has been specified, search for it
-                    # Empty string will match all words
-                    if word.find(find_pattern) >= 0 and not exact_match:
-                        use_this_repo = True
-                    if exact_match and project[1] == find_pattern:
-                        use_this_repo = True
-            if use_this_repo:
-                NexusCatalog.append(project)
-                log.debug("Added project {} to my list".format(project[1]))
-                if len(project[1]) > project_max_len_chars:
-                    project_max_len_chars = len(project[1])
-        log.debug(
-            "# TmpCatalog {}, NexusCatalog {}, DIFF = {}".format(
-                len(TmpCatalog), len(NexusCatalog), len(TmpCatalog) - len(NexusCatalog)
-            )
-        )
+    except ValueError as excinfo:
+        log.error(excinfo)
+        return False
     return True
 
 
-def fetch_all_tags(progbar=False, docker_client=None):
+def fetch_all_tags(progbar=False, docker_client=None, catalog=None, context=None):
     """Fetch all tags function.
 
     This function will use multi-threading to fetch all tags for all projects in
     Nexus3 Catalog.
+
+    If catalog is given, it is an iterable of projects, which is consumed while
+    the tags are fetched. This is used to start fetching tags while the
+    remaining Nexus3 catalog pages are still being downloaded. Any exception
+    raised by the catalog, like a requests.HTTPError for a catalog page, is
+    raised once the tags already queued are fetched.
     """
-    NbrProjects = len(NexusCatalog)
-    log.info(
-        "Fetching tags from Nexus3 and Docker Hub for {} projects with version regexp >>{}<<".format(
-            NbrProjects, VERSION_REGEXP
+    context = _get_context(context)
+    if catalog is None:
+        catalog = context.nexus_catalog
+        NbrProjects = len(context.nexus_catalog)
+        log.info(
+            "Fetching tags from Nexus3 and Docker Hub for {} projects with version regexp >>{}<<".format(
+                NbrProjects, context.version_regexp
+            )
+        )
+    else:
+        NbrProjects = None
+        log.info(
+            "Fetching tags from Nexus3 and Docker Hub for the catalog projects with version regexp >>{}<<".format(
+                context.version_regexp
+            )
         )
-    )
     if progbar:
         pbar = tqdm.tqdm(total=NbrProjects, bar_format="{l_bar}{bar}|{n_fmt}/{total_fmt} [{elapsed}]")
 
@@ -689,28 +911,32 @@ def fetch_all_tags(progbar=False, docker_client=None):
                 proj : Tuple with 'org' and 'repo'
                     ('onap', 'aaf/aaf_service')
         """
-        new_proj = ProjectClass(proj, docker_client)
-        projects.append(new_proj)
+        new_proj = ProjectClass(proj, docker_client, context)
+        context.add_project(new_proj)
         if progbar:
             pbar.update(1)
 
     pool = ThreadPool(multiprocessing.cpu_count())
-    pool.map(_fetch_all_tags, NexusCatalog)
-    pool.close()
-    pool.join()
-
-    if progbar:
-        pbar.close()
-    projects.sort()
+    try:
+        # A catalog page failing to download is raised here, from the catalog.
+        for _ in pool.imap_unordered(_fetch_all_tags, catalog):
+            pass
+    finally:
+        pool.close()
+        pool.join()
+        if progbar:
+            pbar.close()
+    context.projects.sort()
 
 
-def copy_from_nexus_to_docker(progbar=False):
+def copy_from_nexus_to_docker(progbar=False, context=None):
     """Copy all missing tags.
 
     This function will use multi-threading to copy all missing tags in the project list.
     """
+    context = _get_context(context)
     _tot_tags = 0
-    for proj in projects:
+    for proj in context.projects:
         _tot_tags = _tot_tags + len(proj.tags_2_copy.valid)
     log.info("About to start copying from Nexus3 to Docker Hub for {} missing tags".format(_tot_tags))
     if progbar:
@@ -730,23 +956,248 @@ def copy_from_nexus_to_docker(progbar=False):
             pbar.update(len(proj.tags_2_copy.valid))
 
     pool = ThreadPool(multiprocessing.cpu_count())
-    pool.map(_docker_pull_tag_push, projects)
+    pool.map(_docker_pull_tag_push, context.projects)
+    pool.close()
+    pool.join()
+    if progbar:
+        pbar.close()
+
+
+def _get_manifest_layers(registry_base, repo, reference, session=None, headers=None):
+    """Return the layers of an image manifest, as a dictionary digest -> size.
+
+    The image config blob is included, as it is transferred as well.
+    For a manifest list (multi platform image) the linux/amd64 image is used,
+    as that is the one docker pulls on the release node.
+    Returns None if the manifest can not be resolved, is not JSON, or has no
+    sizes (schema 1 manifests).
+    """
+    headers = dict(headers or {})
+    headers["Accept"] = MANIFEST_ACCEPT
+    url = "{}/v2/{}/manifests/{}".format(registry_base, repo, reference)
+    try:
+        r = _request_get(url, session, headers=headers)
+    except requests.HTTPError as excinfo:
+        log.debug("Fetching manifest {}. {}".format(url, excinfo))
+        return None
+    if r.status_code != requests.codes.ok:
+        log.debug("Fetching manifest {}. status {}".format(url, r.status_code))
+        return None
+    content_type = r.headers.get("Content-Type", "")
+    if "json" not in content_type:
+        log.debug("Fetching manifest {}. Content-Type {}".format(url, content_type))
+        return None
+    try:
+        manifest = r.json()
+    except ValueError as excinfo:
+        log.debug("Fetching manifest {}. {}".format(url, excinfo))
+        return None
+
+    if "manifests" in manifest:
+        for entry in manifest["manifests"]:
+            platform = entry.get("platform", {})
+            if platform.get("os") == "linux" and platform.get("architecture") == "amd64":
+                return _get_manifest_layers(registry_base, repo, entry["digest"], session, headers)
+        log.debug("No linux/amd64 image in manifest list {}".format(url))
+        return None
+
+    if "layers" not in manifest:
+        log.debug("Manifest {} has no layer sizes, schemaVersion {}".format(url, manifest.get("schemaVersion")))
+        return None
+    layers = {layer["digest"]: layer.get("size", 0) for layer in manifest["layers"]}
+    if "config" in manifest:
+        layers[manifest["config"]["digest"]] = manifest["config"].get("size", 0)
+    return layers
+
+
+def _get_docker_hub_token(repo, session=None):
+    """Return an anonymous pull token for a Docker Hub repository, or None."""
+    try:
+        r = _request_get(DOCKER_AUTH_URL.format(repo), session)
+    except requests.HTTPError as excinfo:
+        log.debug("Fetching Docker Hub token for {}. {}".format(repo, excinfo))
+        return None
+    if r.status_code != requests.codes.ok:
+        return None
+    try:
+        return r.json().get("token")
+    except ValueError as excinfo:
+        log.debug("Fetching Docker Hub token for {}. {}".format(repo, excinfo))
+        return None
+
+
+def _docker_hub_blob_exists(repo, digest, token, session=None):
+    """Return True if the Docker Hub repository already has the blob."""
+    url = "{}/v2/{}/blobs/{}".format(DOCKER_REGISTRY_BASE, repo, digest)
+    try:
+        r = _request("HEAD", url, session, headers={"Authorization": "Bearer {}".format(token)})
+    except requests.HTTPError as excinfo:
+        log.debug("Checking blob {}. {}".format(url, excinfo))
+        return False
+    return r.status_code == requests.codes.ok
+
+
+def _measure_throughput(registry_base, repo, digest, session=None):
+    """Return the measured download throughput from Nexus3 in bytes per second.
+
+    Downloads up to THROUGHPUT_SAMPLE_BYTES of a blob. Returns 0 if the blob
+    can not be downloaded.
+    """
+    url = "{}/v2/{}/blobs/{}".format(registry_base, repo, digest)
+    start = time.monotonic()
+    received = 0
+    try:
+        r = _request_get(url, session, stream=True)
+        if r.status_code != requests.codes.ok:
+            return 0
+        for chunk in r.iter_content(chunk_size=64 * 1024):
+            received = received + len(chunk)
+            if received >= THROUGHPUT_SAMPLE_BYTES:
+                break
+        r.close()
+    except requests.exceptions.RequestException as excinfo:
+        log.debug("Measuring throughput with {}. {}".format(url, excinfo))
+        return 0
+    elapsed = time.monotonic() - start
+    if received == 0 or elapsed <= 0:
+        return 0
+    return received / elapsed
+
+
+def estimate_copy(progbar=False, throughput=0, context=None):
+    """Estimate the cost of copying all missing tags, without copying anything.
+
+    For every tag to copy, the image manifest is resolved in Nexus3, and each
+    layer is checked against the destination Docker Hub repository.
+
+    Parameters:
+        progbar    : Display a progress bar.
+        throughput : Transfer rate in bytes per second. If 0, it is measured
+                     by downloading a sample of the largest layer from Nexus3.
+        context    : Run context, default is the one set by initialize.
+
+    Layers are counted once across the whole run, even when shared by the
+    images of several repos.
+
+    Returns a dictionary with
+        nbr_tags        : Number of tags to copy.
+        unresolved      : List of 'repo:tag' whose manifest could not be resolved.
+        unique_bytes    : Size of the unique layers to pull from Nexus3.
+        present_bytes   : Size of those layers already present in Docker Hub.
+        push_bytes      : Size of the layers to push to Docker Hub.
+        peak_disk_bytes : Local disk needed by the largest images copied in parallel.
+        throughput      : Bytes per second used for the estimate, 0 if unknown.
+        duration        : Estimated seconds to pull and push, None if unknown.
+    """
+    context = _get_context(context)
+    to_copy = [proj for proj in context.projects if len(proj.tags_2_copy.valid) > 0]
+    log.info("Resolving image manifests for {} repos with missing tags".format(len(to_copy)))
+    if progbar:
+        pbar = tqdm.tqdm(total=len(to_copy), bar_format="{l_bar}{bar}|{n_fmt}/{total_fmt} [{elapsed}]")
+
+    def _estimate_project(proj):
+        """Helper function for multi-threading, resolving the layers of one project."""
+        nexus_name = proj.calc_nexus_project_name()
+        docker_name = proj.calc_docker_project_name()
+        layers = {}
+        image_sizes = []
+        unresolved = []
+        for tag in sorted_tags(proj.tags_2_copy.valid):
+            tag_layers = _get_manifest_layers(context.nexus3_base, nexus_name, tag, context.session)
+            if tag_layers is None:
+                unresolved.append("{}:{}".format(nexus_name, tag))
+                continue
+            layers.update(tag_layers)
+            image_sizes.append(sum(tag_layers.values()))
+
+        present = set()
+        if layers and proj.docker_tags.repository_exist:
+            token = _get_docker_hub_token(docker_name, context.session)
+            if token:
+                for digest in layers:
+                    if _docker_hub_blob_exists(docker_name, digest, token, context.session):
+                        present.add(digest)
+        if progbar:
+            pbar.update(1)
+        return nexus_name, layers, present, image_sizes, unresolved
+
+    pool = ThreadPool(multiprocessing.cpu_count())
+    results = pool.map(_estimate_project, to_copy)
     pool.close()
     pool.join()
     if progbar:
         pbar.close()
 
+    all_layers = {}
+    all_present = set()
+    image_sizes = []
+    unresolved = []
+    largest_layer = None
+    for nexus_name, layers, present, proj_image_sizes, proj_unresolved in results:
+        for digest, size in layers.items():
+            all_layers[digest] = size
+            if largest_layer is None or size > largest_layer[2]:
+                largest_layer = (nexus_name, digest, size)
+        all_present.update(present)
+        image_sizes.extend(proj_image_sizes)
+        unresolved.extend(proj_unresolved)
+    unique_bytes = sum(all_layers.values())
+    present_bytes = sum(all_layers[digest] for digest in all_present)
+    push_bytes = unique_bytes - present_bytes
+
+    if throughput <= 0 and largest_layer is not None:
+        throughput = _measure_throughput(context.nexus3_base, largest_layer[0], largest_layer[1], context.session)
+    duration = None
+    if throughput > 0:
+        duration = (unique_bytes + push_bytes) / throughput
+
+    # Each copy thread holds one pulled image on disk until its cleanup stage.
+    parallel_copies = multiprocessing.cpu_count()
+    peak_disk_bytes = sum(sorted(image_sizes, reverse=True)[:parallel_copies])
+
+    return {
+        "nbr_tags": sum(len(proj.tags_2_copy.valid) for proj in to_copy),
+        "unresolved": unresolved,
+        "unique_bytes": unique_bytes,
+        "present_bytes": present_bytes,
+        "push_bytes": push_bytes,
+        "peak_disk_bytes": peak_disk_bytes,
+        "throughput": throughput,
+        "duration": duration,
+    }
+
+
+def print_copy_estimate(estimate):
+    """Print the result of estimate_copy."""
+    log.info("Copy estimate for {} tags from Nexus3 to Docker Hub".format(estimate["nbr_tags"]))
+    log.info("  Unique layer bytes to pull    : {}".format(format_bytes(estimate["unique_bytes"])))
+    log.info("  Already present in Docker Hub : {}".format(format_bytes(estimate["present_bytes"])))
+    log.info("  Layer bytes to push           : {}".format(format_bytes(estimate["push_bytes"])))
+    log.info("  Peak local disk usage         : {}".format(format_bytes(estimate["peak_disk_bytes"])))
+    if estimate["duration"] is None:
+        log.info("  Estimated duration            : unknown, could not measure throughput")
+    else:
+        log.info(
+            "  Estimated duration            : {} at {}/s".format(
+                time.strftime("%H:%M:%S", time.gmtime(estimate["duration"])), format_bytes(estimate["throughput"])
+            )
+        )
+    for image in estimate["unresolved"]:
+        log.info("  Could not resolve the manifest of {}, not included".format(image))
+    log.info("")
+
 
-def print_nexus_docker_proj_names():
+def print_nexus_docker_proj_names(context=None):
     """Print Nexus3 - Docker Hub repositories."""
-    fmt_str = "{:<" + str(project_max_len_chars) + "} : "
+    context = _get_context(context)
+    fmt_str = "{:<" + str(context.project_max_len_chars) + "} : "
     log.info("")
     log_str = fmt_str.format(NEXUS3_PROJ_NAME_HEADER)
     log_str = "{}{}".format(log_str, DOCKER_PROJ_NAME_HEADER)
     log.info(log_str)
-    log.info("-" * project_max_len_chars * 2)
+    log.info("-" * context.project_max_len_chars * 2)
     docker_i = 0
-    for proj in projects:
+    for proj in context.projects:
         log_str = fmt_str.format(proj.nexus_repo_name)
         log_str = "{}{}".format(log_str, proj.docker_repo_name)
         log.info(log_str)
@@ -754,23 +1205,25 @@ def print_nexus_docker_proj_names():
     log.info("")
 
 
-def print_tags_header(header_str, col_1_str):
+def print_tags_header(header_str, col_1_str, context=None):
     """Print simple header."""
-    fmt_str = "{:<" + str(project_max_len_chars) + "} : "
+    context = _get_context(context)
+    fmt_str = "{:<" + str(context.project_max_len_chars) + "} : "
     log.info(header_str)
     log_str = fmt_str.format(col_1_str)
     log_str = "{}{}".format(log_str, "Tags")
     log.info(log_str)
-    log.info("-" * project_max_len_chars * 2)
+    log.info("-" * context.project_max_len_chars * 2)
 
 
-def print_tags_data(proj_name, tags):
+def print_tags_data(proj_name, tags, context=None):
     """Print tag data."""
-    fmt_str = "{:<" + str(project_max_len_chars) + "} : "
+    context = _get_context(context)
+    fmt_str = "{:<" + str(context.project_max_len_chars) + "} : "
     if len(tags) > 0:
         log_str = fmt_str.format(proj_name)
         tag_i = 0
-        for tag in tags:
+        for tag in sorted_tags(tags):
             if tag_i > 0:
                 log_str = "{}, ".format(log_str)
             log_str = "{}{}".format(log_str, tag)
@@ -778,43 +1231,48 @@ def print_tags_data(proj_name, tags):
         log.info(log_str)
 
 
-def print_nexus_valid_tags():
+def print_nexus_valid_tags(context=None):
     """Print Nexus valid tags."""
-    print_tags_header("Nexus Valid Tags", NEXUS3_PROJ_NAME_HEADER)
-    for proj in projects:
-        print_tags_data(proj.nexus_repo_name, proj.nexus_tags.valid)
+    context = _get_context(context)
+    print_tags_header("Nexus Valid Tags", NEXUS3_PROJ_NAME_HEADER, context)
+    for proj in context.projects:
+        print_tags_data(proj.nexus_repo_name, proj.nexus_tags.valid, context)
     log.info("")
 
 
-def print_nexus_invalid_tags():
+def print_nexus_invalid_tags(context=None):
     """Print Nexus invalid tags."""
-    print_tags_header("Nexus InValid Tags", NEXUS3_PROJ_NAME_HEADER)
-    for proj in projects:
-        print_tags_data(proj.nexus_repo_name, proj.nexus_tags.invalid)
+    context = _get_context(context)
+    print_tags_header("Nexus InValid Tags", NEXUS3_PROJ_NAME_HEADER, context)
+    for proj in context.projects:
+        print_tags_data(proj.nexus_repo_name, proj.nexus_tags.invalid, context)
     log.info("")
 
 
-def print_docker_valid_tags():
+def print_docker_valid_tags(context=None):
     """Print Docker valid tags."""
-    print_tags_header("Docker Valid Tags", DOCKER_PROJ_NAME_HEADER)
-    for proj in projects:
-        print_tags_data(proj.docker_repo_name, proj.docker_tags.valid)
+    context = _get_context(context)
+    print_tags_header("Docker Valid Tags", DOCKER_PROJ_NAME_HEADER, context)
+    for proj in context.projects:
+        print_tags_data(proj.docker_repo_name, proj.docker_tags.valid, context)
     log.info("")
 
 
-def print_docker_invalid_tags():
+def print_docker_invalid_tags(context=None):
     """Print Docker invalid tags."""
-    print_tags_header("Docker InValid Tags", DOCKER_PROJ_NAME_HEADER)
-    for proj in projects:
-        print_tags_data(proj.docker_repo_name, proj.docker_tags.invalid)
+    context = _get_context(context)
+    print_tags_header("Docker InValid Tags", DOCKER_PROJ_NAME_HEADER, context)
+    for proj in context.projects:
+        print_tags_data(proj.docker_repo_name, proj.docker_tags.invalid, context)
     log.info("")
 
 
-def print_stats():
+def print_stats(context=None):
     """Print simple repo/tag statistics."""
-    print_tags_header("Tag statistics (V=Valid, I=InValid)", NEXUS3_PROJ_NAME_HEADER)
-    fmt_str = "{:<" + str(project_max_len_chars) + "} : "
-    for proj in projects:
+    context = _get_context(context)
+    print_tags_header("Tag statistics (V=Valid, I=InValid)", NEXUS3_PROJ_NAME_HEADER, context)
+    fmt_str = "{:<" + str(context.project_max_len_chars) + "} : "
+    for proj in context.projects:
         log.info(
             "{}Nexus V:{} I:{} -- Docker V:{} I:{}".format(
                 fmt_str.format(proj.nexus_repo_name),
@@ -827,16 +1285,17 @@ def print_stats():
     log.info("")
 
 
-def print_missing_docker_proj():
+def print_missing_docker_proj(context=None):
     """Print missing docker repos."""
+    context = _get_context(context)
     log.info("Missing corresponding Docker Project")
-    fmt_str = "{:<" + str(project_max_len_chars) + "} : "
+    fmt_str = "{:<" + str(context.project_max_len_chars) + "} : "
     log_str = fmt_str.format(NEXUS3_PROJ_NAME_HEADER)
     log_str = "{}{}".format(log_str, DOCKER_PROJ_NAME_HEADER)
     log.info(log_str)
-    log.info("-" * project_max_len_chars * 2)
+    log.info("-" * context.project_max_len_chars * 2)
     all_docker_repos_found = True
-    for proj in projects:
+    for proj in context.projects:
         if not proj.docker_tags.repository_exist:
             log_str = fmt_str.format(proj.nexus_repo_name)
             log_str = "{}{}".format(log_str, proj.docker_repo_name)
@@ -847,20 +1306,21 @@ def print_missing_docker_proj():
     log.info("")
 
 
-def print_nexus_tags_to_copy():
+def print_nexus_tags_to_copy(context=None):
     """Print tags that needs to be copied."""
+    context = _get_context(context)
     log.info("Nexus project tags to copy to docker")
-    fmt_str = "{:<" + str(project_max_len_chars) + "} : "
+    fmt_str = "{:<" + str(context.project_max_len_chars) + "} : "
     log_str = fmt_str.format(NEXUS3_PROJ_NAME_HEADER)
     log_str = "{}{}".format(log_str, "Tags to copy")
     log.info(log_str)
-    log.info("-" * project_max_len_chars * 2)
-    for proj in projects:
+    log.info("-" * context.project_max_len_chars * 2)
+    for proj in context.projects:
         if len(proj.tags_2_copy.valid) > 0:
             log_str = ""
             tag_i = 0
             log_str = fmt_str.format(proj.nexus_repo_name)
-            for tag in proj.tags_2_copy.valid:
+            for tag in sorted_tags(proj.tags_2_copy.valid):
                 if tag_i > 0:
                     log_str = "{}, ".format(log_str)
                 log_str = "{}{}".format(log_str, tag)
@@ -869,10 +1329,11 @@ def print_nexus_tags_to_copy():
     log.info("")
 
 
-def print_nbr_tags_to_copy():
+def print_nbr_tags_to_copy(context=None):
     """Print how many tags that needs to be copied."""
+    context = _get_context(context)
     _tot_tags = 0
-    for proj in projects:
+    for proj in context.projects:
         _tot_tags = _tot_tags + len(proj.tags_2_copy.valid)
     log.info("Summary: {} tags that should be copied from Nexus3 to Docker Hub.".format(_tot_tags))
 
@@ -888,32 +1349,114 @@ def start_point(
     repofile=False,
     version_regexp="",
     docker_client=None,
+    context=None,
+    estimate=False,
+    throughput=0,
 ):
-    """Main function."""
+    """Main function.
+
+    Without a context, initialize sets up a new default run context, which
+    holds the results.
+    With a context, version_regexp is ignored in favor of the context one.
+
+    If estimate is given, the cost of copying the missing tags is printed
+    before any copy starts. throughput is in bytes per second, see
+    estimate_copy.
+    """
     # Verify find_pattern and specified_repo are not both used.
     if len(find_pattern) == 0 and exact_match:
         log.error("You need to provide a Pattern to go with the --exact flag")
         return
-    initialize(org_name, version_regexp)
-    if not validate_regexp():
-        log.error("Found issues with the provided regexp >>{}<< ".format(VERSION_REGEXP))
+    if context is None:
+        context = initialize(org_name, version_regexp)
+    if not validate_regexp(context):
+        log.error("Found issues with the provided regexp >>{}<< ".format(context.version_regexp))
         return
-    if not get_nexus3_catalog(org_name, find_pattern, exact_match, repofile):
+    # Fetch the first catalog page up front, so an unreachable Nexus3 is
+    # reported, then fetch tags while the remaining pages are streamed in.
+    _log_catalog_request(org_name, find_pattern, exact_match, repofile, context)
+    catalog_pages = nexus3_catalog_pages(org_name, find_pattern, exact_match, repofile, context)
+    try:
+        first_page = next(catalog_pages, [])
+    except requests.HTTPError as excinfo:
+        log.info("Fetching Nexus3 catalog. {}".format(excinfo))
         log.info("Could not get any catalog from Nexus3 with org = {}".format(org_name))
         return
+    except ValueError as excinfo:
+        log.error(excinfo)
+        return
 
-    fetch_all_tags(progbar, docker_client)
+    catalog = itertools.chain(first_page, itertools.chain.from_iterable(catalog_pages))
+    try:
+        fetch_all_tags(progbar, docker_client, catalog, context)
+    except requests.HTTPError as excinfo:
+        log.info("Fetching Nexus3 catalog. {}".format(excinfo))
+        log.info("Could not get the whole catalog from Nexus3 with org = {}".format(org_name))
+        return
     if verbose:
-        print_nexus_docker_proj_names()
-        print_nexus_valid_tags()
-        print_nexus_invalid_tags()
-        print_docker_valid_tags()
-        print_docker_invalid_tags()
-        print_stats()
+        print_nexus_docker_proj_names(context)
+        print_nexus_valid_tags(context)
+        print_nexus_invalid_tags(context)
+        print_docker_valid_tags(context)
+        print_docker_invalid_tags(context)
+        print_stats(context)
     if summary or verbose:
-        print_missing_docker_proj()
-        print_nexus_tags_to_copy()
+        print_missing_docker_proj(context)
+        print_nexus_tags_to_copy(context)
+    if estimate:
+        print_copy_estimate(estimate_copy(progbar, throughput, context))
     if copy:
-        copy_from_nexus_to_docker(progbar)
+        copy_from_nexus_to_docker(progbar, context)
     else:
-        print_nbr_tags_to_copy()
+        print_nbr_tags_to_copy(context)
+
+
+def start_points(
+    org_names,
+    find_pattern="",
+    exact_match=False,
+    summary=False,
+    verbose=False,
+    copy=False,
+    progbar=False,
+    repofile=False,
+    version_regexp="",
+    docker_client=None,
+    estimate=False,
+    throughput=0,
+):
+    """Sync several organizations in parallel, one run context per organization.
+
+    All runs share one requests session, and therefore its connection
+    pools, as well as one docker client.
+    Returns the run contexts, in the order of org_names.
+    """
+    session = new_session(len(org_names))
+    if docker_client is None:
+        docker_client = docker.from_env()
+    contexts = [ReleaseContextClass(org_name, version_regexp, session) for org_name in org_names]
+
+    def _start_point(context):
+        """Helper function for multi-threading, running start_point for one organization."""
+        start_point(
+            context.org_name,
+            find_pattern,
+            exact_match,
+            summary,
+            verbose,
+            copy,
+            progbar,
+            repofile,
+            version_regexp,
+            docker_client,
+            context,
+            estimate,
+            throughput,
+        )
+
+    pool = ThreadPool(len(contexts))
+    pool.map(_start_point, contexts)
+    pool.close()
+    pool.join()
+    session.close()
+    return contexts
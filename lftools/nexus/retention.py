@@ -0,0 +1,168 @@
+# -*- code: utf-8 -*-
+# SPDX-License-Identifier: EPL-1.0
+##############################################################################
+# Copyright (c) 2026 The Linux Foundation and others.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+##############################################################################
+"""Retention policies for Nexus 3 docker images.
+
+The versions of each image are ordered according to a version scheme, and
+a version is expired unless it is one of the newest ones, or recent enough.
+Versions the scheme cannot order, like "latest", are always kept.
+"""
+
+import datetime
+import logging
+import re
+
+log = logging.getLogger(__name__)
+
+SEMVER_REGEXP = re.compile(r"^v?(\d+)\.(\d+)\.(\d+)(?:-([0-9A-Za-z.-]+))?(?:\+[0-9A-Za-z.-]+)?$")
+DATE_REGEXP = re.compile(r"(\d{4})-?(\d{2})-?(\d{2})(?:[T_.-]?(\d{2})(\d{2})(\d{2}))?")
+
+
+def semver_key(version):
+    """Return a sort key for a semantic version, None if it is not one.
+
+    A pre-release sorts before its release: 1.0.0-rc1 < 1.0.0 < 1.0.1.
+    """
+    match = SEMVER_REGEXP.match(version)
+    if not match:
+        return None
+    major, minor, patch, prerelease = match.groups()
+    if prerelease is None:
+        prerelease_key = (1,)
+    else:
+        prerelease_key = (0,) + tuple(
+            (0, int(part), "") if part.isdigit() else (1, 0, part) for part in prerelease.split(".")
+        )
+    return (int(major), int(minor), int(patch), prerelease_key)
+
+
+def version_date(version):
+    """Return the UTC date found in a version, None if there is none.
+
+    20240131, 2024-01-31 and 20240131T235959Z all give a date.
+    """
+    match = DATE_REGEXP.search(version)
+    if not match:
+        return None
+    try:
+        return datetime.datetime(*[int(part or 0) for part in match.groups()], tzinfo=datetime.timezone.utc)
+    except ValueError:
+        return None
+
+
+def natural_key(version):
+    """Return a sort key ordering the numbers in a version numerically."""
+    return [(0, int(part), "") if part.isdigit() else (1, 0, part) for part in re.split(r"(\d+)", version)]
+
+
+VERSION_SCHEMES = {
+    "semver": semver_key,
+    "date": version_date,
+    "natural": natural_key,
+}
+
+
+def component_size(component):
+    """Return the size in bytes of the assets of a component."""
+    return sum(asset.get("fileSize") or 0 for asset in component.get("assets", []))
+
+
+def parse_last_modified(value):
+    """Return the datetime of an asset lastModified date, None if it is missing or invalid.
+
+    Dates without a timezone are taken as UTC.
+    """
+    if not value:
+        return None
+    try:
+        date = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except (AttributeError, ValueError):
+        log.warning("Ignoring the invalid lastModified date {!r}".format(value))
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+    return date
+
+
+def component_last_modified(component):
+    """Return when an asset of the component was last modified, None if unknown."""
+    dates = [parse_last_modified(asset.get("lastModified")) for asset in component.get("assets", [])]
+    dates = [date for date in dates if date is not None]
+    return max(dates) if dates else None
+
+
+def select_expired(components, keep_newest=None, keep_days=None, scheme="semver", now=None):
+    """Split the components of one image into kept and expired components.
+
+    :arg list components: Nexus 3 components sharing the same name.
+    :arg int keep_newest: Number of newest versions to keep.
+    :arg int keep_days: Keep the versions younger than this number of days.
+        The age comes from the lastModified date of the assets, or from the
+        version itself with the date scheme.
+    :arg str scheme: Version scheme ordering the versions, see VERSION_SCHEMES.
+    :arg datetime now: Reference time for keep_days, defaults to now.
+    :return: (kept, expired) lists of components.
+    """
+    if keep_newest is None and keep_days is None:
+        raise ValueError("A retention policy needs keep_newest, keep_days or both")
+    version_key = VERSION_SCHEMES[scheme]
+    if now is None:
+        now = datetime.datetime.now(datetime.timezone.utc)
+
+    kept, ordered = [], []
+    for component in components:
+        key = version_key(component["version"])
+        if key is None:
+            log.debug("Keeping {}:{}, not a {} version".format(component["name"], component["version"], scheme))
+            kept.append(component)
+        else:
+            ordered.append((key, component))
+    ordered.sort(key=lambda k_c: k_c[0], reverse=True)
+
+    expired = []
+    for rank, (key, component) in enumerate(ordered):
+        if keep_newest is not None and rank < keep_newest:
+            kept.append(component)
+            continue
+        if keep_days is not None:
+            last_modified = component_last_modified(component)
+            if last_modified is None and scheme == "date":
+                last_modified = key
+            # Without a date, the age of a version is unknown, keep it.
+            if last_modified is None or now - last_modified < datetime.timedelta(days=keep_days):
+                kept.append(component)
+                continue
+        expired.append(component)
+    return kept, expired
+
+
+def apply_retention(components, **policy):
+    """Group a stream of components by image name, and apply the policy to each.
+
+    The components are consumed one by one, only the few fields the policy
+    needs are kept for each of them. The policy arguments are those of
+    select_expired().
+
+    :return: Dict image name -> (kept, expired) lists of components.
+    """
+    images = {}
+    for component in components:
+        images.setdefault(component["name"], []).append(
+            {
+                "id": component["id"],
+                "name": component["name"],
+                "version": component["version"],
+                "assets": [
+                    {"fileSize": asset.get("fileSize"), "lastModified": asset.get("lastModified")}
+                    for asset in component.get("assets", [])
+                ],
+            }
+        )
+    return {name: select_expired(versions, **policy) for name, versions in sorted(images.items())}
@@ -32,3 +32,15 @@ def create_repo_target_regex(group_id, strict=True):
     else:
         # Replace - with regex
         return repotarget.replace("-", r"[/\.]")
+
+
+def format_bytes(nbr_bytes):
+    """Return a human readable size, 1536 -> 1.5 KiB."""
+    size = float(nbr_bytes)
+    for unit in ["B", "KiB", "MiB", "GiB", "TiB"]:
+        if size < 1024 or unit == "TiB":
+            break
+        size = size / 1024
+    if unit == "B":
+        return "{:d} B".format(int(size))
+    return "{:.1f} {}".format(size, unit)
@@ -9,9 +9,14 @@
 ##############################################################################
 """Test generic REST client."""
 
+import json
+import os
+
 import responses
+from responses import matchers
 
 import lftools.api.client as client
+from lftools.api.cache import ResponseCache
 
 creds = {"authtype": "token", "endpoint": "", "token": "xyz"}
 c = client.RestApi(creds=creds)
@@ -52,3 +57,155 @@ def test_delete():
     responses.add(responses.DELETE, "https://fakeurl/", json={"success": "delete"}, status=200, match_querystring=True)
     resp = c.delete("https://fakeurl/")
     assert resp[1] == {"success": "delete"}
+
+
+@responses.activate
+def test_retry_idempotent():
+    retrying = client.RestApi(creds=creds, backoff_factor=0)
+    responses.add(responses.GET, "https://fakeurl/", status=503)
+    responses.add(responses.GET, "https://fakeurl/", status=429, headers={"Retry-After": "0"})
+    responses.add(responses.GET, "https://fakeurl/", json={"success": "get"}, status=200)
+    resp = retrying.get("https://fakeurl/")
+    assert resp[1] == {"success": "get"}
+    assert len(responses.calls) == 3
+
+
+@responses.activate
+def test_no_retry_post():
+    retrying = client.RestApi(creds=creds, backoff_factor=0)
+    responses.add(responses.POST, "https://fakeurl/", status=503, body="unavailable")
+    resp = retrying.post("https://fakeurl/")
+    assert resp[0].status_code == 503
+    assert len(responses.calls) == 1
+
+
+@responses.activate
+def test_retries_exhausted():
+    retrying = client.RestApi(creds=creds, retries=1, backoff_factor=0)
+    responses.add(responses.DELETE, "https://fakeurl/", status=502, body="bad gateway")
+    resp = retrying.delete("https://fakeurl/")
+    assert resp[0].status_code == 502
+    assert len(responses.calls) == 2
+
+
+def test_backoff_jitter():
+    retry = client.RestApi.make_retry(3, 1).increment("GET", "/").increment("GET", "/")
+    assert 2 <= retry.get_backoff_time() <= 3
+    assert retry.new().jitter == 1
+
+
+@responses.activate
+def test_cache_revalidation(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    cached = client.RestApi(creds=creds, cache=cache, cache_ttl=0)
+    responses.add(
+        responses.GET,
+        "https://fakeurl/",
+        status=304,
+        match=[matchers.header_matcher({"If-None-Match": '"v1"'})],
+    )
+    responses.add(responses.GET, "https://fakeurl/", json={"success": "get"}, headers={"ETag": '"v1"'})
+    assert cached.get("https://fakeurl/")[1] == {"success": "get"}
+    assert cached.get("https://fakeurl/")[1] == {"success": "get"}
+    assert len(responses.calls) == 2
+
+    # Fresh responses are not even revalidated, unless the cache is disabled.
+    cached.params["cache_ttl"] = 60
+    assert cached.get("https://fakeurl/")[1] == {"success": "get"}
+    assert len(responses.calls) == 2
+    ResponseCache.disabled = True
+    try:
+        cached.get("https://fakeurl/")
+    finally:
+        ResponseCache.disabled = False
+    assert len(responses.calls) == 3
+
+    # Another user does not see the cached response.
+    other = client.RestApi(creds=dict(creds, token="abc"), cache=cache)
+    other.get("https://fakeurl/")
+    assert len(responses.calls) == 4
+
+
+@responses.activate
+def test_cache_invalidation(tmp_path):
+    cached = client.RestApi(creds=creds, cache=ResponseCache(str(tmp_path)), cache_ttl=600)
+    responses.add(responses.GET, "https://fakeurl/roles?source=default", json=[])
+    responses.add(responses.GET, "https://fakeurl/roles", json=[{"id": "a"}])
+    responses.add(responses.GET, "https://fakeurl/users", json=[])
+    responses.add(responses.PUT, "https://fakeurl/roles/a", json={})
+    for url in ["https://fakeurl/roles", "https://fakeurl/roles?source=default", "https://fakeurl/users"]:
+        cached.get(url)
+    assert len(os.listdir(str(tmp_path))) == 3
+
+    # A write drops the listings of its collection, but not the other ones.
+    cached.put("https://fakeurl/roles/a", data="{}")
+    assert len(os.listdir(str(tmp_path))) == 1
+    cached.get("https://fakeurl/roles")
+    cached.get("https://fakeurl/users")
+    assert [call.request.url for call in responses.calls][-2:] == ["https://fakeurl/roles/a", "https://fakeurl/roles"]
+
+
+def test_set_pool_size():
+    api = client.RestApi(creds=creds, pool_size=10)
+    adapter = api.r.get_adapter("https://fakeurl/")
+    api.set_pool_size(4)
+    assert api.r.get_adapter("https://fakeurl/") is adapter
+    api.set_pool_size(16)
+    adapter = api.r.get_adapter("https://fakeurl/")
+    assert adapter._pool_maxsize == 16
+    assert adapter.max_retries is api.retry
+
+
+def test_cache_eviction(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    resp = ResponseCache.to_response({"url": "https://fakeurl/", "headers": {}, "text": "x" * 400})
+    cache.store("0", resp)
+    # Room for 4 entries, which is still under EVICT_TARGET once the 5th one is stored.
+    cache.max_size = int(os.path.getsize(os.path.join(str(tmp_path), "0.json")) * 4.7)
+    for i in range(4):
+        cache.store(str(i), resp)
+        os.utime(os.path.join(str(tmp_path), "{}.json".format(i)), (i, i))
+    cache.get("0")
+    cache.store("4", resp)
+    assert sorted(os.listdir(str(tmp_path))) == ["0.json", "2.json", "3.json", "4.json"]
+
+
+def test_cache_eviction_scans(tmp_path, mocker):
+    cache = ResponseCache(str(tmp_path), max_size=50000)
+    resp = ResponseCache.to_response({"url": "https://fakeurl/", "headers": {}, "text": "x" * 400})
+    listdir = mocker.spy(os, "listdir")
+    for i in range(1000):
+        cache.store(str(i), resp)
+    size = sum(os.path.getsize(os.path.join(str(tmp_path), name)) for name in os.listdir(str(tmp_path)))
+    assert size <= 50000
+    # The directory is scanned on the first store, then once per EVICT_TARGET worth of stores.
+    assert listdir.call_count < 1000 / 5
+
+
+def test_decode_json():
+    assert client.decode_json(b")]}'\n" + json.dumps({"msg": ")]}' stays"}).encode()) == {"msg": ")]}' stays"}
+    assert client.decode_json(b"[1, 2]") == [1, 2]
+
+
+@responses.activate
+def test_paginate_offset_more():
+    responses.add(
+        responses.GET,
+        "https://fakeurl/changes/",
+        json=[{"_number": 1}, {"_number": 2, "_more_changes": True}],
+        match=[matchers.query_param_matcher({"q": "status:open", "n": "2", "S": "0"})],
+    )
+    responses.add(
+        responses.GET,
+        "https://fakeurl/changes/",
+        json=[{"_number": 3}],
+        match=[matchers.query_param_matcher({"q": "status:open", "n": "2", "S": "2"})],
+    )
+    changes = c.paginate_offset(
+        "https://fakeurl/changes/?q=status:open",
+        2,
+        more=lambda page: page[-1].get("_more_changes", False),
+        offset_param="S",
+        limit_param="n",
+    )
+    assert [change["_number"] for change in changes] == [1, 2, 3]
@@ -0,0 +1,166 @@
+# SPDX-License-Identifier: EPL-1.0
+##############################################################################
+# Copyright (c) 2026 The Linux Foundation and others.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+##############################################################################
+"""Test the Gerrit REST API endpoint."""
+
+import json
+
+import pytest
+import requests
+import responses
+from responses import matchers
+
+import lftools.api.endpoints.gerrit as gerrit
+
+creds = {"authtype": "basic", "endpoint": "https://gerrit.example.org/r/a/", "username": "u", "password": "p"}
+g = gerrit.Gerrit(fqdn="gerrit.example.org", creds=creds)
+CHANGES_URL = "https://gerrit.example.org/r/a/changes/"
+
+
+def change(number, more=False):
+    """Return a change as found in query results."""
+    result = {
+        "id": "foo%2Fbar~master~I{:040d}".format(number),
+        "_number": number,
+        "project": "foo/bar",
+        "branch": "master",
+        "status": "NEW",
+        "subject": "Change {}".format(number),
+    }
+    if more:
+        result["_more_changes"] = True
+    return result
+
+
+def add_query(query, pages, options=()):
+    """Mock the pages of a change query."""
+    offset = 0
+    for page in pages:
+        params = {"q": query, "n": str(gerrit.QUERY_PAGE_SIZE), "S": str(offset)}
+        if options:
+            params["o"] = list(options)
+        responses.add(
+            responses.GET,
+            CHANGES_URL,
+            body=")]}'\n" + json.dumps(page),
+            content_type="application/json",
+            match=[matchers.query_param_matcher(params)],
+        )
+        offset += len(page)
+
+
+@responses.activate
+def test_query_changes():
+    add_query("status:open", [[change(1), change(2, more=True)], [change(3)]], options=["LABELS", "CURRENT_REVISION"])
+    changes = g.query_changes("status:open", options=["LABELS", "CURRENT_REVISION"])
+    assert [c["_number"] for c in changes] == [1, 2, 3]
+
+
+@responses.activate
+def test_abandon_changes():
+    add_query('project:"foo/bar" status:open', [[change(1), change(2), change(3)]])
+    responses.add(responses.POST, CHANGES_URL + change(1)["id"] + "/abandon", json=change(1))
+    responses.add(responses.POST, CHANGES_URL + change(2)["id"] + "/abandon", status=409, body="change is merged\n")
+    responses.add(responses.POST, CHANGES_URL + change(3)["id"] + "/abandon", json=change(3))
+
+    results = g.abandon_changes("gerrit.example.org", "foo/bar")
+    assert [(r["change"], r["ok"]) for r in results] == [(1, True), (2, False), (3, True)]
+    assert results[1]["message"] == "409 Conflict: change is merged"
+    assert json.loads(responses.calls[1].request.body) == {"message": "Abandoned by automation"}
+
+
+@responses.activate
+def test_audit_access():
+    responses.add(
+        responses.GET,
+        "https://gerrit.example.org/r/a/projects/",
+        json={"foo/bar": {"id": "foo%2Fbar"}, "foo/baz": {"id": "foo%2Fbaz"}},
+        match=[matchers.query_param_matcher({"type": "ALL", "p": "foo/"})],
+    )
+
+    def access(parent, ref, permission, group, exclusive=False, action="ALLOW"):
+        return {
+            "inherits_from": {"id": parent, "name": parent} if parent else None,
+            "local": {
+                ref: {"permissions": {permission: {"exclusive": exclusive, "rules": {group: {"action": action}}}}}
+            },
+            "groups": {group: {"name": group.split(":")[-1]}},
+        }
+
+    responses.add(
+        responses.GET,
+        "https://gerrit.example.org/r/a/access/",
+        json={
+            "foo/bar": access("Parent", "refs/heads/*", "submit", "ldap:foo-committers", exclusive=True),
+            "foo/baz": access("Parent", "refs/heads/*", "read", "ldap:foo-readers"),
+        },
+        match=[matchers.query_param_matcher({"project": ["foo/bar", "foo/baz"]})],
+    )
+    responses.add(
+        responses.GET,
+        "https://gerrit.example.org/r/a/access/",
+        json={"Parent": access("All-Projects", "refs/heads/*", "submit", "global:Registered-Users")},
+        match=[matchers.query_param_matcher({"project": "Parent"})],
+    )
+    responses.add(
+        responses.GET,
+        "https://gerrit.example.org/r/a/access/",
+        json={"All-Projects": access(None, "refs/*", "read", "global:Anonymous-Users", action="BLOCK")},
+        match=[matchers.query_param_matcher({"project": "All-Projects"})],
+    )
+
+    gerrit_audit = gerrit.Gerrit(fqdn="gerrit.example.org", creds=creds)
+    rows = gerrit_audit.audit_access(gerrit_audit.list_projects("foo/"))
+    assert [(r["project"], r["inherited_from"], r["permission"], r["group"], r["action"]) for r in rows] == [
+        ("foo/bar", "", "submit", "foo-committers", "ALLOW"),
+        ("foo/bar", "All-Projects", "read", "Anonymous-Users", "BLOCK"),
+        ("foo/baz", "", "read", "foo-readers", "ALLOW"),
+        ("foo/baz", "Parent", "submit", "Registered-Users", "ALLOW"),
+        ("foo/baz", "All-Projects", "read", "Anonymous-Users", "BLOCK"),
+    ]
+
+
+@responses.activate
+def test_audit_access_unknown_project():
+    access = {"inherits_from": None, "local": {}, "groups": {}}
+    responses.add(
+        responses.GET,
+        "https://gerrit.example.org/r/a/access/",
+        status=404,
+        match=[matchers.query_param_matcher({"project": ["foo/bar", "foo/gone"]})],
+    )
+    responses.add(
+        responses.GET,
+        "https://gerrit.example.org/r/a/access/",
+        json={"foo/bar": access},
+        match=[matchers.query_param_matcher({"project": "foo/bar"})],
+    )
+    responses.add(
+        responses.GET,
+        "https://gerrit.example.org/r/a/access/",
+        status=404,
+        match=[matchers.query_param_matcher({"project": "foo/gone"})],
+    )
+
+    gerrit_audit = gerrit.Gerrit(fqdn="gerrit.example.org", creds=creds)
+    assert gerrit_audit.audit_access(["foo/bar", "foo/gone"]) == []
+    assert list(gerrit_audit.get_access(["foo/bar", "foo/gone"])) == ["foo/bar"]
+    with pytest.raises(LookupError):
+        gerrit_audit.inheritance_chain("foo/gone")
+
+
+@responses.activate
+def test_create_project_errors():
+    responses.add(responses.GET, "https://gerrit.example.org/r/a/projects/?query=name:foo%2Fbar", json={"foo/bar": {}})
+    with pytest.raises(ValueError):
+        g.create_project("gerrit.example.org", "foo/bar", "foo-bar-committers", "", False)
+
+    responses.add(responses.PUT, "https://gerrit.example.org/r/a/groups/saml%2Ffoo-committers", status=500)
+    with pytest.raises(requests.HTTPError):
+        g.create_saml_group("gerrit.example.org", "foo-committers")
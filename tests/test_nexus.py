@@ -9,16 +9,33 @@
 ##############################################################################
 """Test nexus command."""
 
+import csv
+import datetime
+import gzip
+import json
 import os
 import re
+import time
 
 import pytest
+import requests
+from responses import matchers
 
-from lftools.nexus import cmd, util
+import lftools.nexus as nexus
+from lftools.nexus import cmd, retention, util
 
 FIXTURE_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "fixtures")
 
 
+@pytest.fixture(autouse=True)
+def nexus_endpoint_cache(tmp_path, mocker):
+    """Keep the Nexus endpoint cache out of the user config directory."""
+    cache_file = str(tmp_path / "nexus_endpoints.json")
+    mocker.patch("lftools.nexus.NEXUS_ENDPOINT_CACHE", cache_file)
+    mocker.patch("lftools.nexus._checked_servers", set())
+    return cache_file
+
+
 @pytest.fixture
 def mock_get_credentials(mocker):
     rtn = {"nexus": "http://nexus.localhost", "user": "user", "password": "password"}
@@ -43,12 +60,11 @@ def test_create_roles(datafiles, responses, nexus2_obj_create):
     role1_return = """{"data": {"id": "lf-deployment"}}"""
     role2_return = """{"data": {"id": "LF Deployment By Name"}}"""
 
-    for _ in range(4):  # Add response for each expected "get_role" call
-        with open("simplified_roles_list.json", "r") as roles_return:
-            responses.add(responses.GET, roles_url, roles_return.read())
-    for _ in range(2):  # Add response for each expected "get_priv" call
-        with open("simplified_privs_list.json", "r") as privs_return:
-            responses.add(responses.GET, privs_url, privs_return.read())
+    # Roles and privileges are only downloaded once.
+    with open("simplified_roles_list.json", "r") as roles_return:
+        responses.add(responses.GET, roles_url, roles_return.read())
+    with open("simplified_privs_list.json", "r") as privs_return:
+        responses.add(responses.GET, privs_url, privs_return.read())
     responses.add(responses.POST, roles_url, role1_return, status=201)
     responses.add(responses.POST, roles_url, role2_return, status=201)
 
@@ -80,6 +96,286 @@ def test_release_staging_repos(datafiles, responses, mocker, nexus2_obj_create,
     cmd.release_staging_repos(repos, False)
 
 
+def add_nexus2_state(responses, repos, roles=None, users=None):
+    """Mock a Nexus 2 where the given repos are fully provisioned."""
+    baseurl = "http://nexus.localhost/service/local/"
+    targets, privs = [], []
+    roles = list(roles or [])
+    for repo_id, group_id in repos.items():
+        targets.append({"id": "t-" + repo_id, "name": repo_id, "patterns": [util.create_repo_target_regex(group_id)]})
+        for method in ["create", "delete", "read", "update"]:
+            privs.append({"id": "{}-{}".format(repo_id, method), "name": "{} - ({})".format(repo_id, method)})
+        roles.append(
+            {
+                "id": repo_id,
+                "name": repo_id,
+                "description": repo_id,
+                "privileges": [p["id"] for p in privs[-4:]],
+                "roles": ["repository-any-read"],
+            }
+        )
+    responses.add(responses.GET, baseurl + "repo_targets", json={"data": targets})
+    responses.add(responses.GET, baseurl + "privileges", json={"data": privs})
+    responses.add(responses.GET, baseurl + "roles", json={"data": roles})
+    responses.add(responses.GET, baseurl + "users", json={"data": users or []})
+
+
+@pytest.mark.datafiles(os.path.join(FIXTURE_DIR, "nexus"))
+def test_create_repos(datafiles, responses, nexus2_obj_create):
+    """Test create_repos() only creates or updates what differs from the config."""
+    os.chdir(str(datafiles))
+    baseurl = "http://nexus.localhost/service/local/"
+    add_nexus2_state(
+        responses,
+        {"widget": "org.example.widget"},
+        roles=[{"id": "lf-deployment", "name": "LF Deployment Role"}],
+    )
+    # The widget role drifted from its configuration.
+    roles = [
+        {"id": "lf-deployment", "name": "LF Deployment Role"},
+        {"id": "widget", "name": "widget", "description": "old", "privileges": [], "roles": []},
+    ]
+    responses.replace(responses.GET, baseurl + "roles", json={"data": roles})
+    responses.add(responses.POST, baseurl + "repo_targets", json={"data": {"id": "t2"}}, status=201)
+    responses.add(responses.POST, baseurl + "privileges_target", json={"data": [{"id": "p4"}]}, status=201)
+    responses.add(responses.POST, baseurl + "roles", json={"data": {"id": "r1"}}, status=201)
+    responses.add(responses.PUT, baseurl + "roles/widget", status=200)
+    responses.add(responses.POST, baseurl + "users", status=201)
+
+    cmd.create_repos("repo_config-good.yaml", "settings.yaml", None)
+
+    calls = [(c.request.method, c.request.url.split("/service/local/")[1]) for c in responses.calls]
+    # The first repo_targets GET is the endpoint discovery.
+    assert calls.count(("GET", "repo_targets")) == 2
+    for collection in ["privileges", "roles", "users"]:
+        assert calls.count(("GET", collection)) == 1
+    # gizmo and gizmo-client are new, widget lacks its user and its role drifted.
+    assert calls.count(("POST", "repo_targets")) == 2
+    assert calls.count(("POST", "privileges_target")) == 8
+    assert calls.count(("POST", "roles")) == 2
+    assert calls.count(("PUT", "roles/widget")) == 1
+    assert calls.count(("POST", "users")) == 3
+    assert len(calls) == 21
+
+
+@pytest.mark.datafiles(os.path.join(FIXTURE_DIR, "nexus"))
+def test_create_repos_up_to_date(datafiles, responses, nexus2_obj_create, capsys):
+    """Test create_repos() on an up to date Nexus only downloads its state."""
+    os.chdir(str(datafiles))
+    add_nexus2_state(
+        responses,
+        {"gizmo": "org.example.gizmo", "gizmo-client": "org.example.gizmo.client", "widget": "org.example.widget"},
+        roles=[{"id": "lf-deployment", "name": "LF Deployment Role"}],
+        users=[
+            {"userId": repo, "roles": [repo, "nx-deployment", "lf-deployment"]}
+            for repo in ["gizmo", "gizmo-client", "widget"]
+        ],
+    )
+
+    cmd.create_repos("repo_config-good.yaml", "settings.yaml", None, show_plan=True)
+    assert json.loads(capsys.readouterr().out) == {"changes": []}
+
+    cmd.create_repos("repo_config-good.yaml", "settings.yaml", None)
+    assert len(responses.calls) == 9
+
+
+def test_iter_images(responses, nexus_endpoint_cache):
+    """Test iter_images() follows continuation tokens, with credentials."""
+    server = "http://nexus.example.org"
+    responses.add(responses.GET, server + "/service/local/repo_targets", status=404)
+    responses.add(responses.GET, server + "/service/siesta/rest/beta/read-only", status=200)
+    search_url = server + "/service/siesta/rest/beta/search"
+    responses.add(
+        responses.GET,
+        search_url,
+        json={"items": [{"name": "a", "version": "1", "id": "1"}], "continuationToken": "tok"},
+        match=[matchers.query_param_matcher({"repository": "docker.release", "q": "a*"})],
+    )
+    responses.add(
+        responses.GET,
+        search_url,
+        json={"items": [{"name": "a", "version": "2", "id": "2"}], "continuationToken": None},
+        match=[matchers.query_param_matcher({"repository": "docker.release", "q": "a*", "continuationToken": "tok"})],
+    )
+
+    _nexus = nexus.Nexus(server, "user", "password")
+    images = _nexus.iter_images("docker.release", "a*")
+    assert next(images)["version"] == "1"
+    assert [image["version"] for image in images] == ["2"]
+    for call in responses.calls[2:]:
+        assert call.request.headers["Authorization"].startswith("Basic ")
+
+
+def test_iter_images_error(responses, nexus_endpoint_cache):
+    """Test iter_images() raises HTTPError, from the thread fetching the pages, on a failed search."""
+    server = "http://nexus.example.org"
+    responses.add(responses.GET, server + "/service/local/repo_targets", status=404)
+    responses.add(responses.GET, server + "/service/siesta/rest/beta/read-only", status=200)
+    responses.add(responses.GET, server + "/service/siesta/rest/beta/search", status=403)
+
+    with pytest.raises(requests.HTTPError):
+        list(nexus.Nexus(server).iter_images("docker.release"))
+
+
+def test_output_images_csv(tmp_path):
+    """Test output_images() streams any iterable of images to a CSV file."""
+    csv_path = str(tmp_path / "images.csv")
+    images = ({"name": "img", "version": str(v), "id": "id{}".format(v)} for v in range(3))
+
+    cmd.output_images(images, csv_path)
+
+    with open(csv_path, newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [row["id"] for row in rows] == ["id0", "id1", "id2"]
+
+
+def test_output_images_jsonl_gzip(tmp_path):
+    """Test output_images() writes the selected columns as gzipped JSON lines."""
+    jsonl_path = str(tmp_path / "images.jsonl.gz")
+    images = ({"name": "img", "version": str(v), "id": "id{}".format(v)} for v in range(3))
+
+    cmd.output_images(images, jsonl_path=jsonl_path, columns=["version", "id"])
+
+    with gzip.open(jsonl_path, "rt") as f:
+        rows = [json.loads(line) for line in f]
+    assert rows == [{"version": str(v), "id": "id{}".format(v)} for v in range(3)]
+
+
+def test_delete_images(responses, tmp_path, nexus2_obj_create, mock_get_credentials):
+    """Test delete_images() reports failures after trying every image, and checkpoints."""
+    components_url = "http://nexus.localhost/service/local/components/"
+    checkpoint = str(tmp_path / "deleted.txt")
+    with open(checkpoint, "w") as f:
+        f.write("id0\n")
+    images = [{"name": "img", "version": str(v), "id": "id{}".format(v)} for v in range(4)]
+    responses.add(responses.DELETE, components_url + "id1", status=204)
+    responses.add(responses.DELETE, components_url + "id2", status=503)
+    responses.add(responses.DELETE, components_url + "id3", status=404)
+
+    with pytest.raises(SystemExit):
+        cmd.delete_images(None, "http://nexus.localhost", images, workers=2, checkpoint=checkpoint)
+
+    urls = [call.request.url for call in responses.calls]
+    assert components_url + "id0" not in urls
+    # 503 is retried, 404 means the image is already gone.
+    assert urls.count(components_url + "id2") == 4
+    with open(checkpoint) as f:
+        assert sorted(f.read().split()) == ["id0", "id1", "id3"]
+
+
+def test_retention_select_expired():
+    """Test retention policies with the semver and date version schemes."""
+    now = datetime.datetime(2024, 6, 1, tzinfo=datetime.timezone.utc)
+
+    def component(version, last_modified=None):
+        return {"id": version, "name": "img", "version": version, "assets": [{"lastModified": last_modified}]}
+
+    versions = [component(v) for v in ["1.0.0", "1.10.0", "1.2.0", "1.10.0-rc1", "latest", "1.9.0"]]
+    kept, expired = retention.select_expired(versions, keep_newest=2, now=now)
+    assert sorted(c["version"] for c in kept) == ["1.10.0", "1.10.0-rc1", "latest"]
+    assert [c["version"] for c in expired] == ["1.9.0", "1.2.0", "1.0.0"]
+
+    versions = [component(c["version"], "2024-01-01T10:00:00.000+00:00") for c in versions]
+    versions[5] = component("1.9.0", "2024-05-30T10:00:00.000+00:00")
+    kept, expired = retention.select_expired(versions, keep_newest=2, keep_days=7, now=now)
+    assert [c["version"] for c in expired] == ["1.2.0", "1.0.0"]
+
+    # An invalid date leaves the version undated, and therefore kept.
+    versions[2] = component("1.2.0", "yesterday")
+    kept, expired = retention.select_expired(versions, keep_newest=2, keep_days=7, now=now)
+    assert [c["version"] for c in expired] == ["1.0.0"]
+
+    versions = [component(v) for v in ["1.0.0-20240101T000000Z", "1.0.0-20240530T000000Z", "1.0.0-STAGING-latest"]]
+    kept, expired = retention.select_expired(versions, keep_days=7, scheme="date", now=now)
+    assert [c["version"] for c in expired] == ["1.0.0-20240101T000000Z"]
+
+
+def test_prune_images_dry_run(responses, nexus_endpoint_cache, mock_get_credentials):
+    """Test prune_images() reports, and deletes nothing, in dry run mode."""
+    server = "http://nexus.localhost"
+    responses.add(responses.GET, server + "/service/local/repo_targets", status=404)
+    responses.add(responses.GET, server + "/service/siesta/rest/beta/read-only", status=404)
+    responses.add(responses.GET, server + "/service/rest/beta/read-only", status=404)
+    responses.add(responses.GET, server + "/service/rest/v1/read-only", status=200)
+    items = [
+        {"id": "{}-{}".format(name, v), "name": name, "version": "1.{}.0".format(v), "assets": [{"fileSize": 1024}]}
+        for name in ["a", "b"]
+        for v in range(3)
+    ]
+    responses.add(responses.GET, server + "/service/rest/v1/search", json={"items": items, "continuationToken": None})
+    confirmations = []
+
+    cmd.prune_images(None, server, "docker.snapshot", "*", keep_newest=1, dry_run=True, confirm=confirmations.append)
+
+    assert confirmations == []
+    assert [call.request.method for call in responses.calls] == ["GET"] * 5
+
+
+def test_nexus_endpoint_discovery_is_lazy_and_cached(responses, nexus_endpoint_cache):
+    """Test the Nexus endpoint is only discovered once, and on first use."""
+    server = "http://nexus.localhost"
+    responses.add(responses.GET, server + "/service/local/repo_targets", status=200)
+
+    _nexus = nexus.Nexus(server)
+    assert len(responses.calls) == 0
+    assert _nexus.baseurl == server + "/service/local"
+    assert _nexus.version == 2
+    assert len(responses.calls) == 1
+
+    _nexus = nexus.Nexus(server)
+    assert _nexus.baseurl == server + "/service/local"
+    assert len(responses.calls) == 1
+
+    with open(nexus_endpoint_cache) as f:
+        assert json.load(f)[server]["baseurl"] == server + "/service/local"
+
+
+def test_nexus_endpoint_cache_expired(responses, nexus_endpoint_cache):
+    """Test an expired cache entry is discovered again."""
+    server = "http://nexus.example.org"
+    with open(nexus_endpoint_cache, "w") as f:
+        json.dump({server: {"baseurl": server + "/service/local", "timestamp": 0}}, f)
+    responses.add(responses.GET, server + "/service/local/repo_targets", status=404)
+    responses.add(responses.GET, server + "/service/siesta/rest/beta/read-only", status=404)
+    responses.add(responses.GET, server + "/service/rest/beta/read-only", status=404)
+    responses.add(responses.GET, server + "/service/rest/v1/read-only", status=200)
+
+    _nexus = nexus.Nexus(server)
+    assert _nexus.baseurl == server + "/service/rest/v1"
+    assert _nexus.version == 3
+
+
+def test_nexus_endpoint_cache_refreshed_on_404(responses, nexus_endpoint_cache):
+    """Test a stale cached endpoint is discovered again when a request 404s."""
+    server = "http://nexus.localhost"
+    with open(nexus_endpoint_cache, "w") as f:
+        json.dump({server: {"baseurl": server + "/service/rest/beta", "timestamp": time.time()}}, f)
+    responses.add(responses.GET, server + "/service/rest/beta/roles", status=404)
+    responses.add(responses.GET, server + "/service/rest/beta/read-only", status=404)
+    responses.add(responses.GET, server + "/service/local/repo_targets", status=200)
+    responses.add(responses.GET, server + "/service/local/roles", json={"data": [{"id": "r1", "name": "role1"}]})
+
+    _nexus = nexus.Nexus(server)
+    assert _nexus.get_role("role1") == "r1"
+    assert _nexus.baseurl == server + "/service/local"
+
+
+def test_nexus_endpoint_cache_kept_on_404(responses, nexus_endpoint_cache):
+    """Test a 404 below a cached endpoint which still answers is returned as is."""
+    server = "http://nexus.localhost"
+    with open(nexus_endpoint_cache, "w") as f:
+        json.dump({server: {"baseurl": server + "/service/rest/v1", "timestamp": time.time()}}, f)
+    responses.add(responses.GET, server + "/service/rest/v1/components/missing", status=404)
+    responses.add(responses.GET, server + "/service/rest/v1/read-only", status=200)
+
+    _nexus = nexus.Nexus(server)
+    for _ in range(3):
+        assert _nexus._request("GET", "components", "missing").status_code == 404
+    assert _nexus.baseurl == server + "/service/rest/v1"
+    # The endpoint is only probed on the first 404.
+    assert len(responses.calls) == 4
+
+
 def test_create_repo_target_regex():
     """Test create_repo_target_regex() command."""
 
@@ -0,0 +1,161 @@
+# SPDX-License-Identifier: EPL-1.0
+##############################################################################
+# Copyright (c) 2026 The Linux Foundation and others.
+#
+# All rights reserved. This program and the accompanying materials
+# are made available under the terms of the Eclipse Public License v1.0
+# which accompanies this distribution, and is available at
+# http://www.eclipse.org/legal/epl-v10.html
+##############################################################################
+"""Test the Nexus3 REST API endpoint."""
+
+import datetime
+import json
+
+import pytest
+import requests
+import responses
+from responses import matchers
+
+import lftools.api.endpoints.nexus3 as nexus3
+
+creds = {"authtype": "basic", "endpoint": "https://nexus3.example.org/service/rest/", "username": "u", "password": "p"}
+n3 = nexus3.Nexus3(fqdn="nexus3.example.org", creds=creds)
+
+
+def add_pages(url, pages, **params):
+    """Mock a listing returning the given pages of items."""
+    for index, items in enumerate(pages):
+        query = dict(params)
+        if index:
+            query["continuationToken"] = "token{}".format(index)
+        token = "token{}".format(index + 1) if index + 1 < len(pages) else None
+        responses.add(
+            responses.GET,
+            url,
+            json={"items": items, "continuationToken": token},
+            match=[matchers.query_param_matcher(query)],
+        )
+
+
+@responses.activate
+def test_list_assets_all_pages():
+    add_pages(
+        "https://nexus3.example.org/service/rest/v1/assets",
+        [[{"path": "a/1"}, {"path": "a/2"}], [{"path": "b/1"}], [{"path": "c/1"}]],
+        repository="maven.releases",
+    )
+    assert n3.list_assets("maven.releases") == ["a/1", "a/2", "b/1", "c/1"]
+    assert [item["path"] for item in n3._paginate("v1/assets", prefetch=False, repository="maven.releases")] == [
+        "a/1",
+        "a/2",
+        "b/1",
+        "c/1",
+    ]
+
+
+@responses.activate
+def test_list_tags_last_page():
+    add_pages("https://nexus3.example.org/service/rest/v1/tags", [[{"name": "t1"}], [{"name": "t2"}]])
+    assert n3.list_tags() == ["t1", "t2"]
+
+
+@responses.activate
+def test_search_asset_pages():
+    add_pages(
+        "https://nexus3.example.org/service/rest/v1/search/assets",
+        [[{"path": "myjar-1.2.3.jar"}], [{"path": "myjar-1.2.4.jar"}]],
+        q="myjar-1",
+        repository="maven.releases",
+    )
+    assert n3.search_asset("myjar-1", "maven.releases") == ["myjar-1.2.3.jar", "myjar-1.2.4.jar"]
+
+
+@responses.activate
+def test_repositories_usage():
+    responses.add(
+        responses.GET,
+        "https://nexus3.example.org/service/rest/v1/repositories",
+        json=[{"name": "maven.releases", "type": "hosted"}, {"name": "public", "type": "group"}],
+    )
+    add_pages(
+        "https://nexus3.example.org/service/rest/v1/assets",
+        [
+            [
+                {"path": "/org/foo/bar/1.0/bar-1.0.jar", "fileSize": 1000, "lastModified": "2024-05-30T00:00:00Z"},
+                {"path": "/org/foo/bar/1.0/bar-1.0.pom", "fileSize": 24, "lastModified": "2024-05-30T00:00:00Z"},
+            ],
+            [
+                {"path": "/org/foo/baz/2.0/baz-2.0.jar", "fileSize": 2000, "lastModified": "2023-01-01T00:00:00Z"},
+                {"path": "/org/foo/baz/2.0/baz-2.0.pom", "fileSize": 24, "lastModified": "not a date"},
+            ],
+        ],
+        repository="maven.releases",
+    )
+
+    [usage] = n3.repositories_usage(top=1)
+    assert usage["repository"] == "maven.releases"
+    assert (usage["assets"], usage["bytes"]) == (4, 3048)
+    assert usage["largest"] == [("org/foo/baz/2.0", 2024)]
+
+    usage = n3.repository_usage("maven.releases", now=datetime.datetime(2024, 6, 1, tzinfo=datetime.timezone.utc))
+    assert usage["ages"]["< 7 days"] == [2, 1024]
+    assert usage["ages"]["> 1 year"] == [1, 2000]
+    assert usage["ages"]["unknown"] == [1, 24]
+
+
+@responses.activate
+def test_import_users():
+    users_url = "https://nexus3.example.org/service/rest/beta/security/users"
+    jdoe = {"userId": "jdoe", "firstName": "John", "emailAddress": "jdoe@example.org", "roles": ["a", "b"]}
+    asmith = {"userId": "asmith", "firstName": "Ann", "emailAddress": "asmith@example.org", "roles": ["a"]}
+    responses.add(responses.GET, users_url, json=[jdoe, asmith])
+    responses.add(responses.PUT, users_url + "/asmith", status=204)
+    responses.add(
+        responses.POST,
+        users_url,
+        json={"userId": "newbie"},
+        match=[matchers.json_params_matcher({"userId": "newbie"}, strict_match=False)],
+    )
+    responses.add(responses.POST, users_url, status=400, body="Invalid email")
+
+    results = n3.import_objects(
+        "user",
+        [
+            {"userId": "jdoe", "roles": ["b", "a"]},
+            {"userId": "asmith", "roles": ["a", "c"]},
+            {"userId": "newbie", "firstName": "New", "roles": ["a"]},
+            {"userId": "broken", "emailAddress": "nope"},
+        ],
+        workers=2,
+    )
+
+    assert [(res["name"], res["action"], res["ok"]) for res in results] == [
+        ("jdoe", "none", True),
+        ("asmith", "update", True),
+        ("newbie", "create", True),
+        ("broken", "create", False),
+    ]
+    assert results[2]["message"].startswith("Created with password ")
+    assert "Invalid email" in results[3]["message"]
+    put = [call for call in responses.calls if call.request.method == "PUT"][0]
+    assert json.loads(put.request.body) == dict(asmith, roles=["a", "c"])
+
+
+@responses.activate
+def test_import_malformed_roles():
+    roles_url = "https://nexus3.example.org/service/rest/beta/security/roles"
+    responses.add(responses.GET, roles_url, json=[])
+    responses.add(responses.POST, roles_url, status=200)
+
+    results = n3.import_objects("role", [{"name": "no id"}, {"id": "bad", "roles": "admin"}, {"id": "good"}])
+
+    assert [(res["name"], res["ok"]) for res in results] == [("", False), ("bad", False), ("good", True)]
+    assert results[1]["message"] == "ValueError: roles must be a list"
+
+
+@responses.activate
+def test_paginate_error():
+    responses.add(responses.GET, "https://nexus3.example.org/service/rest/v1/components", status=404)
+    with pytest.raises(requests.HTTPError):
+        n3.list_components("missing")
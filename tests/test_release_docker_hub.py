@@ -85,6 +85,33 @@ def test_nexus_tag_class(responses):
     assert len(test_tags.invalid) == len(answer_invalid_tags)
 
 
+def test_nexus_tag_class_multiple_pages(responses):
+    """Test NexusTagClass following the Link header pagination."""
+    org = "onap"
+    repo = "sdc-helm-validator"
+    url = "https://nexus3.onap.org:10002/v2/onap/sdc-helm-validator/tags/list"
+    next_link = '</v2/onap/sdc-helm-validator/tags/list?last=1.3.1&n=3>; rel="next"'
+    answer1 = '{"name":"onap/sdc-helm-validator","tags":["latest","1.3.0","1.3.1"]}'
+    answer2 = '{"name":"onap/sdc-helm-validator","tags":["1.4.0","v1.0.0"]}'
+    responses.add(responses.GET, url + "?last=1.3.1&n=3", body=answer2, status=200)
+    responses.add(responses.GET, url, body=answer1, status=200, headers={"Link": next_link})
+    rdh.initialize(org)
+    test_tags = rdh.NexusTagClass(org, repo, False)
+    assert test_tags.repository_exist
+    assert sorted(test_tags.valid) == ["1.3.0", "1.3.1", "1.4.0"]
+    assert sorted(test_tags.invalid) == ["latest", "v1.0.0"]
+
+
+def test_nexus_tag_class_missing_repo(responses):
+    """Test NexusTagClass for a repository unknown to Nexus3."""
+    url = "https://nexus3.onap.org:10002/v2/onap/unknown/tags/list"
+    responses.add(responses.GET, url, body='{"errors":[{"code":"NAME_UNKNOWN"}]}', status=404)
+    rdh.initialize("onap")
+    test_tags = rdh.NexusTagClass("onap", "unknown", False)
+    assert not test_tags.repository_exist
+    assert len(test_tags.valid) == 0
+
+
 @pytest.mark.datafiles(
     os.path.join(FIXTURE_DIR, "nexus"),
 )
@@ -325,16 +352,47 @@ class TestTagsRegExpClass:
     def test_tag_class_manual_version_regexp_str_from_file_valid(self, datafiles):
         org = "onap"
         test_regexp_from_file = os.path.join(str(datafiles), "releasedockerhub_good_regexp")
-        rdh.initialize(org, test_regexp_from_file)
+        context = rdh.initialize(org, test_regexp_from_file)
         assert rdh.validate_regexp()
-        assert rdh.VERSION_REGEXP == r"^\d+.\d+"
+        assert context.version_regexp == r"^\d+.\d+"
 
     def test_tag_class_manual_version_regexp_str_from_file_invalid(self, datafiles):
         org = "onap"
         test_regexp_from_file = os.path.join(str(datafiles), "releasedockerhub_bad_regexp")
-        rdh.initialize(org, test_regexp_from_file)
+        context = rdh.initialize(org, test_regexp_from_file)
         assert not rdh.validate_regexp()
-        assert rdh.VERSION_REGEXP == "["
+        assert context.version_regexp == "["
+
+    def test_tag_class_manual_version_regexp_multiple_from_file(self, datafiles):
+        org = "onap"
+        repo = "sdc-helm-validator"
+        test_regexp_from_file = os.path.join(str(datafiles), "releasedockerhub_multi_regexp")
+        context = rdh.initialize(org, test_regexp_from_file)
+        assert rdh.validate_regexp()
+        assert len(context.version_regexps) == 3
+        tags = rdh.TagClass(org, repo, False)
+        tags.add_tags(
+            [
+                "1.1.2",
+                "1.1.2-SNAPSHOT-20181231T234559Z",
+                "1.1.2-STAGING-20181231T234559Z",
+                "1.1.2-RELEASE-20181231T234559Z",
+                "latest",
+            ]
+        )
+        assert tags.valid == {"1.1.2", "1.1.2-SNAPSHOT-20181231T234559Z", "1.1.2-STAGING-20181231T234559Z"}
+        assert tags.invalid == {"1.1.2-RELEASE-20181231T234559Z", "latest"}
+
+
+def test_sorted_tags():
+    """Test sorted_tags."""
+    assert rdh.sorted_tags({"1.10.0", "1.9.0", "1.9.10", "1.9.2", "latest"}) == [
+        "1.9.0",
+        "1.9.2",
+        "1.9.10",
+        "1.10.0",
+        "latest",
+    ]
 
 
 @pytest.mark.datafiles(
@@ -608,6 +666,22 @@ class TestProjectClass:
         assert self.counter.cleanup == 90
 
 
+def test_load_repo_file(tmp_path):
+    """Test load_repo_file."""
+    repo_names_file = tmp_path / "repos.txt"
+    repo_names_file.write_text(
+        "onap/clamp; onap/clamp\n\nonap/aaf/aaf_core;onap/aaf-aaf_core\nonap/clamp; onap/clamp-duplicate\n"
+    )
+    repo_index = rdh.load_repo_file(str(repo_names_file))
+    assert repo_index == {"onap/clamp": "onap/clamp", "onap/aaf/aaf_core": "onap/aaf-aaf_core"}
+
+    repo_names_file.write_text("onap/clamp; onap/clamp\nonap/vid\nonap/so;\n")
+    with pytest.raises(ValueError) as excinfo:
+        rdh.load_repo_file(str(repo_names_file))
+    assert "2: onap/vid" in str(excinfo.value)
+    assert "3: onap/so;" in str(excinfo.value)
+
+
 @pytest.mark.datafiles(
     os.path.join(FIXTURE_DIR, "nexus"),
 )
@@ -618,55 +692,67 @@ class TestFetchNexus3Catalog:
      """
 
     def test_get_all_onap(self):
-        rdh.NexusCatalog = []
-        rdh.initialize("onap")
+        context = rdh.initialize("onap")
         responses.add(responses.GET, self.url, body=self.answer, status=200)
         rdh.get_nexus3_catalog("onap")
-        assert len(rdh.NexusCatalog) == 203
+        assert len(context.nexus_catalog) == 203
 
     def test_get_all_onap_and_filter_1(self):
-        rdh.NexusCatalog = []
-        rdh.initialize("onap")
+        context = rdh.initialize("onap")
         responses.add(responses.GET, self.url, body=self.answer, status=200)
         rdh.get_nexus3_catalog("onap", "spike")
-        assert len(rdh.NexusCatalog) == 1
-        assert rdh.NexusCatalog[0][0] == "onap"
-        assert rdh.NexusCatalog[0][1] == "spike"
+        assert len(context.nexus_catalog) == 1
+        assert context.nexus_catalog[0][0] == "onap"
+        assert context.nexus_catalog[0][1] == "spike"
 
     def test_get_all_onap_and_filter_18(self):
-        rdh.NexusCatalog = []
-        rdh.initialize("onap")
+        context = rdh.initialize("onap")
         responses.add(responses.GET, self.url, body=self.answer, status=200)
         rdh.get_nexus3_catalog("onap", "aaf")
-        assert len(rdh.NexusCatalog) == 18
+        assert len(context.nexus_catalog) == 18
 
     def test_get_all_onap_and_specify_1_repo_1(self):
-        rdh.NexusCatalog = []
-        rdh.initialize("onap")
+        context = rdh.initialize("onap")
         responses.add(responses.GET, self.url, body=self.answer, status=200)
         rdh.get_nexus3_catalog("onap", "clamp", True)
-        assert len(rdh.NexusCatalog) == 1
-        assert rdh.NexusCatalog[0][1] == "clamp"
+        assert len(context.nexus_catalog) == 1
+        assert context.nexus_catalog[0][1] == "clamp"
 
     def test_get_all_onap_and_specify_1_repo_2(self):
-        rdh.NexusCatalog = []
-        rdh.initialize("onap")
+        context = rdh.initialize("onap")
         responses.add(responses.GET, self.url, body=self.answer, status=200)
         rdh.get_nexus3_catalog("onap", "clamp-dashboard-logstash", True)
-        assert len(rdh.NexusCatalog) == 1
-        assert rdh.NexusCatalog[0][1] == "clamp-dashboard-logstash"
+        assert len(context.nexus_catalog) == 1
+        assert context.nexus_catalog[0][1] == "clamp-dashboard-logstash"
 
     def test_get_all_onap_and_specify_repo_file(self, datafiles):
         repo_names_file = os.path.join(str(datafiles), "releasedockerhub_reponamelist1.txt")
-        rdh.NexusCatalog = []
-        rdh.initialize("onap")
+        context = rdh.initialize("onap")
         responses.add(responses.GET, self.url, body=self.answer, status=200)
         rdh.get_nexus3_catalog("onap", repo_names_file, False, True)
-        assert len(rdh.NexusCatalog) == 4
-        assert rdh.NexusCatalog[0][1] == "dcae_dmaapbc"
-        assert rdh.NexusCatalog[1][1] == "onap/aaf/aaf_core"
-        assert rdh.NexusCatalog[2][1] == "onap/clamp"
-        assert rdh.NexusCatalog[3][1] == "onap/vfc/nfvo/svnfm/nokiav2"
+        assert len(context.nexus_catalog) == 4
+        assert context.nexus_catalog[0][1] == "dcae_dmaapbc"
+        assert context.nexus_catalog[1][1] == "onap/aaf/aaf_core"
+        assert context.nexus_catalog[2][1] == "onap/clamp"
+        assert context.nexus_catalog[3][1] == "onap/vfc/nfvo/svnfm/nokiav2"
+
+    def test_get_all_onap_and_specify_bad_repo_file(self, tmp_path):
+        repo_names_file = tmp_path / "repos.txt"
+        repo_names_file.write_text("onap/clamp; onap/clamp\nonap/vid\n")
+        context = rdh.initialize("onap")
+        responses.add(responses.GET, self.url, body=self.answer, status=200)
+        assert not rdh.get_nexus3_catalog("onap", str(repo_names_file), False, True)
+        assert len(context.nexus_catalog) == 0
+
+    def test_get_all_onap_multiple_pages(self):
+        context = rdh.initialize("onap")
+        next_link = '</v2/_catalog?last=onap%2Faaf%2Fsms&n=3>; rel="next"'
+        answer1 = '{"repositories":["dcae_dmaapbc","onap/aaf/abrmd","onap/aaf/sms"]}'
+        answer2 = '{"repositories":["onap/clamp","openecomp/vid"]}'
+        responses.add(responses.GET, self.url + "?last=onap%2Faaf%2Fsms&n=3", body=answer2, status=200)
+        responses.add(responses.GET, self.url, body=answer1, status=200, headers={"Link": next_link})
+        assert rdh.get_nexus3_catalog("onap")
+        assert [proj[1] for proj in context.nexus_catalog] == ["aaf/abrmd", "aaf/sms", "clamp"]
 
 
 @pytest.mark.datafiles(
@@ -777,9 +863,6 @@ class TestFetchAllTagsAndUpdate:
 
         responses.add(responses.GET, catalog_url, body=catalog_answer, status=200)
 
-        rdh.NexusCatalog = []
-        rdh.projects = []
-
         responses.add(responses.GET, nexus_url1, body=nexus_answer1, status=200)
         responses.add(responses.GET, docker_url1, body=docker_answer1, status=200)
         if len(repo) == 0:
@@ -796,32 +879,30 @@ class TestFetchAllTagsAndUpdate:
             "Issues with URL: {} - <class 'requests.exceptions.ConnectionError'>".format(url)
         )
         responses.add(responses.GET, url, body=exception)
-        rdh.NexusCatalog = []
-        rdh.projects = []
         self.counter.pull = self.counter.tag = self.counter.push = self.counter.cleanup = 0
 
     def test_fetch_all_tags(self, responses, datafiles, mocker):
         self.initiate_test_fetch(responses, datafiles, mocker)
         mock_docker_client = mocker.MagicMock()
-        rdh.initialize("onap")
+        context = rdh.initialize("onap")
         rdh.get_nexus3_catalog("onap")
         rdh.fetch_all_tags(docker_client=mock_docker_client)
-        assert len(rdh.NexusCatalog) == 3
-        assert len(rdh.projects) == 3
-        assert len(rdh.projects[0].tags_2_copy.valid) == 0
-        assert len(rdh.projects[1].tags_2_copy.valid) == 2
-        assert len(rdh.projects[2].tags_2_copy.valid) == 1
+        assert len(context.nexus_catalog) == 3
+        assert len(context.projects) == 3
+        assert len(context.projects[0].tags_2_copy.valid) == 0
+        assert len(context.projects[1].tags_2_copy.valid) == 2
+        assert len(context.projects[2].tags_2_copy.valid) == 1
 
-        assert rdh.projects[1].tags_2_copy.valid[0] == "1.3.1"
-        assert rdh.projects[1].tags_2_copy.valid[1] == "1.3.2"
-        assert rdh.projects[2].tags_2_copy.valid[0] == "1.4.0"
+        assert rdh.sorted_tags(context.projects[1].tags_2_copy.valid)[0] == "1.3.1"
+        assert rdh.sorted_tags(context.projects[1].tags_2_copy.valid)[1] == "1.3.2"
+        assert rdh.sorted_tags(context.projects[2].tags_2_copy.valid)[0] == "1.4.0"
 
     def test_fetch_from_bogus_orgs(self, responses, mocker):
         self.initiate_bogus_org_test_fetch(responses, "bogus_org321")
-        rdh.initialize("bogus_org321")
+        context = rdh.initialize("bogus_org321")
         rdh.get_nexus3_catalog("bogus_org321")
-        assert len(rdh.NexusCatalog) == 0
-        assert len(rdh.projects) == 0
+        assert len(context.nexus_catalog) == 0
+        assert len(context.projects) == 0
 
     def test_copy(self, responses, datafiles, mocker):
         self.initiate_test_fetch(responses, datafiles, mocker)
@@ -835,6 +916,71 @@ class TestFetchAllTagsAndUpdate:
         assert self.counter.push == 3
         assert self.counter.cleanup == 3
 
+    def test_estimate_copy(self, responses, datafiles, mocker):
+        self.initiate_test_fetch(responses, datafiles, mocker)
+        mock_docker_client = mocker.MagicMock()
+        rdh.initialize("onap")
+        rdh.get_nexus3_catalog("onap")
+        rdh.fetch_all_tags(docker_client=mock_docker_client)
+
+        manifest_url = "https://nexus3.onap.org:10002/v2/onap/{}/manifests/{}"
+        manifest = (
+            '{{"schemaVersion":2,"config":{{"digest":"sha256:c{0}","size":1000}},'
+            '"layers":[{{"digest":"sha256:base","size":1048576}},{{"digest":"sha256:l{0}","size":{1}}}]}}'
+        )
+        content_type = "application/vnd.docker.distribution.manifest.v2+json"
+        for tag, layer, size in [("1.3.1", 1, 2048), ("1.3.2", 2, 4096)]:
+            responses.add(
+                responses.GET,
+                manifest_url.format("gizmo2", tag),
+                body=manifest.format(layer, size),
+                content_type=content_type,
+            )
+        responses.add(responses.GET, manifest_url.format("sdc-helm-validator", "1.4.0"), status=404)
+        token_url = "https://auth.docker.io/token"
+        responses.add(responses.GET, token_url, body='{"token":"secret"}')
+        blob_url = "https://registry-1.docker.io/v2/onap/gizmo2/blobs/{}"
+        responses.add(responses.HEAD, blob_url.format("sha256:base"), status=200)
+        for digest in ["sha256:c1", "sha256:l1", "sha256:c2", "sha256:l2"]:
+            responses.add(responses.HEAD, blob_url.format(digest), status=404)
+
+        estimate = rdh.estimate_copy(throughput=1024 * 1024)
+        assert estimate["nbr_tags"] == 3
+        assert estimate["unresolved"] == ["onap/sdc-helm-validator:1.4.0"]
+        assert estimate["unique_bytes"] == 1048576 + 2 * 1000 + 2048 + 4096
+        assert estimate["present_bytes"] == 1048576
+        assert estimate["push_bytes"] == 2 * 1000 + 2048 + 4096
+        assert estimate["duration"] == pytest.approx((1048576 + 2 * (2 * 1000 + 2048 + 4096)) / (1024 * 1024))
+
+    def test_estimate_copy_shared_layers(self, responses, datafiles, mocker):
+        self.initiate_test_fetch(responses, datafiles, mocker)
+        rdh.initialize("onap")
+        rdh.get_nexus3_catalog("onap")
+        rdh.fetch_all_tags(docker_client=mocker.MagicMock())
+
+        manifest_url = "https://nexus3.onap.org:10002/v2/onap/{}/manifests/{}"
+        manifest = '{"schemaVersion":2,"layers":[{"digest":"sha256:base","size":1048576}]}'
+        content_type = "application/vnd.docker.distribution.manifest.v2+json"
+        for repo, tag in [("gizmo2", "1.3.1"), ("sdc-helm-validator", "1.4.0")]:
+            responses.add(responses.GET, manifest_url.format(repo, tag), body=manifest, content_type=content_type)
+        # A proxy error page instead of a manifest.
+        responses.add(
+            responses.GET,
+            manifest_url.format("gizmo2", "1.3.2"),
+            body="<html>Bad Gateway</html>",
+            content_type="text/html",
+        )
+        responses.add(responses.GET, "https://auth.docker.io/token", body='{"token":"secret"}')
+        for repo in ["gizmo2", "sdc-helm-validator"]:
+            responses.add(
+                responses.HEAD, "https://registry-1.docker.io/v2/onap/{}/blobs/sha256:base".format(repo), status=404
+            )
+
+        estimate = rdh.estimate_copy(throughput=1024 * 1024)
+        assert estimate["unresolved"] == ["onap/gizmo2:1.3.2"]
+        assert estimate["unique_bytes"] == 1048576
+        assert estimate["push_bytes"] == 1048576
+
     def test_start_no_copy(self, responses, datafiles, mocker):
         self.initiate_test_fetch(responses, datafiles, mocker)
         mock_docker_client = mocker.MagicMock()
@@ -847,15 +993,16 @@ class TestFetchAllTagsAndUpdate:
     def test_start_copy(self, responses, datafiles, mocker):
         self.initiate_test_fetch(responses, datafiles, mocker)
         mock_docker_client = mocker.MagicMock()
-        rdh.start_point("onap", "", False, False, False, True, docker_client=mock_docker_client)
-        assert len(rdh.NexusCatalog) == 3
-        assert len(rdh.projects) == 3
-        assert len(rdh.projects[0].tags_2_copy.valid) == 0
-        assert len(rdh.projects[1].tags_2_copy.valid) == 2
-        assert len(rdh.projects[2].tags_2_copy.valid) == 1
-        assert rdh.projects[1].tags_2_copy.valid[0] == "1.3.1"
-        assert rdh.projects[1].tags_2_copy.valid[1] == "1.3.2"
-        assert rdh.projects[2].tags_2_copy.valid[0] == "1.4.0"
+        context = rdh.ReleaseContextClass("onap")
+        rdh.start_point("onap", "", False, False, False, True, docker_client=mock_docker_client, context=context)
+        assert len(context.nexus_catalog) == 3
+        assert len(context.projects) == 3
+        assert len(context.projects[0].tags_2_copy.valid) == 0
+        assert len(context.projects[1].tags_2_copy.valid) == 2
+        assert len(context.projects[2].tags_2_copy.valid) == 1
+        assert rdh.sorted_tags(context.projects[1].tags_2_copy.valid)[0] == "1.3.1"
+        assert rdh.sorted_tags(context.projects[1].tags_2_copy.valid)[1] == "1.3.2"
+        assert rdh.sorted_tags(context.projects[2].tags_2_copy.valid)[0] == "1.4.0"
         assert self.counter.pull == 3
         assert self.counter.tag == 3
         assert self.counter.push == 3
@@ -864,21 +1011,66 @@ class TestFetchAllTagsAndUpdate:
     def test_start_copy_repo(self, responses, datafiles, mocker):
         self.initiate_test_fetch(responses, datafiles, mocker, "sanity")
         mock_docker_client = mocker.MagicMock()
-        rdh.start_point("onap", "validator", False, False, False, True, docker_client=mock_docker_client)
-        assert len(rdh.NexusCatalog) == 1
-        assert len(rdh.projects) == 1
-        assert len(rdh.projects[0].tags_2_copy.valid) == 1
-        assert rdh.projects[0].tags_2_copy.valid[0] == "1.4.0"
+        context = rdh.ReleaseContextClass("onap")
+        rdh.start_point(
+            "onap", "validator", False, False, False, True, docker_client=mock_docker_client, context=context
+        )
+        assert len(context.nexus_catalog) == 1
+        assert len(context.projects) == 1
+        assert len(context.projects[0].tags_2_copy.valid) == 1
+        assert rdh.sorted_tags(context.projects[0].tags_2_copy.valid)[0] == "1.4.0"
         assert self.counter.pull == 1
         assert self.counter.tag == 1
         assert self.counter.push == 1
         assert self.counter.cleanup == 1
 
+    def test_start_points_several_orgs(self, responses, datafiles, mocker):
+        self.initiate_test_fetch(responses, datafiles, mocker)
+        catalog_url = "https://nexus3.o-ran-sc.org:10002/v2/_catalog"
+        nexus_url = "https://nexus3.o-ran-sc.org:10002/v2/o-ran-sc/ric-plt-e2/tags/list"
+        docker_url = "https://registry.hub.docker.com/v2/namespaces/o-ran-sc/repositories/ric-plt-e2/tags"
+        responses.add(responses.GET, catalog_url, body='{"repositories":["o-ran-sc/ric-plt-e2"]}', status=200)
+        responses.add(responses.GET, nexus_url, body='{"name":"o-ran-sc/ric-plt-e2","tags":["5.0.0"]}', status=200)
+        responses.add(responses.GET, docker_url, body='{"next":null,"results":[]}', status=200)
+        mock_docker_client = mocker.MagicMock()
+        contexts = rdh.start_points(["onap", "o-ran-sc"], docker_client=mock_docker_client)
+        assert [context.org_name for context in contexts] == ["onap", "o-ran-sc"]
+        assert len(contexts[0].nexus_catalog) == 3
+        assert len(contexts[0].projects) == 3
+        assert rdh.sorted_tags(contexts[0].projects[1].tags_2_copy.valid) == ["1.3.1", "1.3.2"]
+        assert contexts[1].nexus_catalog == [["o-ran-sc", "ric-plt-e2", ""]]
+        assert contexts[1].projects[0].tags_2_copy.valid == {"5.0.0"}
+
+    def test_start_catalog_page_error(self, responses, mocker):
+        self.initiate_bogus_org_test_fetch(responses, "onap")
+        responses.replace(
+            responses.GET,
+            "https://nexus3.onap.org:10002/v2/_catalog",
+            body='{"repositories":["openecomp/vid"]}',
+            headers={"Link": '</v2/_catalog?last=openecomp%2Fvid&n=1>; rel="next"'},
+        )
+        responses.add(responses.GET, "https://nexus3.onap.org:10002/v2/_catalog?last=openecomp%2Fvid&n=1", status=500)
+        mock_copy = mocker.patch("lftools.nexus.release_docker_hub.copy_from_nexus_to_docker")
+        context = rdh.ReleaseContextClass("onap")
+        rdh.start_point("onap", copy=True, docker_client=mocker.MagicMock(), context=context)
+        assert len(context.projects) == 0
+        assert not mock_copy.called
+
     def test_start_bogus_orgs(self, responses):
         self.initiate_bogus_org_test_fetch(responses, "bogus_org321")
-        rdh.start_point("bogus_org321")
-        assert len(rdh.NexusCatalog) == 0
-        assert len(rdh.projects) == 0
+        context = rdh.ReleaseContextClass("bogus_org321")
+        rdh.start_point("bogus_org321", context=context)
+        assert len(context.nexus_catalog) == 0
+        assert len(context.projects) == 0
+
+    def test_start_default_context(self, responses, datafiles, mocker):
+        self.initiate_test_fetch(responses, datafiles, mocker)
+        rdh.start_point("onap", docker_client=mocker.MagicMock())
+        first = rdh._default_context
+        rdh.start_point("onap", docker_client=mocker.MagicMock())
+        # Each run gets its own lists instead of adding to the previous ones.
+        assert rdh._default_context is not first
+        assert len(first.projects) == len(rdh._default_context.projects) == 3
 
 
 def test_calculate_docker_project_name(mocker):
@@ -14,6 +14,7 @@ import os
 
 import pytest
 import responses
+from responses import matchers
 
 import lftools.api.endpoints.readthedocs as client
 
@@ -171,7 +172,7 @@ def test_subproject_list(datafiles):
     json_data = json.loads(json_file.read())
     responses.add(
         responses.GET,
-        url="https://readthedocs.org/api/v3/projects/TestProject1/subprojects/?limit=999",  # noqa
+        url="https://readthedocs.org/api/v3/projects/TestProject1/subprojects/?limit=100&offset=0",  # noqa
         json=json_data,
         status=200,
         match_querystring=True,
@@ -206,3 +207,116 @@ def test_subproject_create():
 
 def test_subproject_delete():
     assert "untested because responses doesn't have DELETE support"
+
+
+@responses.activate
+def test_project_list_pages():
+    for offset in (0, 100, 200):
+        responses.add(
+            responses.GET,
+            url="https://readthedocs.org/api/v3/projects/",
+            json={
+                "count": 250,
+                "results": [{"slug": "p{}".format(i)} for i in range(offset, min(offset + 100, 250))],
+            },
+            match=[matchers.query_param_matcher({"limit": "100", "offset": str(offset)})],
+        )
+    assert rtd.project_list() == ["p{}".format(i) for i in range(250)]
+
+
+@responses.activate
+def test_project_version_list_pages():
+    responses.add(
+        responses.GET,
+        url="https://readthedocs.org/api/v3/projects/TestProject1/versions/",
+        json={
+            "next": "https://readthedocs.org/api/v3/projects/TestProject1/versions/?active=True&limit=1&offset=1",
+            "results": [{"slug": "latest"}],
+        },
+        match=[matchers.query_param_matcher({"active": "True"})],
+    )
+    responses.add(
+        responses.GET,
+        url="https://readthedocs.org/api/v3/projects/TestProject1/versions/",
+        json={"next": None, "results": [{"slug": "stable"}]},
+        match=[matchers.query_param_matcher({"active": "True", "limit": "1", "offset": "1"})],
+    )
+    assert rtd.project_version_list("TestProject1") == ["latest", "stable"]
+
+
+@responses.activate
+def test_fleet_version_update():
+    responses.add(
+        responses.GET,
+        url="https://readthedocs.org/api/v3/projects/p1/versions/",
+        json={
+            "next": None,
+            "results": [
+                {"slug": "latest", "active": True, "built": True},
+                {"slug": "v1.0", "active": True, "built": True},
+                {"slug": "v1.1", "active": False, "built": False},
+            ],
+        },
+        match=[matchers.query_param_matcher({"limit": "100"})],
+    )
+    responses.add(
+        responses.GET,
+        url="https://readthedocs.org/api/v3/projects/p2/versions/",
+        json={"next": None, "results": [{"slug": "v1.0", "active": True, "built": True}]},
+    )
+    responses.add(responses.GET, url="https://readthedocs.org/api/v3/projects/p3/versions/", status=404)
+    responses.add(responses.PATCH, url="https://readthedocs.org/api/v3/projects/p1/versions/v1.0/", status=204)
+    responses.add(responses.PATCH, url="https://readthedocs.org/api/v3/projects/p2/versions/v1.0/", status=403)
+
+    versions = rtd.fleet_versions(["p1", "p2", "p3"])
+    assert [(v["project"], v["version"], v["ok"]) for v in versions] == [
+        ("p1", "latest", True),
+        ("p1", "v1.0", True),
+        ("p1", "v1.1", True),
+        ("p2", "v1.0", True),
+        ("p3", "", False),
+    ]
+
+    rows = rtd.fleet_version_update(["p1", "p2", "p3"], "v1.*", False, workers=2)
+    assert [(row["project"], row["version"], row["action"], row["ok"]) for row in rows] == [
+        ("p1", "v1.0", "deactivate", True),
+        ("p1", "v1.1", "none", True),
+        ("p2", "v1.0", "deactivate", False),
+        ("p3", "", "", False),
+    ]
+    patch = [call for call in responses.calls if call.request.method == "PATCH"][0]
+    assert json.loads(patch.request.body) == {"active": False}
+
+
+@responses.activate
+def test_fleet_versions_bad_next():
+    responses.add(
+        responses.GET,
+        url="https://readthedocs.org/api/v3/projects/p1/versions/",
+        json={"next": "https://example.org/versions/?offset=1", "results": [{"slug": "latest"}]},
+    )
+    versions = rtd.fleet_versions(["p1"])
+    assert [(v["project"], v["ok"]) for v in versions] == [("p1", False)]
+    assert "outside of" in versions[0]["message"]
+
+
+@responses.activate
+def test_fleet_build_trigger():
+    responses.add(
+        responses.GET,
+        url="https://readthedocs.org/api/v3/projects/TestProject1/subprojects/",
+        json={"count": 1, "results": [{"child": {"slug": "testproject2"}}]},
+    )
+    for project in ("TestProject1", "testproject2"):
+        responses.add(
+            responses.POST,
+            url="https://readthedocs.org/api/v3/projects/{}/versions/latest/builds/".format(project),
+            json={"build": {"id": 42}},
+            status=202,
+        )
+
+    rows = rtd.fleet_build_trigger(rtd.fleet_projects("TestProject1"))
+    assert [(row["project"], row["ok"], row["message"]) for row in rows] == [
+        ("TestProject1", True, "Build 42"),
+        ("testproject2", True, "Build 42"),
+    ]